@@ -1,174 +1,472 @@
-import os
-import re
-from google import genai
-from dotenv import load_dotenv
-from flask import Flask, request, jsonify, render_template
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from flask import (
+    Flask,
+    Response,
+    request,
+    jsonify,
+    g,
+    render_template,
+    stream_with_context,
+)
 from flask_cors import CORS
-import absl.logging
-from prompts import *
-
-valid_languages = {
-    "python",
-    "javascript",
-    "rust",
-    "mongodb",
-    "swift",
-    "ruby",
-    "dart",
-    "perl",
-    "scala",
-    "julia",
-    "go",
-    "java",
-    "cpp",
-    "csharp",
-    "c",
-    "sql",
-    "typescript",
-    "kotlin",
-    "verilog",
-}
+from prompts import languages_prompts, refactor_chunk_prompt, refactor_code_prompt
+from prompt_engine import PromptBudgetExceeded, token_usage
+from client_pool import pool as client_pool
+from cache import result_cache, uses_randomness
+from singleflight import flight
+from executor import run_locally
+from precheck import precheck
+from streaming import ResultStream, SSE_HEADERS, extract_code, sse_event
+from batch import BATCH_WORKERS, batch_entry, batch_items, item_fields
+from near_duplicate import near_duplicates
+from refactor_session import refactor_sessions
+from chunked_refactor import chunked_refactor
+from routing import model_router
+from resilience import UpstreamError, error_body, resilience
+from metrics import (
+    count_error,
+    errors,
+    metrics_payload,
+    register_stats,
+    request_latency,
+    requests_in_flight,
+)
+from rate_limit import (
+    AdmissionQueue,
+    RateLimited,
+    admission_settings,
+    rate_limiter,
+    request_cost,
+)
+from service import (
+    UNSUPPORTED_LANGUAGE,
+    UNSUPPORTED_RUN_LANGUAGE,
+    cache_key,
+    cacheable,
+    generate_prompt,
+    health_status,
+    page_languages,
+    page_prompt,
+    page_refactor_prompt,
+    page_refactor_request,
+    page_request,
+    refactor_prompt,
+    retry_headers,
+    run_prompt,
+    start,
+    valid_languages,
+)
 
 app = Flask(__name__)
 
 CORS(app)
 
-os.environ["GRPC_VERBOSITY"] = "NONE"
+start()
 
-absl.logging.set_verbosity(absl.logging.ERROR)
+admission_queue = AdmissionQueue(**admission_settings)
 
-try:
-    load_dotenv()
-except Exception as e:
-    print(f"Error loading environment variables: {e}")
+register_stats(
+    result_cache=result_cache,
+    token_usage=token_usage,
+    admission_queue=admission_queue,
+    resilience=resilience,
+    flight=flight,
+)
 
-CODE_REGEX = r"```(?:\w+\n)?(.*?)```"
+batch_executor = ThreadPoolExecutor(
+    max_workers=BATCH_WORKERS, thread_name_prefix="genai-batch"
+)
 
-api_key = os.getenv("GEMINI_API_KEY")
-gemini_model = os.getenv("GEMINI_MODEL")
-gemini_model_1 = os.getenv("GEMINI_MODEL_1")
 
+def call_model(endpoint, contents, route=None):
+    def generate(model):
+        def attempt(config):
+            with client_pool.client() as client:
+                return client.models.generate_content(
+                    model=model,
+                    contents=contents,
+                    config=config,
+                )
 
-def get_generated_code(problem_description, language):
-    try:
-        if language not in valid_languages:
-            return "Error: Unsupported language."
+        response = resilience.call(endpoint, model, attempt)
+        token_usage.record(endpoint, model, contents, response.usage_metadata)
+        return response.text
 
-        client = genai.Client(api_key=api_key)
+    return model_router.call(route or model_router.route(endpoint, contents), generate)
 
-        response = client.models.generate_content(
-            model=gemini_model,
-            contents=generate_code_prompt.format(
-                problem_description=problem_description, language=language
-            ),
+
+def cached_result(endpoint, language, code, use_cache, route, compute):
+    if not use_cache:
+        result_cache.bypass()
+        return compute()
+
+    key = cache_key(endpoint, language, code, route.primary)
+    result = result_cache.get(key)
+    if result is None:
+        result = flight.do(
+            key, lambda: compute_and_store(endpoint, language, code, route, compute)
         )
-        return response.text.strip()
-    except Exception as e:
-        return ""
+    return result
 
 
-def get_output(code, language):
-    try:
-        if language in languages_prompts:
-            prompt = languages_prompts[language].format(code=code)
-        else:
-            return "Error: Language not supported."
+def compute_and_store(endpoint, language, code, route, compute):
+    result = compute()
+    if cacheable(result):
+        result_cache.set(cache_key(endpoint, language, code, route.model), result)
+    return result
 
-        client = genai.Client(api_key=api_key)
 
-        response = client.models.generate_content(
-            model=gemini_model,
-            contents=prompt,
-        )
+def get_generated_code(problem_description, language, use_cache=True):
+    if language not in valid_languages:
+        return f"Error: {UNSUPPORTED_LANGUAGE}"
 
-        return response.text
-    except Exception as e:
-        return f"Error: Unable to process the code. {str(e)}"
+    prompt = generate_prompt(problem_description, language)
+    route = model_router.route("generate_code", prompt)
+
+    def generate():
+        return call_model("generate_code", prompt, route).strip()
+
+    return cached_result(
+        "generate_code", language, problem_description, use_cache, route, generate
+    )
 
 
-def refactor_code(code, language):
+def get_output(code, language, use_cache=True):
     try:
-        if language not in valid_languages:
-            return "Error: Unsupported language."
+        if language not in languages_prompts:
+            return f"Error: {UNSUPPORTED_RUN_LANGUAGE}"
+
+        # A real run needs neither the compacted code nor the prompt.
+        output = run_locally(language, code)
+        if output is not None:
+            return output
+
+        try:
+            prompt = run_prompt(code, language)
+        except PromptBudgetExceeded:
+            # Code too large to send still gets its compiler diagnostic.
+            diagnostic = precheck.check(language, code)
+            if diagnostic is None:
+                raise
+            return diagnostic
+
+        # Programs whose output changes between runs must never be served
+        # from the cache.
+        use_cache = use_cache and not uses_randomness(code)
+
+        def run():
+            # Code that does not compile gets the real diagnostic at once.
+            diagnostic = precheck.check(language, code)
+            if diagnostic is not None:
+                return diagnostic
+            lookup = near_duplicates.find(language, code) if use_cache else None
+            if lookup is not None and lookup.reuse:
+                return lookup.output
+            output = call_model("get-output", prompt, route)
+            if lookup is not None:
+                near_duplicates.add(lookup, output)
+            return output
+
+        route = model_router.route("get-output", prompt)
+        return cached_result("get-output", language, code, use_cache, route, run)
+    except (PromptBudgetExceeded, UpstreamError):
+        raise
+    except Exception as e:
+        return f"Error: Unable to process the code. {str(e)}"
 
-        client = genai.Client(api_key=api_key)
 
-        response = client.models.generate_content(
-            model=gemini_model,
-            contents=refactor_code_prompt.format(code=code, language=language),
-        )
+def refactor_code(code, language, use_cache=True):
+    if language not in valid_languages:
+        return f"Error: {UNSUPPORTED_LANGUAGE}"
 
-        return response.text.strip()
-    except Exception as e:
-        print(f"Error analyzing code: {e}")
-        return ""
+    prompt = refactor_prompt(code, language)
+    route = model_router.route("refactor_code", prompt)
 
+    def refactor():
+        return call_model("refactor_code", prompt, route).strip()
 
-def generate_code_html_css_js(prompt, params):
-    try:
-        formatted_prompt = prompt.format(**params)
+    return cached_result("refactor_code", language, code, use_cache, route, refactor)
 
-        client = genai.Client(api_key=api_key)
 
-        response = client.models.generate_content(
-            model=gemini_model_1,
-            contents=formatted_prompt,
+def refactor_unit(
+    language, use_cache=True, template=refactor_code_prompt, cache_as="refactor_code"
+):
+    # Refactors one block of a session, or one chunk of a large file. Session
+    # blocks share the prompt and cache entry of a whole file with just that
+    # code in it; chunks are told they are part of a file and cached apart.
+    def refactor(code):
+        prompt = refactor_prompt(code, language, template)
+        route = model_router.route("refactor_code", prompt)
+        refactored = cached_result(
+            cache_as,
+            language,
+            code,
+            use_cache,
+            route,
+            lambda: call_model("refactor_code", prompt, route).strip(),
         )
+        extracted = extract_code(refactored, language)
+        return extracted if extracted is not None else refactored
+
+    return refactor
+
+
+def refactor_in_session(session_id, language, code, refactor):
+    plan = refactor_sessions.plan(session_id, language, code)
+    if plan.pending:
+        workers = min(len(plan.pending), refactor_sessions.workers)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            outputs = executor.map(refactor, [block.code for block in plan.pending])
+            for block, output in zip(plan.pending, outputs):
+                block.output = output
+    return refactor_sessions.commit(plan)
+
+
+def refactor_chunked(language, code, use_cache=True):
+    # None when the file is small enough to refactor in one piece.
+    chunks = chunked_refactor.chunks(code, language)
+    if chunks is None:
+        return None
+    refactor = refactor_unit(
+        language, use_cache, refactor_chunk_prompt, "refactor_chunk"
+    )
+    workers = min(len(chunks), chunked_refactor.concurrency)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        outputs = list(executor.map(refactor, chunks))
+    return chunked_refactor.join(language, chunks, outputs)
+
 
-        result = response.text.strip()
-        return result
+def generate_code_html_css_js(prompt, params):
+    try:
+        result = call_model("htmlcssjs-refactor", page_refactor_prompt(prompt, params))
+        return result.strip()
+    except (PromptBudgetExceeded, UpstreamError):
+        raise
     except Exception as e:
         return f"Error: {e}"
 
 
-def generate_html(prompt):
-    formatted_prompt = html_prompt.format(prompt=prompt)
+def generate_page(stage, project_description, html_content="", css_content=""):
+    return extract_code(
+        call_model(
+            "htmlcssjs-generate",
+            page_prompt(stage, project_description, html_content, css_content),
+        ),
+        page_languages[stage],
+    )
 
-    client = genai.Client(api_key=api_key)
 
-    response = client.models.generate_content(
-        model=gemini_model_1,
-        contents=formatted_prompt,
-    )
-    return extract_code(response.text)
+def generate_html_css_js(project_description, parallel=False):
+    html_code = generate_page("html", project_description)
+    yield "html", html_code
+
+    if not parallel:
+        css_code = generate_page("css", project_description, html_code)
+        yield "css", css_code
+        yield "js", generate_page("js", project_description, html_code, css_code)
+        return
+
+    # CSS and JS only need the HTML, so generate them side by side; the JS
+    # prompt then sees no stylesheet, which is fine for DOM-driven scripts.
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        futures = {
+            executor.submit(generate_page, stage, project_description, html_code): stage
+            for stage in ("css", "js")
+        }
+        for future in as_completed(futures):
+            yield futures[future], future.result()
+
+
+def stream_model_text(route, contents):
+    # Streams are routed but not hedged: the first chunk is already on its
+    # way to the client by the time a hedge would fire.
+    endpoint, model = route.endpoint, route.primary
+    usage_metadata = None
+    with client_pool.client() as client:
+
+        def open_stream(config):
+            return client.models.generate_content_stream(
+                model=model, contents=contents, config=config
+            )
 
+        for chunk in resilience.stream(endpoint, model, open_stream):
+            usage_metadata = chunk.usage_metadata or usage_metadata
+            if chunk.text:
+                yield chunk.text
+    token_usage.record(endpoint, model, contents, usage_metadata)
 
-def generate_css(html_content, project_description):
-    formatted_prompt = css_prompt.format(
-        html_content=html_content, project_description=project_description
-    )
 
-    client = genai.Client(api_key=api_key)
+def error_response(e):
+    g.error_type = e.code
+    return jsonify(e.to_dict()), e.status, retry_headers(e)
+
 
-    response = client.models.generate_content(
-        model=gemini_model_1,
-        contents=formatted_prompt,
+def event_stream(events):
+    return Response(
+        stream_with_context(events),
+        mimetype="text/event-stream",
+        headers=SSE_HEADERS,
     )
 
-    return extract_code(response.text)
 
+def stream_result(
+    route, language, code, use_cache, field, contents, extract, check=False
+):
+    # With `check`, code that does not compile gets the precheck diagnostic
+    # instead of a model call, once the cache has missed.
+    def events():
+        stream = ResultStream(field, extract)
+        key = None
+        if use_cache:
+            key = cache_key(route.endpoint, language, code, route.primary)
+            cached = result_cache.get(key)
+            if cached is not None:
+                yield stream.replay(cached)
+                return
+        else:
+            result_cache.bypass()
+
+        diagnostic = precheck.check(language, code) if check else None
+        if diagnostic is not None:
+            if key:
+                result_cache.set(key, diagnostic)
+            yield stream.replay(diagnostic)
+            return
+
+        try:
+            for text in stream_model_text(route, contents):
+                event = stream.feed(text)
+                if event:
+                    yield event
+            done = stream.close()
+        except Exception as e:
+            count_error(e)
+            yield sse_event("error", error_body(e))
+            return
+
+        if key and stream.text:
+            result_cache.set(key, stream.text)
+        yield done
+
+    return event_stream(events())
+
+
+def output_item(item, use_cache):
+    code, language = item_fields(item, languages_prompts, UNSUPPORTED_RUN_LANGUAGE)
+    return {"output": get_output(code, language, use_cache=use_cache)}
+
+
+def refactor_item(item, use_cache):
+    code, language = item_fields(item, valid_languages, UNSUPPORTED_LANGUAGE)
+    return {
+        "code": extract_code(
+            refactor_code(code, language, use_cache=use_cache), language
+        )
+    }
 
-def generate_js(html_content, css_content, project_description):
-    formatted_prompt = js_prompt.format(
-        html_content=html_content,
-        css_content=css_content,
-        project_description=project_description,
-    )
 
-    client = genai.Client(api_key=api_key)
+def run_batch_item(index, item, handler, use_cache):
+    started = time.perf_counter()
+    try:
+        return batch_entry(index, started, handler(item, use_cache))
+    except UpstreamError as e:
+        return batch_entry(index, started, error_body(e), error=str(e))
+    except Exception as e:
+        return batch_entry(index, started, error=str(e))
+
+
+def batch_response(data, handler):
+    items = batch_items(data)
+    use_cache = data.get("cache", True)
+    futures = [
+        batch_executor.submit(run_batch_item, index, item, handler, use_cache)
+        for index, item in enumerate(items)
+    ]
+
+    if not data.get("stream", False):
+        return jsonify({"results": [future.result() for future in futures]})
+
+    def events():
+        results = [None] * len(futures)
+        for future in as_completed(futures):
+            entry = future.result()
+            results[entry["index"]] = entry
+            yield sse_event("result", entry)
+        yield sse_event("done", {"results": results})
+
+    return event_stream(events())
+
+
+@app.before_request
+def start_request_metrics():
+    g.route = request.url_rule.rule if request.url_rule else "unmatched"
+    g.request_started = time.perf_counter()
+    requests_in_flight.labels(g.route).inc()
+
+
+@app.after_request
+def finish_request_metrics(response):
+    started = g.pop("request_started", None)
+    if started is None:
+        return response
+    route, method, status = g.route, request.method, response.status_code
+    if status >= 400:
+        errors.labels(g.pop("error_type", f"http_{status}")).inc()
+
+    def finish():
+        request_latency.labels(route, method, status).observe(
+            time.perf_counter() - started
+        )
+        requests_in_flight.labels(route).dec()
+
+    response.call_on_close(finish)
+    return response
+
+
+@app.teardown_request
+def abort_request_metrics(error=None):
+    # Only reached with the timer still set when an unhandled exception
+    # skipped the after_request hooks.
+    started = g.pop("request_started", None)
+    if started is not None:
+        errors.labels(type(error).__name__ if error else "unhandled").inc()
+        request_latency.labels(g.route, request.method, 500).observe(
+            time.perf_counter() - started
+        )
+        requests_in_flight.labels(g.route).dec()
+
+
+@app.before_request
+def admit_request():
+    if request.method == "OPTIONS" or rate_limiter.group(request.path) is None:
+        return None
+    try:
+        rate_limiter.check(
+            request.path,
+            request.headers,
+            request.remote_addr,
+            request_cost(request.get_json(silent=True)),
+        )
+        g.admitted_at = admission_queue.acquire()
+    except RateLimited as e:
+        return error_response(e)
 
-    response = client.models.generate_content(
-        model=gemini_model_1,
-        contents=formatted_prompt,
-    )
 
-    return extract_code(response.text)
+@app.after_request
+def hold_admission(response):
+    # Streamed responses keep their slot until the last chunk is sent.
+    started = g.pop("admitted_at", None)
+    if started is not None:
+        response.call_on_close(lambda: admission_queue.release(started))
+    return response
 
 
-def extract_code(output):
-    match = re.search(CODE_REGEX, output, re.DOTALL)
-    if match:
-        return match.group(1)
+@app.teardown_request
+def release_admission(error=None):
+    started = g.pop("admitted_at", None)
+    if started is not None:
+        admission_queue.release(started)
 
 
 @app.route("/")
@@ -176,13 +474,29 @@ def index():
     return render_template("index.html")
 
 
+@app.route("/health", methods=["GET"])
+def health():
+    payload, status = health_status(admission_queue)
+    return jsonify(payload), status
+
+
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    payload, content_type = metrics_payload()
+    return Response(payload, content_type=content_type)
+
+
 @app.route("/generate_code", methods=["POST"])
 def generate_code():
     try:
         problem_description = request.json["problem_description"]
         language = request.json["language"]
-        generated_code = get_generated_code(problem_description, language)
-        return jsonify({"code": extract_code(generated_code)})
+        generated_code = get_generated_code(
+            problem_description, language, use_cache=request.json.get("cache", True)
+        )
+        return jsonify({"code": extract_code(generated_code, language)})
+    except UpstreamError as e:
+        return error_response(e)
     except Exception as e:
         return jsonify({"error": str(e)}), 400
 
@@ -192,8 +506,10 @@ def get_output_api():
     try:
         code = request.json["code"]
         language = request.json["language"]
-        output = get_output(code, language)
+        output = get_output(code, language, use_cache=request.json.get("cache", True))
         return jsonify({"output": output})
+    except UpstreamError as e:
+        return error_response(e)
     except Exception as e:
         return jsonify({"error": str(e)}), 400
 
@@ -203,53 +519,155 @@ def refactor_code_api():
     try:
         code = request.json["code"]
         language = request.json["language"]
-        refactored_code = refactor_code(code, language)
-        return jsonify({"code": extract_code(refactored_code)})
+        use_cache = request.json.get("cache", True)
+        if request.json.get("session"):
+            session_id = refactor_sessions.session_id(request.json["session"])
+            if language not in valid_languages:
+                raise ValueError(UNSUPPORTED_LANGUAGE)
+            refactored_code, units = refactor_in_session(
+                session_id, language, code, refactor_unit(language, use_cache)
+            )
+            return jsonify(
+                {"code": refactored_code, "session": session_id, "units": units}
+            )
+        if request.json.get("chunked") and language in valid_languages:
+            chunked = refactor_chunked(language, code, use_cache)
+            if chunked is not None:
+                refactored_code, chunks = chunked
+                return jsonify({"code": refactored_code, "chunks": chunks})
+        refactored_code = refactor_code(code, language, use_cache=use_cache)
+        return jsonify({"code": extract_code(refactored_code, language)})
+    except UpstreamError as e:
+        return error_response(e)
     except Exception as e:
         return jsonify({"error": str(e)}), 400
 
 
-@app.route("/htmlcssjsgenerate-code", methods=["POST"])
-def htmlcssjs_generate():
-    data = request.get_json()
-    project_description = data.get("prompt")
-    code_type = data.get("type")
-    html_content = (
-        data.get("htmlContent", "") if len(data.get("htmlContent", "")) > 0 else ""
-    )
-    css_content = (
-        data.get("cssContent", "") if len(data.get("cssContent", "")) > 0 else ""
-    )
+@app.route("/get-output/batch", methods=["POST"])
+def get_output_batch_api():
+    try:
+        return batch_response(request.get_json(), output_item)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 400
+
+
+@app.route("/refactor_code/batch", methods=["POST"])
+def refactor_code_batch_api():
+    try:
+        return batch_response(request.get_json(), refactor_item)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 400
 
-    if not project_description:
-        return jsonify({"error": "Project description is required"}), 400
-    if not code_type or code_type not in ["html", "css", "js"]:
-        return jsonify({"error": "Invalid or missing 'type' parameter"}), 400
 
+@app.route("/generate_code/stream", methods=["POST"])
+def generate_code_stream_api():
     try:
-        html_code = (
-            generate_html(project_description) if code_type == "html" else html_content
+        problem_description = request.json["problem_description"]
+        language = request.json["language"]
+        if language not in valid_languages:
+            return jsonify({"error": UNSUPPORTED_LANGUAGE}), 400
+
+        prompt = generate_prompt(problem_description, language)
+        return stream_result(
+            model_router.route("generate_code", prompt),
+            language,
+            problem_description,
+            request.json.get("cache", True),
+            "code",
+            prompt,
+            extract=True,
         )
-        css_code = (
-            generate_css(html_code, project_description)
-            if code_type == "css"
-            else css_content
+    except Exception as e:
+        return jsonify({"error": str(e)}), 400
+
+
+@app.route("/get-output/stream", methods=["POST"])
+def get_output_stream_api():
+    try:
+        code = request.json["code"]
+        language = request.json["language"]
+        if language not in languages_prompts:
+            return jsonify({"error": UNSUPPORTED_RUN_LANGUAGE}), 400
+
+        output = run_locally(language, code)
+        if output is None:
+            try:
+                prompt = run_prompt(code, language)
+            except PromptBudgetExceeded:
+                output = precheck.check(language, code)
+                if output is None:
+                    raise
+        if output is not None:
+            return event_stream([ResultStream("output", False).replay(output)])
+
+        return stream_result(
+            model_router.route("get-output", prompt),
+            language,
+            code,
+            request.json.get("cache", True) and not uses_randomness(code),
+            "output",
+            prompt,
+            extract=False,
+            check=True,
         )
-        js_code = (
-            generate_js(html_code, css_code, project_description)
-            if code_type == "js"
-            else ""
+    except Exception as e:
+        return jsonify({"error": str(e)}), 400
+
+
+@app.route("/refactor_code/stream", methods=["POST"])
+def refactor_code_stream_api():
+    try:
+        code = request.json["code"]
+        language = request.json["language"]
+        if language not in valid_languages:
+            return jsonify({"error": UNSUPPORTED_LANGUAGE}), 400
+
+        prompt = refactor_prompt(code, language)
+        return stream_result(
+            model_router.route("refactor_code", prompt),
+            language,
+            code,
+            request.json.get("cache", True),
+            "code",
+            prompt,
+            extract=True,
         )
+    except Exception as e:
+        return jsonify({"error": str(e)}), 400
 
-        if code_type == "html":
-            return jsonify({"html": html_code})
-        elif code_type == "css":
-            return jsonify({"css": css_code})
-        elif code_type == "js":
-            return jsonify({"js": js_code})
-        else:
-            return jsonify({"error": "Invalid code type requested."}), 400
 
+@app.route("/htmlcssjsgenerate-code", methods=["POST"])
+def htmlcssjs_generate():
+    data = request.get_json()
+    try:
+        project_description, code_type, html_content, css_content = page_request(data)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    if code_type == "all":
+        stages = generate_html_css_js(
+            project_description, parallel=bool(data.get("parallel", False))
+        )
+
+        def events():
+            result = {}
+            try:
+                for stage, code in stages:
+                    result[stage] = code
+                    yield sse_event(stage, {stage: code})
+            except Exception as e:
+                count_error(e)
+                yield sse_event("error", error_body(e))
+                return
+            yield sse_event("done", result)
+
+        return event_stream(events())
+
+    try:
+        code = generate_page(code_type, project_description, html_content, css_content)
+        return jsonify({code_type: code})
+    except UpstreamError as e:
+        return error_response(e)
     except ValueError as e:
         return jsonify({"error": str(e)}), 400
     except Exception as e:
@@ -260,87 +678,30 @@ def htmlcssjs_generate():
 def htmlcssjs_refactor():
     try:
         data = request.get_json()
-        html_content = data.get("html") if len(data.get("html", "")) > 0 else ""
-        css_content = data.get("css") if len(data.get("css", "")) > 0 else ""
-        js_content = data.get("js") if len(data.get("js", "")) > 0 else ""
-        code_type = data.get("type")
-
-        if not code_type:
-            return jsonify({"error": "Type is required."}), 400
-
-        def refactor_content(prompt, content):
-            return generate_code_html_css_js(prompt, content)
-
-        if code_type == "html" and html_content:
-            html_content_refactored = refactor_content(
-                refactor_html_prompt, {"html_content": html_content}
-            )
-            html_content_refactored = re.search(
-                CODE_REGEX, html_content_refactored, re.DOTALL
-            )
-            html_content_refactored = (
-                html_content_refactored.group(1)
-                if html_content_refactored
-                else html_content
-            )
-            return jsonify({"html": html_content_refactored})
-
-        elif code_type == "css" and html_content:
-            if not html_content:
-                return (
-                    jsonify({"error": "HTML content is required for CSS refactoring."}),
-                    400,
-                )
-            css_content_refactored = refactor_content(
-                refactor_css_prompt,
-                {"html_content": html_content, "css_content": css_content},
-            )
-            css_content_refactored = re.search(
-                CODE_REGEX, css_content_refactored, re.DOTALL
-            )
-            css_content_refactored = (
-                css_content_refactored.group(1)
-                if css_content_refactored
-                else css_content
-            )
-            return jsonify({"css": css_content_refactored})
-
-        elif code_type == "js" and html_content and css_content:
-            if not html_content or not css_content:
-                return (
-                    jsonify(
-                        {
-                            "error": "Both HTML and CSS content are required for JS refactoring."
-                        }
-                    ),
-                    400,
-                )
-            js_content_refactored = refactor_content(
-                refactor_js_prompt,
-                {
-                    "html_content": html_content,
-                    "css_content": css_content,
-                    "js_content": js_content,
-                },
-            )
-            js_content_refactored = re.search(
-                CODE_REGEX, js_content_refactored, re.DOTALL
-            )
-            js_content_refactored = (
-                js_content_refactored.group(1) if js_content_refactored else js_content
-            )
-            return jsonify({"js": js_content_refactored})
-
-        else:
-            return (
-                jsonify(
-                    {
-                        "error": "Please provide the appropriate content for the requested type."
-                    }
-                ),
-                400,
-            )
+        try:
+            code_type, prompt, params, language = page_refactor_request(data)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        field = f"{code_type}_content"
+
+        def refactor(content):
+            refactored = generate_code_html_css_js(prompt, {**params, field: content})
+            code = extract_code(refactored, language)
+            return code if code is not None else content
+
+        # In a session only the changed units of the field are refactored.
+        if not data.get("session"):
+            return jsonify({code_type: refactor(params[field])})
+        session_id = refactor_sessions.session_id(data["session"])
+        code, units = refactor_in_session(
+            f"{session_id}:{field}", language, params[field], refactor
+        )
+        return jsonify({code_type: code, "session": session_id, "units": units})
 
+    except UpstreamError as e:
+        return error_response(e)
+    except PromptBudgetExceeded as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": f"An error occurred: {str(e)}"}), 500
 
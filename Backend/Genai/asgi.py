@@ -0,0 +1,771 @@
+import asyncio
+import os
+import time
+
+from quart import Quart, Response, g, request, jsonify, render_template
+from quart_cors import cors
+
+from prompts import languages_prompts, refactor_chunk_prompt, refactor_code_prompt
+from prompt_engine import PromptBudgetExceeded, token_usage
+from client_pool import pool as client_pool
+from cache import result_cache, uses_randomness
+from singleflight import flight
+from executor import run_locally, runs_locally
+from precheck import precheck
+from streaming import ResultStream, SSE_HEADERS, extract_code, sse_event
+from batch import BATCH_WORKERS, batch_entry, batch_items, item_fields
+from near_duplicate import near_duplicates
+from refactor_session import refactor_sessions
+from chunked_refactor import chunked_refactor
+from routing import model_router
+from resilience import UpstreamError, error_body, resilience
+from metrics import (
+    count_error,
+    errors,
+    metrics_payload,
+    register_stats,
+    request_latency,
+    requests_in_flight,
+)
+from rate_limit import (
+    AsyncAdmissionQueue,
+    RateLimited,
+    admission_settings,
+    rate_limiter,
+    request_cost,
+)
+from service import (
+    UNSUPPORTED_LANGUAGE,
+    UNSUPPORTED_RUN_LANGUAGE,
+    cache_key,
+    cacheable,
+    generate_prompt,
+    health_status,
+    page_languages,
+    page_prompt,
+    page_refactor_prompt,
+    page_refactor_request,
+    page_request,
+    refactor_prompt,
+    retry_headers,
+    run_prompt,
+    start,
+    valid_languages,
+)
+
+app = cors(Quart(__name__))
+
+batch_slots = asyncio.Semaphore(BATCH_WORKERS)
+admission_queue = AsyncAdmissionQueue(**admission_settings)
+
+register_stats(
+    result_cache=result_cache,
+    token_usage=token_usage,
+    admission_queue=admission_queue,
+    resilience=resilience,
+    flight=flight,
+)
+
+
+async def cache_get(key):
+    # The Redis tier is a blocking client, keep it off the event loop.
+    if result_cache.redis is None:
+        return result_cache.get(key)
+    return await asyncio.to_thread(result_cache.get, key)
+
+
+async def cache_set(key, value):
+    if result_cache.redis is None:
+        result_cache.set(key, value)
+    else:
+        await asyncio.to_thread(result_cache.set, key, value)
+
+
+async def cached_result(endpoint, language, code, use_cache, route, compute):
+    if not use_cache:
+        result_cache.bypass()
+        return await compute()
+
+    key = cache_key(endpoint, language, code, route.primary)
+    result = await cache_get(key)
+    if result is None:
+        result = await flight.do_async(
+            key, lambda: compute_and_store(endpoint, language, code, route, compute)
+        )
+    return result
+
+
+async def compute_and_store(endpoint, language, code, route, compute):
+    result = await compute()
+    if cacheable(result):
+        await cache_set(cache_key(endpoint, language, code, route.model), result)
+    return result
+
+
+async def run_locally_async(language, code):
+    if not runs_locally(language):
+        return None
+    return await asyncio.to_thread(run_locally, language, code)
+
+
+async def generate_text(endpoint, contents, route=None):
+    async def generate(model):
+        response = await resilience.call_async(
+            endpoint,
+            model,
+            lambda config: client_pool.async_client().models.generate_content(
+                model=model, contents=contents, config=config
+            ),
+        )
+        token_usage.record(endpoint, model, contents, response.usage_metadata)
+        return response.text
+
+    return await model_router.call_async(
+        route or model_router.route(endpoint, contents), generate
+    )
+
+
+async def stream_model_text(route, contents):
+    endpoint, model = route.endpoint, route.primary
+    usage_metadata = None
+    stream = resilience.stream_async(
+        endpoint,
+        model,
+        lambda config: client_pool.async_client().models.generate_content_stream(
+            model=model, contents=contents, config=config
+        ),
+    )
+    async for chunk in stream:
+        usage_metadata = chunk.usage_metadata or usage_metadata
+        if chunk.text:
+            yield chunk.text
+    token_usage.record(endpoint, model, contents, usage_metadata)
+
+
+async def get_generated_code(problem_description, language, use_cache=True):
+    if language not in valid_languages:
+        return f"Error: {UNSUPPORTED_LANGUAGE}"
+
+    prompt = generate_prompt(problem_description, language)
+    route = model_router.route("generate_code", prompt)
+
+    async def generate():
+        text = await generate_text("generate_code", prompt, route)
+        return text.strip()
+
+    return await cached_result(
+        "generate_code", language, problem_description, use_cache, route, generate
+    )
+
+
+async def get_output(code, language, use_cache=True):
+    try:
+        if language not in languages_prompts:
+            return f"Error: {UNSUPPORTED_RUN_LANGUAGE}"
+
+        # A real run needs neither the compacted code nor the prompt.
+        output = await run_locally_async(language, code)
+        if output is not None:
+            return output
+
+        try:
+            prompt = run_prompt(code, language)
+        except PromptBudgetExceeded:
+            # Code too large to send still gets its compiler diagnostic.
+            diagnostic = await asyncio.to_thread(precheck.check, language, code)
+            if diagnostic is None:
+                raise
+            return diagnostic
+
+        use_cache = use_cache and not uses_randomness(code)
+
+        async def run():
+            # Code that does not compile gets the real diagnostic at once.
+            diagnostic = await asyncio.to_thread(precheck.check, language, code)
+            if diagnostic is not None:
+                return diagnostic
+            lookup = None
+            if use_cache:
+                lookup = await asyncio.to_thread(near_duplicates.find, language, code)
+            if lookup is not None and lookup.reuse:
+                return lookup.output
+            output = await generate_text("get-output", prompt, route)
+            if lookup is not None:
+                near_duplicates.add(lookup, output)
+            return output
+
+        route = model_router.route("get-output", prompt)
+        return await cached_result("get-output", language, code, use_cache, route, run)
+    except (PromptBudgetExceeded, UpstreamError):
+        raise
+    except Exception as e:
+        return f"Error: Unable to process the code. {str(e)}"
+
+
+async def refactor_code(code, language, use_cache=True):
+    if language not in valid_languages:
+        return f"Error: {UNSUPPORTED_LANGUAGE}"
+
+    prompt = refactor_prompt(code, language)
+    route = model_router.route("refactor_code", prompt)
+
+    async def refactor():
+        text = await generate_text("refactor_code", prompt, route)
+        return text.strip()
+
+    return await cached_result(
+        "refactor_code", language, code, use_cache, route, refactor
+    )
+
+
+def refactor_unit(
+    language, use_cache=True, template=refactor_code_prompt, cache_as="refactor_code"
+):
+    # Refactors one block of a session, or one chunk of a large file. Session
+    # blocks share the prompt and cache entry of a whole file with just that
+    # code in it; chunks are told they are part of a file and cached apart.
+    async def refactor(code):
+        prompt = refactor_prompt(code, language, template)
+        route = model_router.route("refactor_code", prompt)
+
+        async def compute():
+            text = await generate_text("refactor_code", prompt, route)
+            return text.strip()
+
+        refactored = await cached_result(
+            cache_as, language, code, use_cache, route, compute
+        )
+        extracted = extract_code(refactored, language)
+        return extracted if extracted is not None else refactored
+
+    return refactor
+
+
+async def refactor_in_session(session_id, language, code, refactor):
+    plan = refactor_sessions.plan(session_id, language, code)
+    slots = asyncio.Semaphore(refactor_sessions.workers)
+
+    async def refactor_block(block):
+        async with slots:
+            return await refactor(block.code)
+
+    outputs = await asyncio.gather(*(refactor_block(block) for block in plan.pending))
+    for block, output in zip(plan.pending, outputs):
+        block.output = output
+    return refactor_sessions.commit(plan)
+
+
+async def refactor_chunked(language, code, use_cache=True):
+    # None when the file is small enough to refactor in one piece.
+    chunks = chunked_refactor.chunks(code, language)
+    if chunks is None:
+        return None
+    refactor = refactor_unit(
+        language, use_cache, refactor_chunk_prompt, "refactor_chunk"
+    )
+    slots = asyncio.Semaphore(chunked_refactor.concurrency)
+
+    async def refactor_chunk(chunk):
+        async with slots:
+            return await refactor(chunk)
+
+    outputs = await asyncio.gather(*(refactor_chunk(chunk) for chunk in chunks))
+    return chunked_refactor.join(language, chunks, outputs)
+
+
+async def generate_code_html_css_js(prompt, params):
+    try:
+        text = await generate_text(
+            "htmlcssjs-refactor", page_refactor_prompt(prompt, params)
+        )
+        return text.strip()
+    except (PromptBudgetExceeded, UpstreamError):
+        raise
+    except Exception as e:
+        return f"Error: {e}"
+
+
+async def generate_page(stage, project_description, html_content="", css_content=""):
+    text = await generate_text(
+        "htmlcssjs-generate",
+        page_prompt(stage, project_description, html_content, css_content),
+    )
+    return extract_code(text, page_languages[stage])
+
+
+async def generate_html_css_js(project_description, parallel=False):
+    html_code = await generate_page("html", project_description)
+    yield "html", html_code
+
+    if not parallel:
+        css_code = await generate_page("css", project_description, html_code)
+        yield "css", css_code
+        yield "js", await generate_page("js", project_description, html_code, css_code)
+        return
+
+    async def stage(name):
+        return name, await generate_page(name, project_description, html_code)
+
+    tasks = [asyncio.ensure_future(stage(name)) for name in ("css", "js")]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+def error_response(e):
+    g.error_type = e.code
+    return jsonify(e.to_dict()), e.status, retry_headers(e)
+
+
+def event_stream(events):
+    return Response(events, mimetype="text/event-stream", headers=SSE_HEADERS)
+
+
+def stream_result(
+    route, language, code, use_cache, field, contents, extract, check=False
+):
+    # With `check`, code that does not compile gets the precheck diagnostic
+    # instead of a model call, once the cache has missed.
+    async def events():
+        stream = ResultStream(field, extract)
+        key = None
+        if use_cache:
+            key = cache_key(route.endpoint, language, code, route.primary)
+            cached = await cache_get(key)
+            if cached is not None:
+                yield stream.replay(cached)
+                return
+        else:
+            result_cache.bypass()
+
+        diagnostic = None
+        if check:
+            diagnostic = await asyncio.to_thread(precheck.check, language, code)
+        if diagnostic is not None:
+            if key:
+                await cache_set(key, diagnostic)
+            yield stream.replay(diagnostic)
+            return
+
+        try:
+            async for text in stream_model_text(route, contents):
+                event = stream.feed(text)
+                if event:
+                    yield event
+            done = stream.close()
+        except Exception as e:
+            count_error(e)
+            yield sse_event("error", error_body(e))
+            return
+
+        if key and stream.text:
+            await cache_set(key, stream.text)
+        yield done
+
+    return event_stream(events())
+
+
+async def output_item(item, use_cache):
+    code, language = item_fields(item, languages_prompts, UNSUPPORTED_RUN_LANGUAGE)
+    return {"output": await get_output(code, language, use_cache=use_cache)}
+
+
+async def refactor_item(item, use_cache):
+    code, language = item_fields(item, valid_languages, UNSUPPORTED_LANGUAGE)
+    refactored_code = await refactor_code(code, language, use_cache=use_cache)
+    return {"code": extract_code(refactored_code, language)}
+
+
+async def run_batch_item(index, item, handler, use_cache):
+    async with batch_slots:
+        started = time.perf_counter()
+        try:
+            return batch_entry(index, started, await handler(item, use_cache))
+        except UpstreamError as e:
+            return batch_entry(index, started, error_body(e), error=str(e))
+        except Exception as e:
+            return batch_entry(index, started, error=str(e))
+
+
+async def batch_response(data, handler):
+    items = batch_items(data)
+    use_cache = data.get("cache", True)
+    coroutines = [
+        run_batch_item(index, item, handler, use_cache)
+        for index, item in enumerate(items)
+    ]
+
+    if not data.get("stream", False):
+        return jsonify({"results": await asyncio.gather(*coroutines)})
+
+    async def events():
+        results = [None] * len(coroutines)
+        for next_done in asyncio.as_completed(coroutines):
+            entry = await next_done
+            results[entry["index"]] = entry
+            yield sse_event("result", entry)
+        yield sse_event("done", {"results": results})
+
+    return event_stream(events())
+
+
+@app.before_serving
+async def start_background_work():
+    start()
+
+
+@app.after_serving
+async def close_client():
+    await client_pool.aclose()
+
+
+class OnClose:
+    # Response body wrapper that runs a callback once the body, streamed or
+    # not, has been sent.
+    def __init__(self, body, callback):
+        self.body = body
+        self.callback = callback
+
+    async def __aenter__(self):
+        return await self.body.__aenter__()
+
+    async def __aexit__(self, *exc_info):
+        try:
+            return await self.body.__aexit__(*exc_info)
+        finally:
+            self.callback()
+
+
+@app.before_request
+async def start_request_metrics():
+    g.route = request.url_rule.rule if request.url_rule else "unmatched"
+    g.request_started = time.perf_counter()
+    requests_in_flight.labels(g.route).inc()
+
+
+@app.after_request
+async def finish_request_metrics(response):
+    started = g.pop("request_started", None)
+    if started is None:
+        return response
+    route, method, status = g.route, request.method, response.status_code
+    if status >= 400:
+        errors.labels(g.pop("error_type", f"http_{status}")).inc()
+
+    def finish():
+        request_latency.labels(route, method, status).observe(
+            time.perf_counter() - started
+        )
+        requests_in_flight.labels(route).dec()
+
+    response.response = OnClose(response.response, finish)
+    return response
+
+
+@app.teardown_request
+async def abort_request_metrics(error=None):
+    started = g.pop("request_started", None)
+    if started is not None:
+        errors.labels(type(error).__name__ if error else "unhandled").inc()
+        request_latency.labels(g.route, request.method, 500).observe(
+            time.perf_counter() - started
+        )
+        requests_in_flight.labels(g.route).dec()
+
+
+@app.before_request
+async def admit_request():
+    if request.method == "OPTIONS" or rate_limiter.group(request.path) is None:
+        return None
+    try:
+        args = (
+            request.path,
+            request.headers,
+            request.remote_addr,
+            request_cost(await request.get_json(silent=True)),
+        )
+        # The Redis bucket is a blocking client, keep it off the event loop.
+        if rate_limiter.remote:
+            await asyncio.to_thread(rate_limiter.check, *args)
+        else:
+            rate_limiter.check(*args)
+        g.admitted_at = await admission_queue.acquire()
+    except RateLimited as e:
+        return error_response(e)
+
+
+@app.after_request
+async def hold_admission(response):
+    started = g.pop("admitted_at", None)
+    if started is not None:
+        response.response = OnClose(
+            response.response, lambda: admission_queue.release(started)
+        )
+    return response
+
+
+@app.teardown_request
+async def release_admission(error=None):
+    started = g.pop("admitted_at", None)
+    if started is not None:
+        admission_queue.release(started)
+
+
+@app.route("/")
+async def index():
+    return await render_template("index.html")
+
+
+@app.route("/health", methods=["GET"])
+async def health():
+    payload, status = health_status(admission_queue)
+    return jsonify(payload), status
+
+
+@app.route("/metrics", methods=["GET"])
+async def metrics():
+    payload, content_type = metrics_payload()
+    return Response(payload, content_type=content_type)
+
+
+@app.route("/generate_code", methods=["POST"])
+async def generate_code():
+    try:
+        data = await request.get_json()
+        problem_description = data["problem_description"]
+        language = data["language"]
+        generated_code = await get_generated_code(
+            problem_description, language, use_cache=data.get("cache", True)
+        )
+        return jsonify({"code": extract_code(generated_code, language)})
+    except UpstreamError as e:
+        return error_response(e)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 400
+
+
+@app.route("/get-output", methods=["POST"])
+async def get_output_api():
+    try:
+        data = await request.get_json()
+        code = data["code"]
+        language = data["language"]
+        output = await get_output(code, language, use_cache=data.get("cache", True))
+        return jsonify({"output": output})
+    except UpstreamError as e:
+        return error_response(e)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 400
+
+
+@app.route("/refactor_code", methods=["POST"])
+async def refactor_code_api():
+    try:
+        data = await request.get_json()
+        code = data["code"]
+        language = data["language"]
+        use_cache = data.get("cache", True)
+        if data.get("session"):
+            session_id = refactor_sessions.session_id(data["session"])
+            if language not in valid_languages:
+                raise ValueError(UNSUPPORTED_LANGUAGE)
+            refactored_code, units = await refactor_in_session(
+                session_id, language, code, refactor_unit(language, use_cache)
+            )
+            return jsonify(
+                {"code": refactored_code, "session": session_id, "units": units}
+            )
+        if data.get("chunked") and language in valid_languages:
+            chunked = await refactor_chunked(language, code, use_cache)
+            if chunked is not None:
+                refactored_code, chunks = chunked
+                return jsonify({"code": refactored_code, "chunks": chunks})
+        refactored_code = await refactor_code(code, language, use_cache=use_cache)
+        return jsonify({"code": extract_code(refactored_code, language)})
+    except UpstreamError as e:
+        return error_response(e)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 400
+
+
+@app.route("/get-output/batch", methods=["POST"])
+async def get_output_batch_api():
+    try:
+        return await batch_response(await request.get_json(), output_item)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 400
+
+
+@app.route("/refactor_code/batch", methods=["POST"])
+async def refactor_code_batch_api():
+    try:
+        return await batch_response(await request.get_json(), refactor_item)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 400
+
+
+@app.route("/generate_code/stream", methods=["POST"])
+async def generate_code_stream_api():
+    try:
+        data = await request.get_json()
+        problem_description = data["problem_description"]
+        language = data["language"]
+        if language not in valid_languages:
+            return jsonify({"error": UNSUPPORTED_LANGUAGE}), 400
+
+        prompt = generate_prompt(problem_description, language)
+        return stream_result(
+            model_router.route("generate_code", prompt),
+            language,
+            problem_description,
+            data.get("cache", True),
+            "code",
+            prompt,
+            extract=True,
+        )
+    except Exception as e:
+        return jsonify({"error": str(e)}), 400
+
+
+@app.route("/get-output/stream", methods=["POST"])
+async def get_output_stream_api():
+    try:
+        data = await request.get_json()
+        code = data["code"]
+        language = data["language"]
+        if language not in languages_prompts:
+            return jsonify({"error": UNSUPPORTED_RUN_LANGUAGE}), 400
+
+        output = await run_locally_async(language, code)
+        if output is None:
+            try:
+                prompt = run_prompt(code, language)
+            except PromptBudgetExceeded:
+                output = await asyncio.to_thread(precheck.check, language, code)
+                if output is None:
+                    raise
+        if output is not None:
+            return event_stream(ResultStream("output", False).replay(output))
+
+        return stream_result(
+            model_router.route("get-output", prompt),
+            language,
+            code,
+            data.get("cache", True) and not uses_randomness(code),
+            "output",
+            prompt,
+            extract=False,
+            check=True,
+        )
+    except Exception as e:
+        return jsonify({"error": str(e)}), 400
+
+
+@app.route("/refactor_code/stream", methods=["POST"])
+async def refactor_code_stream_api():
+    try:
+        data = await request.get_json()
+        code = data["code"]
+        language = data["language"]
+        if language not in valid_languages:
+            return jsonify({"error": UNSUPPORTED_LANGUAGE}), 400
+
+        prompt = refactor_prompt(code, language)
+        return stream_result(
+            model_router.route("refactor_code", prompt),
+            language,
+            code,
+            data.get("cache", True),
+            "code",
+            prompt,
+            extract=True,
+        )
+    except Exception as e:
+        return jsonify({"error": str(e)}), 400
+
+
+@app.route("/htmlcssjsgenerate-code", methods=["POST"])
+async def htmlcssjs_generate():
+    data = await request.get_json()
+    try:
+        project_description, code_type, html_content, css_content = page_request(data)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    if code_type == "all":
+        stages = generate_html_css_js(
+            project_description, parallel=bool(data.get("parallel", False))
+        )
+
+        async def events():
+            result = {}
+            try:
+                async for stage, code in stages:
+                    result[stage] = code
+                    yield sse_event(stage, {stage: code})
+            except Exception as e:
+                count_error(e)
+                yield sse_event("error", error_body(e))
+                return
+            yield sse_event("done", result)
+
+        return event_stream(events())
+
+    try:
+        code = await generate_page(
+            code_type, project_description, html_content, css_content
+        )
+        return jsonify({code_type: code})
+    except UpstreamError as e:
+        return error_response(e)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": f"An unexpected error occurred: {str(e)}"}), 500
+
+
+@app.route("/htmlcssjsrefactor-code", methods=["POST"])
+async def htmlcssjs_refactor():
+    try:
+        data = await request.get_json()
+        try:
+            code_type, prompt, params, language = page_refactor_request(data)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        field = f"{code_type}_content"
+
+        async def refactor(content):
+            refactored = await generate_code_html_css_js(
+                prompt, {**params, field: content}
+            )
+            code = extract_code(refactored, language)
+            return code if code is not None else content
+
+        # In a session only the changed units of the field are refactored.
+        if not data.get("session"):
+            return jsonify({code_type: await refactor(params[field])})
+        session_id = refactor_sessions.session_id(data["session"])
+        code, units = await refactor_in_session(
+            f"{session_id}:{field}", language, params[field], refactor
+        )
+        return jsonify({code_type: code, "session": session_id, "units": units})
+
+    except UpstreamError as e:
+        return error_response(e)
+    except PromptBudgetExceeded as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": f"An error occurred: {str(e)}"}), 500
+
+
+if __name__ == "__main__":
+    from hypercorn.asyncio import serve
+    from hypercorn.config import Config
+
+    config = Config()
+    config.bind = [os.getenv("GENAI_BIND", "0.0.0.0:5000")]
+    config.keep_alive_timeout = float(os.getenv("GENAI_KEEP_ALIVE", "75"))
+    asyncio.run(serve(app, config))
@@ -0,0 +1,36 @@
+import os
+import time
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+BATCH_WORKERS = int(os.getenv("GENAI_BATCH_WORKERS", "8"))
+BATCH_MAX_ITEMS = int(os.getenv("GENAI_BATCH_MAX_ITEMS", "50"))
+
+
+def batch_items(data):
+    items = data.get("items") if isinstance(data, dict) else None
+    if not isinstance(items, list) or not items:
+        raise ValueError("'items' must be a non-empty list.")
+    if len(items) > BATCH_MAX_ITEMS:
+        raise ValueError(f"A batch can contain at most {BATCH_MAX_ITEMS} items.")
+    return items
+
+
+def item_fields(item, supported_languages, unsupported_message):
+    if not isinstance(item, dict) or "code" not in item or "language" not in item:
+        raise ValueError("Each item needs 'code' and 'language'.")
+    if item["language"] not in supported_languages:
+        raise ValueError(unsupported_message)
+    return item["code"], item["language"]
+
+
+def batch_entry(index, started, payload=None, error=None):
+    entry = {
+        "index": index,
+        "latency_ms": round((time.perf_counter() - started) * 1000, 2),
+        "error": error,
+    }
+    entry.update(payload or {})
+    return entry
@@ -0,0 +1,78 @@
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from streaming import CodeFenceExtractor, extract_code
+
+# What extract_code used before the incremental parser.
+CODE_REGEX = r"```(?:\w+\n)?(.*?)```"
+
+CHUNK_SIZE = 256
+
+
+def html_generation(kilobytes):
+    row = (
+        '    <div class="card" data-id="{i}">\n'
+        '      <h2 class="card-title">Item {i}</h2>\n'
+        "      <p>Generated paragraph number {i} with `inline` markup.</p>\n"
+        "    </div>\n"
+    )
+    rows = []
+    size = 0
+    i = 0
+    while size < kilobytes * 1024:
+        rows.append(row.format(i=i))
+        size += len(rows[-1])
+        i += 1
+    body = "".join(rows)
+    return (
+        "Here is the complete page:\n\n```html\n<!DOCTYPE html>\n<html>\n<body>\n"
+        f"{body}</body>\n</html>\n```\n\nLet me know if you need changes."
+    )
+
+
+def regex_extract(text):
+    match = re.search(CODE_REGEX, text, re.DOTALL)
+    return match.group(1) if match else None
+
+
+def streamed(text):
+    extractor = CodeFenceExtractor()
+    first_code = None
+    started = time.perf_counter()
+    for i in range(0, len(text), CHUNK_SIZE):
+        if extractor.feed(text[i : i + CHUNK_SIZE]) and first_code is None:
+            first_code = time.perf_counter() - started
+    extractor.close()
+    return extractor.result, first_code
+
+
+def measure(fn, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    return (time.perf_counter() - started) / repeat * 1000, result
+
+
+def main(repeat=20):
+    print(
+        f"{'size':>8}{'regex ms':>12}{'parser ms':>12}{'stream ms':>12}"
+        f"{'first code ms':>16}"
+    )
+    for kilobytes in (50, 200, 500, 1000):
+        text = html_generation(kilobytes)
+        regex_ms, expected = measure(lambda: regex_extract(text), repeat)
+        parser_ms, parsed = measure(lambda: extract_code(text), repeat)
+        stream_ms, (streamed_code, first_code) = measure(lambda: streamed(text), repeat)
+        assert parsed == expected == streamed_code
+        print(
+            f"{f'{kilobytes}KB':>8}{regex_ms:>12.3f}{parser_ms:>12.3f}"
+            f"{stream_ms:>12.3f}{first_code * 1000:>16.4f}"
+        )
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20)
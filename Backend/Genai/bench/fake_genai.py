@@ -0,0 +1,162 @@
+import random
+import threading
+import time
+from types import SimpleNamespace
+
+from google.genai import errors
+
+# Fenced snippet the fake model answers with, repeated up to the response size.
+ANSWER_LINE = "    total = total + value * {i}  # step {i}\n"
+
+
+class Latency:
+    # A latency distribution in seconds, written as "kind:args":
+    #   fixed:0.5            always 0.5s
+    #   uniform:0.2,1.5      uniform between 0.2s and 1.5s
+    #   lognormal:0.8,0.5    median 0.8s, sigma 0.5 (a long right tail)
+    #   normal:1.0,0.2       mean 1.0s, stddev 0.2, clipped at 0
+    def __init__(self, spec):
+        kind, _, args = spec.partition(":")
+        self.spec = spec
+        self.kind = kind
+        self.args = [float(arg) for arg in args.split(",") if arg]
+        if kind not in ("fixed", "uniform", "lognormal", "normal"):
+            raise ValueError(f"Unknown latency distribution: {spec}")
+
+    def sample(self, rng):
+        if self.kind == "fixed":
+            return self.args[0]
+        if self.kind == "uniform":
+            return rng.uniform(*self.args)
+        if self.kind == "lognormal":
+            median, sigma = self.args
+            return median * rng.lognormvariate(0, sigma)
+        mean, stddev = self.args
+        return max(0.0, rng.gauss(mean, stddev))
+
+
+class Profile:
+    # How the fake model behaves: time to the first token, time per streamed
+    # chunk, answer size, and the share of calls that fail with a 503 (as
+    # when the model is overloaded) or a 429.
+    def __init__(
+        self,
+        latency="lognormal:0.8,0.5",
+        chunk_latency="fixed:0.02",
+        response_tokens=400,
+        chunk_tokens=40,
+        unavailable_rate=0.0,
+        rate_limited_rate=0.0,
+        model_latency=None,
+        seed=None,
+    ):
+        self.latency = Latency(latency)
+        self.chunk_latency = Latency(chunk_latency)
+        self.response_tokens = response_tokens
+        self.chunk_tokens = chunk_tokens
+        self.unavailable_rate = unavailable_rate
+        self.rate_limited_rate = rate_limited_rate
+        # Optional per-model overrides, e.g. a slower second model.
+        self.model_latency = {
+            model: Latency(spec) for model, spec in (model_latency or {}).items()
+        }
+        self.seed = seed
+
+    def describe(self):
+        return {
+            "latency": self.latency.spec,
+            "chunk_latency": self.chunk_latency.spec,
+            "response_tokens": self.response_tokens,
+            "chunk_tokens": self.chunk_tokens,
+            "unavailable_rate": self.unavailable_rate,
+            "rate_limited_rate": self.rate_limited_rate,
+            "model_latency": {
+                model: latency.spec for model, latency in self.model_latency.items()
+            },
+        }
+
+
+class FakeModels:
+    # Stands in for client.models: same call signatures, no network.
+    def __init__(self, profile):
+        self.profile = profile
+        self._rng = random.Random(profile.seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+
+    def _draw(self, model):
+        profile = self.profile
+        latency = profile.model_latency.get(model, profile.latency)
+        with self._lock:
+            self.calls += 1
+            roll = self._rng.random()
+            return roll, latency.sample(self._rng)
+
+    def _maybe_fail(self, roll):
+        profile = self.profile
+        if roll < profile.unavailable_rate:
+            raise errors.ServerError(
+                503,
+                {
+                    "error": {
+                        "message": "The model is overloaded.",
+                        "status": "UNAVAILABLE",
+                    }
+                },
+            )
+        if roll < profile.unavailable_rate + profile.rate_limited_rate:
+            raise errors.ClientError(
+                429,
+                {
+                    "error": {
+                        "message": "Resource has been exhausted.",
+                        "status": "RESOURCE_EXHAUSTED",
+                    }
+                },
+            )
+
+    def _answer(self, tokens):
+        # About 10 tokens per line of the fenced answer.
+        lines = "".join(ANSWER_LINE.format(i=i) for i in range(max(1, tokens // 10)))
+        return f"```python\ndef answer(values):\n    total = 0\n{lines}```\n"
+
+    def _usage(self, contents, tokens):
+        prompt = len(contents) // 4 if isinstance(contents, str) else 0
+        return SimpleNamespace(prompt_token_count=prompt, candidates_token_count=tokens)
+
+    def generate_content(self, model, contents, config=None):
+        roll, latency = self._draw(model)
+        time.sleep(latency)
+        self._maybe_fail(roll)
+        tokens = self.profile.response_tokens
+        return SimpleNamespace(
+            text=self._answer(tokens), usage_metadata=self._usage(contents, tokens)
+        )
+
+    def generate_content_stream(self, model, contents, config=None):
+        roll, latency = self._draw(model)
+        time.sleep(latency)
+        self._maybe_fail(roll)
+        profile = self.profile
+        text = self._answer(profile.response_tokens)
+        # Characters per chunk, at about 4 characters per token.
+        step = max(1, profile.chunk_tokens * 4)
+        for start in range(0, len(text), step):
+            if start:
+                with self._lock:
+                    delay = profile.chunk_latency.sample(self._rng)
+                time.sleep(delay)
+            last = start + step >= len(text)
+            yield SimpleNamespace(
+                text=text[start : start + step],
+                usage_metadata=(
+                    self._usage(contents, profile.response_tokens) if last else None
+                ),
+            )
+
+
+def install(pool, profile):
+    # Points the client pool at the fake model; returns it for call counts.
+    models = FakeModels(profile)
+    pool.factory = lambda: SimpleNamespace(models=models)
+    return models
@@ -0,0 +1,321 @@
+import argparse
+import json
+import logging
+import os
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+
+import httpx
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+# The app reads its settings at import time. The rate limiter would
+# otherwise turn the load away before it reaches the model, and the health
+# check would try to reach the real API. GENAI_ADMISSION_* still apply.
+os.environ.setdefault("GEMINI_MODEL", "fake-model")
+os.environ.setdefault("GEMINI_MODEL_1", "fake-model-1")
+os.environ.setdefault("GEMINI_HEALTH_CHECK_INTERVAL", "0")
+os.environ.setdefault("GENAI_RATE_LIMIT_ENABLED", "false")
+
+from werkzeug.serving import make_server
+
+from fake_genai import Profile, install
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+
+SAMPLE_CODE = """def fizzbuzz(n):
+    for i in range(1, n + 1):
+        if i % 15 == 0:
+            print("FizzBuzz")
+        elif i % 3 == 0:
+            print("Fizz")
+        elif i % 5 == 0:
+            print("Buzz")
+        else:
+            print(i)
+
+
+fizzbuzz(20)
+"""
+
+# Each scenario posts a fixed body; the result cache is bypassed so every
+# request reaches the model.
+scenarios = {
+    "get-output": (
+        "/get-output",
+        {"code": SAMPLE_CODE, "language": "python", "cache": False},
+    ),
+    "generate_code": (
+        "/generate_code",
+        {
+            "problem_description": "Print the FizzBuzz sequence up to n.",
+            "language": "python",
+            "cache": False,
+        },
+    ),
+    "refactor_code": (
+        "/refactor_code",
+        {"code": SAMPLE_CODE, "language": "python", "cache": False},
+    ),
+    "htmlcssjsgenerate-code": (
+        "/htmlcssjsgenerate-code",
+        {"prompt": "A landing page for a bakery.", "type": "html"},
+    ),
+    "generate_code/stream": (
+        "/generate_code/stream",
+        {
+            "problem_description": "Print the FizzBuzz sequence up to n.",
+            "language": "python",
+            "cache": False,
+        },
+    ),
+}
+
+DEFAULT_SCENARIOS = (
+    "get-output",
+    "generate_code",
+    "refactor_code",
+    "htmlcssjsgenerate-code",
+)
+
+
+def percentile(values, quantile):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(quantile * len(ordered)))]
+
+
+def start_server():
+    import app
+
+    # Per-request access and token usage logs would drown the report.
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+    logging.getLogger("genai.usage").setLevel(logging.WARNING)
+    server = make_server("127.0.0.1", 0, app.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return app, server
+
+
+def send(client, url, body, stream):
+    # Returns (status, seconds to the whole response, seconds to first byte).
+    started = time.perf_counter()
+    if not stream:
+        response = client.post(url, json=body)
+        elapsed = time.perf_counter() - started
+        return response.status_code, elapsed, elapsed
+    first_byte = None
+    with client.stream("POST", url, json=body) as response:
+        failed = False
+        for chunk in response.iter_text():
+            if first_byte is None:
+                first_byte = time.perf_counter() - started
+            failed = failed or "event: error" in chunk
+    elapsed = time.perf_counter() - started
+    status = 599 if failed and response.status_code == 200 else response.status_code
+    return status, elapsed, first_byte or elapsed
+
+
+def worker(base_url, names, deadline, remaining, samples, lock, offset):
+    with httpx.Client(base_url=base_url, timeout=300) as client:
+        i = offset
+        while time.monotonic() < deadline:
+            with lock:
+                if remaining is not None:
+                    if remaining[0] <= 0:
+                        return
+                    remaining[0] -= 1
+            name = names[i % len(names)]
+            i += 1
+            path, body = scenarios[name]
+            try:
+                status, elapsed, first_byte = send(
+                    client, path, body, name.endswith("/stream")
+                )
+            except httpx.HTTPError:
+                status, elapsed, first_byte = 0, 0.0, 0.0
+            with lock:
+                samples.append((name, status, elapsed, first_byte))
+
+
+def summarize(samples, wall_time):
+    def ms(value):
+        return None if value is None else round(value * 1000, 1)
+
+    report = {}
+    for name in sorted({sample[0] for sample in samples}) + ["all"]:
+        rows = [s for s in samples if name in ("all", s[0])]
+        ok = [s[2] for s in rows if 200 <= s[1] < 300]
+        first = [s[3] for s in rows if 200 <= s[1] < 300]
+        statuses = {}
+        for row in rows:
+            statuses[str(row[1])] = statuses.get(str(row[1]), 0) + 1
+        report[name] = {
+            "requests": len(rows),
+            "errors": len(rows) - len(ok),
+            "throughput_rps": round(len(rows) / wall_time, 2),
+            "p50_ms": ms(percentile(ok, 0.5)),
+            "p95_ms": ms(percentile(ok, 0.95)),
+            "p99_ms": ms(percentile(ok, 0.99)),
+            "ttfb_p50_ms": ms(percentile(first, 0.5)),
+            "statuses": statuses,
+        }
+    return report
+
+
+def print_report(report, baseline=None):
+    print(
+        f"{'scenario':<24}{'reqs':>7}{'errors':>8}{'rps':>9}"
+        f"{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+    )
+    for name, row in report.items():
+        print(
+            f"{name:<24}{row['requests']:>7}{row['errors']:>8}"
+            f"{row['throughput_rps']:>9.2f}{row['p50_ms'] or 0:>10.1f}"
+            f"{row['p95_ms'] or 0:>10.1f}{row['p99_ms'] or 0:>10.1f}"
+        )
+        old = (baseline or {}).get(name)
+        if old:
+            print(
+                f"{'  vs baseline':<24}{'':>15}"
+                + "".join(
+                    f"{change(old[key], row[key]):>{width}}"
+                    for key, width in (
+                        ("throughput_rps", 9),
+                        ("p50_ms", 10),
+                        ("p95_ms", 10),
+                        ("p99_ms", 10),
+                    )
+                )
+            )
+
+
+def change(old, new):
+    if not old or new is None:
+        return "-"
+    return f"{(new - old) / old * 100:+.1f}%"
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def save(result):
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    path = os.path.join(RESULTS_DIR, f"{stamp}-{result['commit']}.json")
+    with open(path, "w") as f:
+        json.dump(result, f, indent=2)
+    return path
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(
+        description="Load test the Genai app against a fake model."
+    )
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds")
+    parser.add_argument("--requests", type=int, help="stop after this many")
+    parser.add_argument(
+        "--scenarios",
+        default=",".join(DEFAULT_SCENARIOS),
+        help=f"comma separated, from: {', '.join(scenarios)}",
+    )
+    parser.add_argument("--latency", default="lognormal:0.8,0.5")
+    parser.add_argument("--chunk-latency", default="fixed:0.02")
+    parser.add_argument("--response-tokens", type=int, default=400)
+    parser.add_argument("--unavailable-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limited-rate", type=float, default=0.0)
+    parser.add_argument(
+        "--model-latency",
+        action="append",
+        default=[],
+        metavar="MODEL=SPEC",
+        help="latency for one model, e.g. fake-model-1=fixed:3",
+    )
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--compare", help="earlier result file to compare with")
+    parser.add_argument("--no-save", action="store_true")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    names = [name for name in args.scenarios.split(",") if name]
+    unknown = [name for name in names if name not in scenarios]
+    if unknown:
+        sys.exit(f"Unknown scenarios: {', '.join(unknown)}")
+    profile = Profile(
+        latency=args.latency,
+        chunk_latency=args.chunk_latency,
+        response_tokens=args.response_tokens,
+        unavailable_rate=args.unavailable_rate,
+        rate_limited_rate=args.rate_limited_rate,
+        model_latency=dict(spec.split("=", 1) for spec in args.model_latency),
+        seed=args.seed,
+    )
+
+    app, server = start_server()
+    models = install(app.client_pool, profile)
+    base_url = f"http://127.0.0.1:{server.server_port}"
+
+    samples = []
+    lock = threading.Lock()
+    remaining = [args.requests] if args.requests else None
+    started = time.monotonic()
+    threads = [
+        threading.Thread(
+            target=worker,
+            args=(
+                base_url,
+                names,
+                started + args.duration,
+                remaining,
+                samples,
+                lock,
+                i,
+            ),
+        )
+        for i in range(args.concurrency)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall_time = time.monotonic() - started
+    server.shutdown()
+
+    report = summarize(samples, wall_time)
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["report"]
+    print_report(report, baseline)
+    print(f"model calls: {models.calls}, wall time: {wall_time:.1f}s")
+
+    if not args.no_save:
+        result = {
+            "commit": git_commit(),
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "concurrency": args.concurrency,
+            "duration": round(wall_time, 2),
+            "scenarios": names,
+            "profile": profile.describe(),
+            "report": report,
+        }
+        print(f"saved {save(result)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+import hashlib
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from dotenv import load_dotenv
+from metrics import redis_latency
+from prompts import PROMPT_VERSION
+
+load_dotenv()
+
+RANDOMNESS_REGEX = re.compile(
+    r"\brandom\b|\brand\s*\(|\bsrand\b|Math\.random|\brandn?\b|\buuid|"
+    r"\bshuffle\b|\bRandom\b|\bsecrets\b|\burandom\b|"
+    r"\btime\s*\(|\bDate\.now\b|new\s+Date\b|\bdatetime\b|\bnow\s*\(|"
+    r"\bclock\s*\(|\bSystem\.currentTimeMillis\b|\bnanoTime\b|\$RANDOM"
+)
+
+
+def normalize_code(code):
+    lines = code.replace("\r\n", "\n").replace("\r", "\n").split("\n")
+    normalized = []
+    for line in lines:
+        line = line.rstrip()
+        if line or (normalized and normalized[-1]):
+            normalized.append(line)
+    return "\n".join(normalized).strip("\n")
+
+
+def uses_randomness(code):
+    return RANDOMNESS_REGEX.search(code) is not None
+
+
+class LRUCache:
+    def __init__(self, max_entries=1024, ttl=3600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.monotonic() + (ttl if ttl is not None else self.ttl)
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class ResultCache:
+    def __init__(
+        self,
+        max_entries=1024,
+        ttl=3600,
+        redis_url=None,
+        redis_ttl=86400,
+        prefix="genai:cache:",
+        prompt_version="1",
+    ):
+        self.local = LRUCache(max_entries, ttl)
+        self.redis_ttl = redis_ttl
+        self.prefix = prefix
+        self.prompt_version = prompt_version
+        self.redis = self._connect_redis(redis_url) if redis_url else None
+        self._lock = threading.Lock()
+        self.counters = {
+            "local_hits": 0,
+            "redis_hits": 0,
+            "misses": 0,
+            "sets": 0,
+            "bypassed": 0,
+            "redis_errors": 0,
+        }
+
+    def _connect_redis(self, redis_url):
+        try:
+            import redis
+        except ImportError:
+            print("Error: GENAI_CACHE_REDIS_URL is set but redis is not installed.")
+            return None
+        return redis.Redis.from_url(
+            redis_url, socket_timeout=0.25, socket_connect_timeout=0.25
+        )
+
+    def _count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    def key(self, endpoint, language, model, code):
+        digest = hashlib.sha256(normalize_code(code).encode("utf-8")).hexdigest()
+        return f"{endpoint}:{language}:{model}:{self.prompt_version}:{digest}"
+
+    def bypass(self):
+        self._count("bypassed")
+
+    def get(self, key):
+        value = self.local.get(key)
+        if value is not None:
+            self._count("local_hits")
+            return value
+
+        if self.redis is not None:
+            try:
+                with redis_latency.labels("get").time():
+                    value = self.redis.get(self.prefix + key)
+            except Exception as e:
+                self._count("redis_errors")
+                print(f"Error reading result cache from Redis: {e}")
+                value = None
+            if value is not None:
+                value = value.decode("utf-8")
+                self.local.set(key, value)
+                self._count("redis_hits")
+                return value
+
+        self._count("misses")
+        return None
+
+    def set(self, key, value):
+        self.local.set(key, value)
+        self._count("sets")
+        if self.redis is not None:
+            try:
+                with redis_latency.labels("set").time():
+                    self.redis.set(self.prefix + key, value, ex=self.redis_ttl)
+            except Exception as e:
+                self._count("redis_errors")
+                print(f"Error writing result cache to Redis: {e}")
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counters)
+        lookups = stats["local_hits"] + stats["redis_hits"] + stats["misses"]
+        stats["hit_ratio"] = (
+            (stats["local_hits"] + stats["redis_hits"]) / lookups if lookups else 0.0
+        )
+        stats["local_entries"] = len(self.local)
+        stats["redis_enabled"] = self.redis is not None
+        return stats
+
+
+result_cache = ResultCache(
+    max_entries=int(os.getenv("GENAI_CACHE_MAX_ENTRIES", "2048")),
+    ttl=float(os.getenv("GENAI_CACHE_TTL", "3600")),
+    redis_url=os.getenv("GENAI_CACHE_REDIS_URL"),
+    redis_ttl=int(os.getenv("GENAI_CACHE_REDIS_TTL", "86400")),
+    prompt_version=PROMPT_VERSION,
+)
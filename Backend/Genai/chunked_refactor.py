@@ -0,0 +1,307 @@
+import io
+import os
+import re
+import threading
+import tokenize
+
+from dotenv import load_dotenv
+
+from code_units import group_units, split_units
+from compaction import scan
+from prompt_engine import estimate_tokens
+
+load_dotenv()
+
+# Single-line imports per language. Go's parenthesised import blocks are
+# handled separately.
+IMPORT_PATTERNS = {
+    "python": re.compile(r"(?:from\s+[\w.]+\s+)?import\s+[\w., ]+(?:\s+as\s+\w+)?"),
+    "javascript": re.compile(
+        r"import\s[^;]*?from\s+['\"][^'\"]+['\"];?|import\s+['\"][^'\"]+['\"];?"
+        r"|(?:const|let|var)\s+[\w{}, ]+=\s*require\(['\"][^'\"]+['\"]\);?"
+    ),
+    "c": re.compile(r"#include\s*[<\"][^>\"]+[>\"]"),
+    "csharp": re.compile(r"using\s+(?:static\s+)?[\w.]+\s*;"),
+    "java": re.compile(r"import\s+(?:static\s+)?[\w.*]+\s*;"),
+    "kotlin": re.compile(r"import\s+[\w.*]+(?:\s+as\s+\w+)?"),
+    "scala": re.compile(r"import\s+[\w.{}, =>*_]+"),
+    "dart": re.compile(r"import\s+['\"][^'\"]+['\"][^;]*;"),
+    "rust": re.compile(r"(?:pub\s+)?use\s+[\w:{}, *]+;"),
+    "swift": re.compile(r"import\s+\w+"),
+    "go": re.compile(r"import\s+(?:[\w.]+\s+)?\"[^\"]+\""),
+}
+IMPORT_PATTERNS["typescript"] = IMPORT_PATTERNS["javascript"]
+IMPORT_PATTERNS["mongodb"] = IMPORT_PATTERNS["javascript"]
+IMPORT_PATTERNS["cpp"] = IMPORT_PATTERNS["c"]
+
+GO_IMPORT_BLOCK = re.compile(r"^import\s*\(\n(.*?)^\)[ \t]*\n?", re.M | re.S)
+
+# Names a top-level line defines, for noticing a chunk that renamed one.
+DEFINITIONS = {
+    "python": re.compile(
+        r"^(?:async\s+)?def\s+(\w+)|^class\s+(\w+)|^([A-Za-z_]\w*)\s*(?::[^=\n]+)?=(?!=)",
+        re.M,
+    ),
+}
+GENERIC_DEFINITION = re.compile(
+    r"^(?:export\s+)?(?:default\s+)?(?:pub(?:\([\w ]+\))?\s+)?(?:async\s+)?"
+    r"(?:def|class|function\*?|fn|func|fun|struct|enum|interface|trait|type|object"
+    r"|const|let|var|val)\s+(\w+)"
+    r"|^(?!return\b)[A-Za-z_][\w:<>,*&\[\] ]*[\s*&]([A-Za-z_]\w*)\s*\([^;]*$",
+    re.M,
+)
+
+# An identifier that is not a member access (obj.name).
+IDENTIFIER = re.compile(r"(?<![\w$.])[A-Za-z_$][\w$]*")
+
+
+def top_level_names(code, language):
+    pattern = DEFINITIONS.get(language, GENERIC_DEFINITION)
+    names = []
+    for match in pattern.finditer(code):
+        name = next(group for group in match.groups() if group)
+        if name not in names:
+            names.append(name)
+    return names
+
+
+class ChunkedRefactor:
+    # Refactors a large file as independent chunks of whole top-level units,
+    # at most `concurrency` at a time, then joins them in order. The join is
+    # followed by a consistency pass: imports the chunks added are hoisted
+    # into one deduplicated block at the top, and a top-level name that a
+    # chunk renamed despite the prompt is renamed where other chunks still
+    # use it, in code only, never inside literals or comments.
+    # Inputs under min_tokens, or that do not split, go out in one piece.
+    def __init__(self, min_tokens=3000, chunk_tokens=1500, concurrency=4):
+        self.min_tokens = min_tokens
+        self.chunk_tokens = chunk_tokens
+        self.concurrency = concurrency
+        self._lock = threading.Lock()
+        self.counters = {
+            "requests": 0,
+            "single_shot": 0,
+            "chunks": 0,
+            "renamed": 0,
+            "duplicate_imports": 0,
+        }
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self.counters[name] += amount
+
+    def chunks(self, code, language):
+        # None when the input should be refactored in one piece.
+        self._count("requests")
+        if estimate_tokens(code) < self.min_tokens:
+            self._count("single_shot")
+            return None
+        units = split_units(code, language)
+        ranges = group_units(units, self.chunk_tokens)
+        if len(ranges) < 2:
+            self._count("single_shot")
+            return None
+        self._count("chunks", len(ranges))
+        return ["".join(units[start:end]) for start, end in ranges]
+
+    def join(self, language, originals, outputs):
+        # Returns the reassembled file and a summary of the consistency pass.
+        # A chunk the model returned nothing usable for is kept as it was.
+        outputs = [
+            (
+                output
+                if output and output.strip() not in ("", "Language not supported.")
+                else original
+            )
+            for original, output in zip(originals, outputs)
+        ]
+        outputs, renamed = self._reconcile_names(language, originals, outputs)
+        separator = "\n\n\n" if language == "python" else "\n\n"
+        outputs, duplicates = self._hoist_imports(language, outputs, separator)
+        code = separator.join(
+            output.strip("\n") for output in outputs if output.strip()
+        )
+        self._count("renamed", len(renamed))
+        self._count("duplicate_imports", duplicates)
+        summary = {
+            "chunks": len(originals),
+            "renamed": renamed,
+            "duplicate_imports": duplicates,
+        }
+        return code + "\n", summary
+
+    def _reconcile_names(self, language, originals, outputs):
+        defined = set()
+        for output in outputs:
+            defined.update(top_level_names(output, language))
+        renamed = {}
+        sources = {}
+        for index, (original, output) in enumerate(zip(originals, outputs)):
+            before = top_level_names(original, language)
+            after = top_level_names(output, language)
+            removed = [name for name in before if name not in after]
+            added = [name for name in after if name not in before]
+            # Only an unambiguous one-for-one swap is treated as a rename.
+            if len(removed) == 1 and len(added) == 1:
+                renamed[removed[0]] = added[0]
+                sources[removed[0]] = index
+        renamed = {old: new for old, new in renamed.items() if old not in defined}
+        if not renamed:
+            return outputs, {}
+        spans = [identifier_spans(output, language) for output in outputs]
+        # A rename only matters where another chunk still uses the old name.
+        renamed = {
+            old: new
+            for old, new in renamed.items()
+            if any(
+                index != sources[old]
+                and found is not None
+                and any(name == old for _, _, name in found)
+                for index, found in enumerate(spans)
+            )
+        }
+        if not renamed:
+            return outputs, {}
+        outputs = [
+            _rename(output, found, renamed) if found is not None else output
+            for output, found in zip(outputs, spans)
+        ]
+        return outputs, renamed
+
+    def _hoist_imports(self, language, outputs, separator):
+        pattern = IMPORT_PATTERNS.get(language)
+        if pattern is None:
+            return outputs, 0
+        imports = []
+        stripped = []
+        first = None
+        for index, output in enumerate(outputs):
+            found = []
+            if language == "go":
+                output, found = _go_import_blocks(output)
+            kept = []
+            for line in output.split("\n"):
+                if pattern.fullmatch(line.strip()) and line[:1].strip():
+                    found.append(line.strip())
+                else:
+                    kept.append(line)
+            if found and first is None:
+                first = index
+            imports.extend(found)
+            stripped.append("\n".join(kept))
+        if first is None:
+            return outputs, 0
+
+        unique = list(dict.fromkeys(imports))
+        if language == "python":
+            # __future__ imports must come first.
+            unique.sort(key=lambda line: not line.startswith("from __future__"))
+        if language == "go" and len(unique) > 1:
+            specs = [line[len("import") :].strip() for line in unique]
+            block = "import (\n" + "".join(f"\t{spec}\n" for spec in specs) + ")"
+        else:
+            block = "\n".join(unique)
+        # The block goes where the first chunk with imports had them, after
+        # anything that must stay above (shebang, package, docstring).
+        stripped[first] = _insert_imports(
+            outputs[first], stripped[first], block, separator
+        )
+        return stripped, len(imports) - len(unique)
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counters)
+
+
+def identifier_spans(code, language):
+    # (start, end, name) of the identifiers outside literals and comments, or
+    # None when the code cannot be tokenized.
+    if language == "python":
+        return _python_identifier_spans(code)
+    segments = scan(code, language)
+    if segments is None:
+        return None
+    spans = []
+    offset = 0
+    for kind, text in segments:
+        if kind == "code":
+            for match in IDENTIFIER.finditer(text):
+                spans.append(
+                    (offset + match.start(), offset + match.end(), match.group())
+                )
+        offset += len(text)
+    return spans
+
+
+def _python_identifier_spans(code):
+    starts = [0]
+    for line in code.splitlines(keepends=True):
+        starts.append(starts[-1] + len(line))
+    spans = []
+    previous = None
+    try:
+        for token in tokenize.generate_tokens(io.StringIO(code).readline):
+            if token.type == tokenize.NAME and previous != ".":
+                (row, column), (end_row, end_column) = token.start, token.end
+                spans.append(
+                    (
+                        starts[row - 1] + column,
+                        starts[end_row - 1] + end_column,
+                        token.string,
+                    )
+                )
+            if token.type not in (tokenize.NL, tokenize.COMMENT):
+                previous = token.string
+    except (tokenize.TokenError, SyntaxError):
+        return None
+    return spans
+
+
+def _rename(code, spans, renamed):
+    parts = []
+    last = 0
+    for start, end, name in spans:
+        if name in renamed:
+            parts.append(code[last:start])
+            parts.append(renamed[name])
+            last = end
+    parts.append(code[last:])
+    return "".join(parts)
+
+
+def _go_import_blocks(code):
+    found = []
+
+    def collect(match):
+        for line in match.group(1).split("\n"):
+            line = line.split("//", 1)[0].strip()
+            if line:
+                found.append(f"import {line}")
+        return ""
+
+    return GO_IMPORT_BLOCK.sub(collect, code), found
+
+
+def _insert_imports(original, stripped, block, separator):
+    # Keeps the lines that came before the first import in `original` above
+    # the block, and everything else below it.
+    original_lines = original.split("\n")
+    stripped_lines = stripped.split("\n")
+    head = 0
+    while (
+        head < len(original_lines)
+        and head < len(stripped_lines)
+        and original_lines[head] == stripped_lines[head]
+    ):
+        head += 1
+    above = "\n".join(stripped_lines[:head]).rstrip("\n")
+    below = "\n".join(stripped_lines[head:]).strip("\n")
+    parts = [part for part in (above, block) if part]
+    return "\n\n".join(parts) + (separator + below if below else "")
+
+
+chunked_refactor = ChunkedRefactor(
+    min_tokens=int(os.getenv("GENAI_CHUNK_MIN_TOKENS", "3000")),
+    chunk_tokens=int(os.getenv("GENAI_CHUNK_TOKENS", "1500")),
+    concurrency=int(os.getenv("GENAI_CHUNK_CONCURRENCY", "4")),
+)
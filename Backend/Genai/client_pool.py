@@ -0,0 +1,210 @@
+import atexit
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+
+import httpx
+from dotenv import load_dotenv
+from google import genai
+from google.genai import types
+
+load_dotenv()
+
+
+class PoolExhaustedError(RuntimeError):
+    pass
+
+
+class ClientPool:
+    def __init__(
+        self,
+        api_key,
+        size=8,
+        max_connections=10,
+        keepalive_expiry=60.0,
+        acquire_timeout=10.0,
+        health_check_interval=60.0,
+        health_check_model=None,
+        async_max_connections=200,
+        factory=None,
+        async_factory=None,
+    ):
+        self.api_key = api_key
+        self.size = max(1, size)
+        self.max_connections = max_connections
+        self.keepalive_expiry = keepalive_expiry
+        self.acquire_timeout = acquire_timeout
+        self.health_check_interval = health_check_interval
+        self.health_check_model = health_check_model
+        self.async_max_connections = async_max_connections
+        self.factory = factory or self._new_client
+        self.async_factory = async_factory or (
+            lambda: self._new_client(self.async_max_connections)
+        )
+
+        # LIFO so the most recently used client, whose connections are still
+        # warm, is handed out first.
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._created = 0
+        self._closed = False
+        self._stop = threading.Event()
+        self._health_thread = None
+        self._async_client = None
+        self.last_health_check = None
+        self.last_health_error = None
+
+    def _new_client(self, max_connections=None):
+        max_connections = max_connections or self.max_connections
+        limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_connections,
+            keepalive_expiry=self.keepalive_expiry,
+        )
+        return genai.Client(
+            api_key=self.api_key,
+            http_options=types.HttpOptions(
+                client_args={"limits": limits},
+                async_client_args={"limits": limits},
+            ),
+        )
+
+    def _acquire(self):
+        if self._closed:
+            raise PoolExhaustedError("Gemini client pool is shut down.")
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                try:
+                    return self.factory()
+                except Exception:
+                    self._created -= 1
+                    raise
+
+        try:
+            return self._idle.get(timeout=self.acquire_timeout)
+        except queue.Empty:
+            raise PoolExhaustedError(
+                f"No Gemini client available after {self.acquire_timeout}s."
+            )
+
+    def _release(self, client):
+        if self._closed:
+            self._close_client(client)
+        else:
+            self._idle.put(client)
+
+    def _discard(self, client):
+        with self._lock:
+            self._created -= 1
+        self._close_client(client)
+
+    def _close_client(self, client):
+        try:
+            client.close()
+        except Exception:
+            pass
+
+    @contextmanager
+    def client(self):
+        client = self._acquire()
+        try:
+            yield client
+        except httpx.TransportError:
+            # The connection is in an unknown state; drop the client and let
+            # the next caller build a fresh one.
+            self._discard(client)
+            raise
+        except BaseException:
+            self._release(client)
+            raise
+        else:
+            self._release(client)
+
+    def async_client(self):
+        # A single client serves the whole event loop: its async transport
+        # multiplexes every in-flight request over one connection pool.
+        with self._lock:
+            if self._async_client is None:
+                self._async_client = self.async_factory()
+            return self._async_client.aio
+
+    async def aclose(self):
+        with self._lock:
+            client, self._async_client = self._async_client, None
+        if client is not None:
+            try:
+                await client.aio.aclose()
+            except Exception:
+                pass
+
+    def check_health(self):
+        try:
+            with self.client() as client:
+                if self.health_check_model:
+                    client.models.get(model=self.health_check_model)
+            self.last_health_error = None
+            return True
+        except Exception as e:
+            self.last_health_error = str(e)
+            self._drain()
+            return False
+        finally:
+            self.last_health_check = time.time()
+
+    def _drain(self):
+        while True:
+            try:
+                client = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            self._discard(client)
+
+    def _health_loop(self):
+        while not self._stop.wait(self.health_check_interval):
+            self.check_health()
+
+    def start_health_checks(self):
+        if self.health_check_interval <= 0 or self._health_thread:
+            return
+        self._health_thread = threading.Thread(
+            target=self._health_loop, name="gemini-pool-health", daemon=True
+        )
+        self._health_thread.start()
+
+    def stats(self):
+        return {
+            "size": self.size,
+            "created": self._created,
+            "idle": self._idle.qsize(),
+            "last_health_check": self.last_health_check,
+            "last_health_error": self.last_health_error,
+        }
+
+    def shutdown(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._stop.set()
+        self._drain()
+
+
+pool = ClientPool(
+    api_key=os.getenv("GEMINI_API_KEY"),
+    size=int(os.getenv("GEMINI_POOL_SIZE", "8")),
+    max_connections=int(os.getenv("GEMINI_POOL_MAX_CONNECTIONS", "10")),
+    keepalive_expiry=float(os.getenv("GEMINI_POOL_KEEPALIVE_EXPIRY", "60")),
+    acquire_timeout=float(os.getenv("GEMINI_POOL_TIMEOUT", "10")),
+    health_check_interval=float(os.getenv("GEMINI_HEALTH_CHECK_INTERVAL", "60")),
+    health_check_model=os.getenv("GEMINI_MODEL"),
+    async_max_connections=int(os.getenv("GEMINI_ASYNC_MAX_CONNECTIONS", "200")),
+)
+
+atexit.register(pool.shutdown)
@@ -0,0 +1,220 @@
+import io
+import re
+import tokenize
+
+from compaction import scan
+from prompt_engine import estimate_tokens
+
+# Languages whose top-level units are delimited by braces.
+BRACE_LANGUAGES = {
+    "c",
+    "cpp",
+    "csharp",
+    "css",
+    "dart",
+    "go",
+    "java",
+    "javascript",
+    "kotlin",
+    "mongodb",
+    "rust",
+    "scala",
+    "swift",
+    "typescript",
+}
+
+PYTHON_COMPOUND = {"def", "class", "async", "if", "for", "while", "with", "try", "@"}
+PYTHON_CONTINUATION = {"else", "elif", "except", "finally"}
+
+# A line that carries on the statement before it rather than starting one.
+CONTINUATION = re.compile(
+    r"\s*(?:else\b|catch\b|finally\b|while\b|[)\].,?:]|&&|\|\||\+|-(?!-))"
+)
+NEXT_CONTENT = re.compile(r"[ \t]*\S")
+
+HTML_TAG = re.compile(
+    r"<!--.*?-->|<(script|style)\b.*?</\1\s*>|<(/?)([A-Za-z][\w:-]*)[^>]*?(/?)>",
+    re.S | re.I,
+)
+VOID_ELEMENTS = {
+    "area",
+    "base",
+    "br",
+    "col",
+    "embed",
+    "hr",
+    "img",
+    "input",
+    "link",
+    "meta",
+    "source",
+    "track",
+    "wbr",
+}
+
+
+def split_units(code, language):
+    # Splits a file into top-level units (functions, classes, rules, runs of
+    # simple statements) whose concatenation is the original text. Comments
+    # and blank lines before a unit belong to it. Languages without a
+    # splitter, or code that cannot be scanned, come back as one unit.
+    if language == "python":
+        boundaries = _python_boundaries(code)
+    elif language == "html":
+        boundaries = _html_boundaries(code)
+    elif language in BRACE_LANGUAGES:
+        boundaries = _brace_boundaries(code, language)
+    else:
+        boundaries = None
+    if not boundaries:
+        return [code]
+    units = []
+    start = 0
+    for end, compound in boundaries:
+        if end <= start:
+            continue
+        # Runs of simple statements (imports, constants) stay together.
+        if units and not compound and not units[-1][1]:
+            units[-1] = (units[-1][0] + code[start:end], False)
+        else:
+            units.append((code[start:end], compound))
+        start = end
+    if start < len(code):
+        if units and not code[start:].strip():
+            units[-1] = (units[-1][0] + code[start:], units[-1][1])
+        else:
+            units.append((code[start:], False))
+    return [text for text, _ in units]
+
+
+def _line_offsets(code):
+    offsets = [0]
+    for line in code.splitlines(keepends=True):
+        offsets.append(offsets[-1] + len(line))
+    return offsets
+
+
+def _python_boundaries(code):
+    # Each top-level logical line ends a unit unless the next one continues
+    # it (else, except, ...) or it is a decorator.
+    try:
+        tokens = list(tokenize.generate_tokens(io.StringIO(code).readline))
+    except (tokenize.TokenError, IndentationError, SyntaxError):
+        return None
+    offsets = _line_offsets(code)
+    boundaries = []
+    depth = 0
+    line_start = True
+    last_newline = None
+    compound = decorated = False
+    for token in tokens:
+        if token.type == tokenize.INDENT:
+            depth += 1
+        elif token.type == tokenize.DEDENT:
+            depth -= 1
+        elif token.type == tokenize.NEWLINE:
+            last_newline = token.start[0]
+            line_start = True
+        elif token.type in (tokenize.NL, tokenize.COMMENT, tokenize.ENDMARKER):
+            continue
+        elif line_start:
+            line_start = False
+            if depth or token.string in PYTHON_CONTINUATION:
+                continue
+            if last_newline is not None and not decorated:
+                end = offsets[min(last_newline, len(offsets) - 1)]
+                boundaries.append((end, compound))
+            compound = token.string in PYTHON_COMPOUND
+            decorated = token.string == "@"
+    if last_newline is not None:
+        boundaries.append((len(code), compound))
+    return boundaries
+
+
+def _brace_boundaries(code, language):
+    segments = scan(code, language)
+    if segments is None:
+        return None
+    candidates = []
+    depth = 0
+    offset = 0
+    last = ""
+    opened = False
+    for kind, text in segments:
+        if kind == "literal":
+            last = text[-1:]
+        elif kind == "code":
+            for match in re.finditer(r"[{}\n]|[^\s{}]", text):
+                char = match.group()
+                if char == "{":
+                    opened = opened or depth == 0
+                    depth += 1
+                elif char == "}":
+                    depth = max(0, depth - 1)
+                elif char == "\n":
+                    if depth == 0 and last in ("}", ";"):
+                        candidates.append((offset + match.end(), opened))
+                        opened = False
+                        last = ""
+                    continue
+                last = char
+        elif kind == "block_comment" and "\n" in text and depth == 0:
+            # A statement ending before a comment that spans lines.
+            if last in ("}", ";"):
+                candidates.append((offset, opened))
+                opened = False
+                last = ""
+        offset += len(text)
+    if language == "css":
+        # Selectors like .class and :root are not continuations.
+        return candidates
+    return [
+        (end, compound)
+        for end, compound in candidates
+        if not CONTINUATION.match(code, _next_line(code, end))
+    ]
+
+
+def _next_line(code, offset):
+    # Offset of the next line with content.
+    match = NEXT_CONTENT.search(code, offset)
+    return match.start() if match else len(code)
+
+
+def _html_boundaries(code):
+    # Ends a unit wherever a line ends back at the top level of the body, or
+    # of the fragment when there is no <body>.
+    base = depth = 0
+    boundaries = []
+    for match in HTML_TAG.finditer(code):
+        closing, name, self_closing = match.group(2), match.group(3), match.group(4)
+        if name is not None and name.lower() not in VOID_ELEMENTS and not self_closing:
+            if closing:
+                depth = max(0, depth - 1)
+            else:
+                depth += 1
+                if name.lower() == "body":
+                    base = depth
+        if depth != base:
+            continue
+        newline = code.find("\n", match.end())
+        if newline != -1 and not code[match.end() : newline].strip():
+            boundaries.append((newline + 1, True))
+    return boundaries
+
+
+def group_units(texts, max_tokens):
+    # Packs consecutive units into (start, end) ranges of up to max_tokens;
+    # a unit larger than that gets a range of its own.
+    ranges = []
+    start = 0
+    tokens = 0
+    for i, text in enumerate(texts):
+        size = estimate_tokens(text)
+        if i > start and tokens + size > max_tokens:
+            ranges.append((start, i))
+            start, tokens = i, 0
+        tokens += size
+    if start < len(texts):
+        ranges.append((start, len(texts)))
+    return ranges
@@ -0,0 +1,557 @@
+import io
+import logging
+import math
+import os
+import re
+import threading
+import tokenize
+
+from dotenv import load_dotenv
+
+from prompt_engine import estimate_tokens
+
+load_dotenv()
+
+compaction_logger = logging.getLogger("genai.compaction")
+
+# R"delim( ... )delim", with an optional encoding prefix.
+CPP_RAW_STRING = re.compile(r'(?:u8|[uUL])?R"([^()\\\s]{0,16})\(')
+
+C_FAMILY = {
+    "line_comments": ("//",),
+    "block_comment": ("/*", "*/"),
+    "quotes": ('"',),
+    "char_literals": True,
+}
+
+
+def _start_pattern(syntax):
+    # Everything that can open a comment or literal; the scanner jumps
+    # straight from one of these to the next instead of walking every char.
+    starts = list(syntax.get("line_comments", ()))
+    starts += syntax.get("quotes", ())
+    starts += syntax.get("triple_quotes", ())
+    if syntax.get("block_comment"):
+        starts.append(syntax["block_comment"][0])
+    if syntax.get("verbatim_prefix"):
+        starts.append(syntax["verbatim_prefix"] + '"')
+    if syntax.get("char_literals"):
+        starts.append("'")
+    if syntax.get("regex"):
+        starts.append("/")
+    pattern = "|".join(re.escape(s) for s in sorted(set(starts), key=len))
+    if syntax.get("raw_strings"):
+        pattern += r'|r#*"'
+    if syntax.get("cpp_raw_strings"):
+        pattern += "|" + CPP_RAW_STRING.pattern
+    return re.compile(pattern)
+
+
+def spec(base=C_FAMILY, **overrides):
+    merged = dict(base)
+    merged.update(overrides)
+    merged["start_pattern"] = _start_pattern(merged)
+    return merged
+
+
+# How to recognise comments and string literals in each supported language.
+# Anything not modelled here is left alone rather than guessed at, and so is
+# a source the scanner cannot read unambiguously (see _segments).
+language_syntax = {
+    "c": spec(),
+    "cpp": spec(triple_quotes=(), cpp_raw_strings=True),
+    "csharp": spec(verbatim_prefix="@"),
+    "java": spec(triple_quotes=('"""',)),
+    "javascript": spec(
+        quotes=('"', "'", "`"),
+        char_literals=False,
+        regex=True,
+        interpolation="${",
+        interpolated=("`",),
+    ),
+    "typescript": spec(
+        quotes=('"', "'", "`"),
+        char_literals=False,
+        regex=True,
+        interpolation="${",
+        interpolated=("`",),
+    ),
+    "mongodb": spec(
+        quotes=('"', "'", "`"),
+        char_literals=False,
+        regex=True,
+        interpolation="${",
+        interpolated=("`",),
+    ),
+    "go": spec(
+        quotes=('"', "`"), raw_backticks=True, keep_comments=("//go:", "// +build")
+    ),
+    "rust": spec(nested_blocks=True, raw_strings=True),
+    "swift": spec(
+        nested_blocks=True,
+        triple_quotes=('"""',),
+        char_literals=False,
+        interpolation="\\(",
+    ),
+    "kotlin": spec(nested_blocks=True, triple_quotes=('"""',), interpolation="${"),
+    "scala": spec(nested_blocks=True, triple_quotes=('"""',), interpolation="${"),
+    "dart": spec(
+        nested_blocks=True,
+        quotes=('"', "'"),
+        triple_quotes=('"""', "'''"),
+        char_literals=False,
+        interpolation="${",
+    ),
+    "verilog": spec(),
+    "css": spec(line_comments=(), quotes=('"', "'"), char_literals=False),
+    "sql": spec(line_comments=("--",), quotes=('"', "'"), char_literals=False),
+    "julia": spec(
+        line_comments=("#",),
+        block_comment=("#=", "=#"),
+        nested_blocks=True,
+        triple_quotes=('"""',),
+        interpolation="$(",
+    ),
+    "ruby": spec(
+        line_comments=("#",),
+        block_comment=None,
+        quotes=('"', "'", "`"),
+        char_literals=False,
+        unsupported=re.compile(
+            r"<<[~-]?[\"'A-Za-z_]|%[qQwWiIrsx]?[^\w\s]|=~|^=begin|^__END__|"
+            r"#\{[^}]*[\"']",
+            re.M,
+        ),
+    ),
+    "perl": spec(
+        line_comments=("#",),
+        block_comment=None,
+        quotes=('"', "'", "`"),
+        char_literals=False,
+        unsupported=re.compile(
+            r"<<[~]?[\"'A-Za-z_]|=~|\$#|\bq[qwrx]?\s*[^\w\s]|\b[msy]\s*[/{(|!#]|"
+            r"\btr\s*[/{(]|^=\w|^__(?:END|DATA)__",
+            re.M,
+        ),
+    ),
+}
+
+CHAR_LITERAL = re.compile(r"'(?:\\[^'\n]{1,10}|[^\\'\n])'")
+REGEX_PRECEDERS = set("(,=:[!&|?{};+-*%<>~^")
+REGEX_KEYWORDS = {
+    "return",
+    "typeof",
+    "instanceof",
+    "in",
+    "of",
+    "new",
+    "delete",
+    "void",
+    "throw",
+    "case",
+    "do",
+    "else",
+    "yield",
+    "await",
+}
+HORIZONTAL_SPACE = re.compile(r"[ \t]+")
+
+# Python 3.12+ tokenizes f-strings piecewise instead of as one STRING.
+FSTRING_START = getattr(tokenize, "FSTRING_START", None)
+FSTRING_END = getattr(tokenize, "FSTRING_END", None)
+
+
+class CompactionResult:
+    def __init__(self, code, original):
+        self.code = code
+        self.original_bytes = len(original.encode("utf-8"))
+        self.compacted_bytes = len(code.encode("utf-8"))
+        self.original_tokens = estimate_tokens(original)
+        self.compacted_tokens = estimate_tokens(code)
+
+    @property
+    def saved_bytes(self):
+        return self.original_bytes - self.compacted_bytes
+
+    @property
+    def saved_tokens(self):
+        return self.original_tokens - self.compacted_tokens
+
+
+def _skip_string(code, i, quote, escapes=True, syntax=None):
+    # With `syntax`, interpolations in the literal are skipped as a whole:
+    # quotes inside "${f("x")}" belong to the expression, not the string.
+    n = len(code)
+    j = i + len(quote)
+    interpolation = syntax and syntax.get("interpolation")
+    if interpolation and quote[0] not in syntax.get("interpolated", quote[0]):
+        # Only some quotes interpolate, like JavaScript's backticks.
+        interpolation = None
+    while j < n:
+        if interpolation and code.startswith(interpolation, j):
+            j = _skip_interpolation(code, j + len(interpolation), syntax)
+            if j is None:
+                return None
+            continue
+        if escapes and code[j] == "\\":
+            j += 2
+            continue
+        if code.startswith(quote, j):
+            return j + len(quote)
+        j += 1
+    # Unterminated.
+    return None
+
+
+BRACKETS = {"{": "}", "(": ")"}
+
+
+def _skip_interpolation(code, j, syntax):
+    # From just inside an interpolation to just past the bracket closing it,
+    # stepping over literals nested in the expression.
+    opener = syntax["interpolation"][-1]
+    closer = BRACKETS[opener]
+    quotes = syntax.get("triple_quotes", ()) + syntax.get("quotes", ())
+    depth = 1
+    n = len(code)
+    while j < n:
+        quote = next((q for q in quotes if code.startswith(q, j)), None)
+        if quote:
+            j = _skip_string(code, j, quote, syntax=syntax)
+            if j is None:
+                return None
+            continue
+        if code[j] == "'" and syntax.get("char_literals"):
+            match = CHAR_LITERAL.match(code, j)
+            if match:
+                j = match.end()
+                continue
+        if code[j] == opener:
+            depth += 1
+        elif code[j] == closer:
+            depth -= 1
+            if depth == 0:
+                return j + 1
+        j += 1
+    return None
+
+
+def _skip_block_comment(code, i, opener, closer, nested):
+    depth = 0
+    j = i
+    n = len(code)
+    while j < n:
+        if code.startswith(opener, j):
+            depth += 1
+            j += len(opener)
+            if not nested and depth > 1:
+                depth = 1
+        elif code.startswith(closer, j):
+            depth -= 1
+            j += len(closer)
+            if depth == 0:
+                return j
+        else:
+            j += 1
+    return n
+
+
+def _regex_allowed(code, i):
+    # A slash starts a regex literal unless it follows an operand.
+    j = i - 1
+    while j >= 0 and code[j] in " \t\r\n":
+        j -= 1
+    if j < 0:
+        return True
+    if code[j] in "+-" and j and code[j - 1] == code[j]:
+        # A postfix ++ or -- ends an operand: `a++ / 2` divides.
+        return False
+    if code[j].isalnum() or code[j] in "_$":
+        k = j
+        while k >= 0 and (code[k].isalnum() or code[k] in "_$"):
+            k -= 1
+        return code[k + 1 : j + 1] in REGEX_KEYWORDS
+    return code[j] in REGEX_PRECEDERS
+
+
+def _skip_regex(code, i):
+    j = i + 1
+    in_class = False
+    while j < len(code):
+        c = code[j]
+        if c == "\n":
+            return None
+        if c == "\\":
+            j += 2
+            continue
+        if c == "[":
+            in_class = True
+        elif c == "]":
+            in_class = False
+        elif c == "/" and not in_class:
+            return j + 1
+        j += 1
+    return None
+
+
+def _segments(code, syntax):
+    # Splits the source into "code", "literal", "line_comment" and
+    # "block_comment" pieces that concatenate back to the original, or
+    # returns None when the scan is ambiguous: a literal that never ends, or
+    # a regex with a quote in it, which is more likely a misread division.
+    line_comments = syntax.get("line_comments", ())
+    block = syntax.get("block_comment")
+    quotes = syntax.get("quotes", ())
+    triples = syntax.get("triple_quotes", ())
+    keep = syntax.get("keep_comments", ())
+    interesting = syntax["start_pattern"]
+    segments = []
+    start = 0
+    i = 0
+    n = len(code)
+
+    def flush(kind, end):
+        if end > start:
+            segments.append((kind, code[start:end]))
+
+    while i < n:
+        match = interesting.search(code, i)
+        if match is None:
+            break
+        i = match.start()
+        c = code[i]
+
+        if block and code.startswith(block[0], i):
+            flush("code", i)
+            end = _skip_block_comment(
+                code, i, block[0], block[1], syntax.get("nested_blocks", False)
+            )
+            segments.append(("block_comment", code[i:end]))
+            i = start = end
+            continue
+
+        comment = next((p for p in line_comments if code.startswith(p, i)), None)
+        if comment and not any(code.startswith(k, i) for k in keep):
+            if comment == "#" and i == 0 and code.startswith("#!"):
+                i += 1
+                continue
+            flush("code", i)
+            end = code.find("\n", i)
+            end = n if end == -1 else end
+            segments.append(("line_comment", code[i:end]))
+            i = start = end
+            continue
+
+        literal_end = None
+        # Set for a literal that starts here, even one that never ends.
+        opened = True
+        identifier_before = i and (code[i - 1].isalnum() or code[i - 1] == "_")
+        triple = next((q for q in triples if code.startswith(q, i)), None)
+        cpp_raw = syntax.get("cpp_raw_strings") and CPP_RAW_STRING.match(code, i)
+        rust_raw = (
+            syntax.get("raw_strings") and c == "r" and re.match(r'r(#*)"', code[i:])
+        )
+        if triple:
+            literal_end = _skip_string(code, i, triple, syntax=syntax)
+        elif cpp_raw and not identifier_before:
+            closer = ")" + cpp_raw.group(1) + '"'
+            end = code.find(closer, cpp_raw.end())
+            literal_end = None if end == -1 else end + len(closer)
+        elif rust_raw and not identifier_before:
+            closer = '"' + rust_raw.group(1)
+            end = code.find(closer, i + len(rust_raw.group(0)))
+            literal_end = None if end == -1 else end + len(closer)
+        elif c == syntax.get("verbatim_prefix") and code.startswith('"', i + 1):
+            j = i + 2
+            while j < n:
+                if code.startswith('""', j):
+                    j += 2
+                elif code[j] == '"':
+                    break
+                else:
+                    j += 1
+            literal_end = j + 1 if j < n else None
+        elif c in quotes:
+            raw = c == "`" and syntax.get("raw_backticks", False)
+            literal_end = _skip_string(code, i, c, escapes=not raw, syntax=syntax)
+        else:
+            opened = False
+            if c == "'" and syntax.get("char_literals"):
+                match = CHAR_LITERAL.match(code, i)
+                if match:
+                    literal_end = match.end()
+            elif c == "/" and syntax.get("regex") and _regex_allowed(code, i):
+                literal_end = _skip_regex(code, i)
+                if literal_end is not None and any(
+                    q in code[i:literal_end] for q in "\"'`"
+                ):
+                    return None
+
+        if opened and literal_end is None:
+            return None
+        if literal_end is not None:
+            flush("code", i)
+            segments.append(("literal", code[i:literal_end]))
+            i = start = literal_end
+            continue
+
+        i += 1
+
+    flush("code", n)
+    return segments
+
+
+def _collapse(segments):
+    # Drops comments; comments spanning lines leave their newlines behind so
+    # that line numbers in diagnostics stay correct.
+    merged = []
+    for kind, text in segments:
+        if kind == "line_comment":
+            continue
+        if kind == "block_comment":
+            kind, text = "code", "\n" * text.count("\n") or " "
+        if merged and kind == "code" and merged[-1][0] == "code":
+            merged[-1] = ("code", merged[-1][1] + text)
+        else:
+            merged.append((kind, text))
+
+    out = []
+    at_line_start = True
+    for position, (kind, text) in enumerate(merged):
+        last_segment = position == len(merged) - 1
+        if kind == "literal":
+            out.append(text)
+            at_line_start = False
+            continue
+        lines = text.split("\n")
+        for index, line in enumerate(lines):
+            if index:
+                out.append("\n")
+                at_line_start = True
+            line = HORIZONTAL_SPACE.sub(" ", line)
+            if at_line_start:
+                line = line.lstrip(" ")
+            if index < len(lines) - 1 or last_segment:
+                line = line.rstrip(" ")
+            if line:
+                out.append(line)
+                at_line_start = False
+    return "".join(out).rstrip("\n") + "\n"
+
+
+def _compact_python(code):
+    # Whitespace-sensitive: drop comments and trailing blanks only, and
+    # shrink indentation to one space per level outside string literals.
+    lines = code.splitlines(keepends=False)
+    comments = {}
+    string_lines = set()
+    indents = []
+    fstring_starts = []
+    try:
+        for token in tokenize.generate_tokens(io.StringIO(code).readline):
+            if token.type == tokenize.COMMENT:
+                comments[token.start[0]] = token.start[1]
+            elif token.type == tokenize.STRING and token.start[0] != token.end[0]:
+                string_lines.update(range(token.start[0] + 1, token.end[0] + 1))
+            elif token.type == FSTRING_START:
+                fstring_starts.append(token.start[0])
+            elif token.type == FSTRING_END and fstring_starts:
+                first = fstring_starts.pop()
+                string_lines.update(range(first + 1, token.end[0] + 1))
+            elif token.type == tokenize.INDENT:
+                indents.append(len(token.string))
+    except (tokenize.TokenError, IndentationError, SyntaxError):
+        return code
+
+    unit = 0
+    for width in indents:
+        unit = math.gcd(unit, width)
+
+    out = []
+    for number, line in enumerate(lines, start=1):
+        if number in string_lines:
+            out.append(line)
+            continue
+        if number in comments:
+            line = line[: comments[number]]
+        line = line.rstrip()
+        stripped = line.lstrip(" ")
+        indent = len(line) - len(stripped)
+        if unit > 1 and "\t" not in line[:indent] and indent % unit == 0:
+            line = " " * (indent // unit) + stripped
+        out.append(line)
+    return "\n".join(out).rstrip("\n") + "\n"
+
+
+def scan(code, language):
+    # The source as (kind, text) pieces, see _segments, or None when the
+    # language's comments and literals are not modelled.
+    syntax = language_syntax.get(language)
+    if syntax is None:
+        return None
+    unsupported = syntax.get("unsupported")
+    if unsupported is not None and unsupported.search(code):
+        return None
+    return _segments(code, syntax)
+
+
+def compact(code, language):
+    if language == "python":
+        return CompactionResult(_compact_python(code), code)
+
+    segments = scan(code, language)
+    if segments is None:
+        return CompactionResult(code, code)
+    return CompactionResult(_collapse(segments), code)
+
+
+class CompactionStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.totals = {
+            "requests": 0,
+            "original_bytes": 0,
+            "compacted_bytes": 0,
+            "original_tokens": 0,
+            "compacted_tokens": 0,
+        }
+
+    def record(self, language, result):
+        with self._lock:
+            self.totals["requests"] += 1
+            self.totals["original_bytes"] += result.original_bytes
+            self.totals["compacted_bytes"] += result.compacted_bytes
+            self.totals["original_tokens"] += result.original_tokens
+            self.totals["compacted_tokens"] += result.compacted_tokens
+        compaction_logger.info(
+            "language=%s bytes=%s->%s tokens=%s->%s",
+            language,
+            result.original_bytes,
+            result.compacted_bytes,
+            result.original_tokens,
+            result.compacted_tokens,
+        )
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.totals)
+        stats["saved_bytes"] = stats["original_bytes"] - stats["compacted_bytes"]
+        stats["saved_tokens"] = stats["original_tokens"] - stats["compacted_tokens"]
+        return stats
+
+
+compaction_enabled = os.getenv("GENAI_COMPACT_RUN_INPUT", "true").lower() in (
+    "1",
+    "true",
+    "yes",
+)
+
+compaction_stats = CompactionStats()
+
+
+def compact_for_run(code, language):
+    if not compaction_enabled:
+        return code
+    result = compact(code, language)
+    compaction_stats.record(language, result)
+    return result.code
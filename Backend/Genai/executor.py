@@ -0,0 +1,409 @@
+import atexit
+import os
+import queue
+import re
+import resource
+import shlex
+import shutil
+import signal
+import subprocess
+import tempfile
+import threading
+import time
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Where rustup and cargo keep their toolchains. Runs get their own HOME, so
+# these are passed on explicitly rather than found under it.
+TOOLCHAIN_HOMES = {
+    name: path
+    for name, path in (
+        ("RUSTUP_HOME", os.getenv("RUSTUP_HOME", os.path.expanduser("~/.rustup"))),
+        ("CARGO_HOME", os.getenv("CARGO_HOME", os.path.expanduser("~/.cargo"))),
+    )
+    if os.path.isdir(path)
+}
+
+
+class Toolchain:
+    # A toolchain either reads the program from stdin (`run` contains no
+    # "{source}"), which lets us keep warm pre-spawned interpreters around, or
+    # works on a source file, optionally after a `compile` step. `clean`
+    # matches noise to drop from compiler errors.
+    def __init__(
+        self,
+        run,
+        compile=None,
+        source_name="main",
+        limit_memory=True,
+        env=None,
+        clean=None,
+    ):
+        self.run = run
+        self.compile = compile
+        self.source_name = source_name
+        self.limit_memory = limit_memory
+        self.env = env or {}
+        self.clean = clean
+
+    @property
+    def reads_stdin(self):
+        return self.compile is None and "{source}" not in self.run
+
+    def available(self):
+        commands = [self.run[0]] + ([self.compile[0]] if self.compile else [])
+        return all(shutil.which(command) for command in commands if "{" not in command)
+
+
+toolchains = {
+    "python": Toolchain(["python3", "-I", "-"]),
+    "javascript": Toolchain(
+        ["node", "--max-old-space-size=128", "-"], limit_memory=False
+    ),
+    "ruby": Toolchain(["ruby", "-"]),
+    "perl": Toolchain(["perl", "-"]),
+    "c": Toolchain(
+        ["{workdir}/main"],
+        compile=["gcc", "-O1", "-o", "{workdir}/main", "{source}", "-lm"],
+        source_name="main.c",
+    ),
+    "cpp": Toolchain(
+        ["{workdir}/main"],
+        compile=["g++", "-O1", "-o", "{workdir}/main", "{source}"],
+        source_name="main.cpp",
+    ),
+    "go": Toolchain(
+        ["{workdir}/main"],
+        compile=["go", "build", "-o", "{workdir}/main", "{source}"],
+        source_name="main.go",
+        limit_memory=False,
+        clean=re.compile(r"^# command-line-arguments\n", re.M),
+        env={
+            "GOCACHE": os.path.join(tempfile.gettempdir(), "genai-gocache"),
+            "CGO_ENABLED": "0",
+            "GOTOOLCHAIN": "local",
+            "GOPROXY": "off",
+        },
+    ),
+    "rust": Toolchain(
+        ["{workdir}/main"],
+        compile=["rustc", "-O", "-o", "{workdir}/main", "{source}"],
+        source_name="main.rs",
+    ),
+    "java": Toolchain(
+        ["java", "-Xmx128m", "{source}"], source_name="Main.java", limit_memory=False
+    ),
+    "julia": Toolchain(
+        ["julia", "{source}"], source_name="main.jl", limit_memory=False
+    ),
+}
+
+
+def register_toolchain(language, toolchain):
+    toolchains[language] = toolchain
+
+
+class ExecutionResult:
+    def __init__(self, output, exit_code, timed_out, truncated, duration):
+        self.output = output
+        self.exit_code = exit_code
+        self.timed_out = timed_out
+        self.truncated = truncated
+        self.duration = duration
+
+
+class LocalExecutor:
+    # Runs code under rlimits on CPU time, memory, file size and output.
+    # Those do not keep a program off the network or out of the filesystem,
+    # so user code must run inside sandbox_prefix (e.g. nsjail or bwrap);
+    # see local_execution_enabled below.
+    def __init__(
+        self,
+        cpu_seconds=2,
+        memory_mb=256,
+        wall_seconds=5.0,
+        compile_seconds=15.0,
+        max_output_bytes=64 * 1024,
+        warm_workers=2,
+        sandbox_prefix=None,
+        languages=None,
+    ):
+        self.cpu_seconds = cpu_seconds
+        self.memory_mb = memory_mb
+        self.wall_seconds = wall_seconds
+        self.compile_seconds = compile_seconds
+        self.max_output_bytes = max_output_bytes
+        self.warm_workers = warm_workers
+        self.sandbox_prefix = sandbox_prefix or []
+        self.languages = languages
+        self._available = {}
+        self._warm = {}
+        self._warm_lock = threading.Lock()
+        self._closed = False
+
+    def supports(self, language):
+        if self._closed or language not in toolchains:
+            return False
+        if self.languages is not None and language not in self.languages:
+            return False
+        if language not in self._available:
+            self._available[language] = toolchains[language].available()
+        return self._available[language]
+
+    def _limits(self, toolchain):
+        def apply():
+            os.setsid()
+            resource.setrlimit(
+                resource.RLIMIT_CPU, (self.cpu_seconds, self.cpu_seconds + 1)
+            )
+            resource.setrlimit(resource.RLIMIT_CORE, (0, 0))
+            resource.setrlimit(resource.RLIMIT_FSIZE, (self.max_output_bytes * 16,) * 2)
+            if toolchain.limit_memory:
+                memory = self.memory_mb * 1024 * 1024
+                resource.setrlimit(resource.RLIMIT_AS, (memory, memory))
+
+        return apply
+
+    def _env(self, toolchain, workdir):
+        env = {
+            "PATH": os.environ.get("PATH", "/usr/bin:/bin"),
+            "HOME": workdir,
+            "TMPDIR": workdir,
+            "LANG": "C.UTF-8",
+        }
+        env.update(TOOLCHAIN_HOMES)
+        env.update(toolchain.env)
+        return env
+
+    def _command(self, command, workdir, source):
+        return self.sandbox_prefix + [
+            part.format(workdir=workdir, source=source) for part in command
+        ]
+
+    def _spawn(self, toolchain, command, workdir, source, limited=True):
+        return subprocess.Popen(
+            self._command(command, workdir, source),
+            cwd=workdir,
+            env=self._env(toolchain, workdir),
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            preexec_fn=self._limits(toolchain) if limited else os.setsid,
+        )
+
+    def _collect(self, process, stdin_data, timeout):
+        chunks = []
+        size = [0]
+        truncated = [False]
+
+        def read():
+            while True:
+                chunk = process.stdout.read1(8192)
+                if not chunk:
+                    return
+                if size[0] + len(chunk) > self.max_output_bytes:
+                    chunks.append(chunk[: self.max_output_bytes - size[0]])
+                    truncated[0] = True
+                    self._kill(process)
+                    return
+                chunks.append(chunk)
+                size[0] += len(chunk)
+
+        reader = threading.Thread(target=read, daemon=True)
+        reader.start()
+        try:
+            if stdin_data is not None:
+                process.stdin.write(stdin_data)
+            process.stdin.close()
+        except (BrokenPipeError, OSError):
+            pass
+
+        timed_out = False
+        try:
+            process.wait(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            timed_out = True
+            self._kill(process)
+            process.wait()
+        reader.join(1)
+        output = b"".join(chunks).decode("utf-8", errors="replace")
+        return output, process.returncode, timed_out, truncated[0]
+
+    def _kill(self, process):
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except (ProcessLookupError, PermissionError):
+            pass
+
+    def _spawn_warm(self, language):
+        toolchain = toolchains[language]
+        workdir = tempfile.mkdtemp(prefix=f"genai-{language}-")
+        return self._spawn(toolchain, toolchain.run, workdir, None), workdir
+
+    def _warm_pool(self, language):
+        with self._warm_lock:
+            if language not in self._warm:
+                self._warm[language] = queue.Queue()
+                for _ in range(self.warm_workers):
+                    self._warm[language].put(self._spawn_warm(language))
+            return self._warm[language]
+
+    def _refill(self, language, pool):
+        if not self._closed:
+            pool.put(self._spawn_warm(language))
+
+    def _take_warm(self, language):
+        pool = self._warm_pool(language)
+        try:
+            worker = pool.get_nowait()
+        except queue.Empty:
+            return self._spawn_warm(language)
+        threading.Thread(
+            target=self._refill, args=(language, pool), daemon=True
+        ).start()
+        return worker
+
+    def prewarm(self):
+        for language, toolchain in toolchains.items():
+            if toolchain.reads_stdin and self.warm_workers and self.supports(language):
+                self._warm_pool(language)
+
+    def run(self, language, code):
+        # None when the toolchain failed for reasons that say nothing about
+        # the code: a compile that timed out, or one whose errors do not
+        # point at the source (a broken install, a missing runtime).
+        toolchain = toolchains[language]
+        started = time.perf_counter()
+
+        if toolchain.reads_stdin and self.warm_workers:
+            process, workdir = self._take_warm(language)
+            try:
+                output, exit_code, timed_out, truncated = self._collect(
+                    process, code.encode("utf-8"), self.wall_seconds
+                )
+            finally:
+                shutil.rmtree(workdir, ignore_errors=True)
+            return self._result(output, exit_code, timed_out, truncated, started)
+
+        workdir = tempfile.mkdtemp(prefix=f"genai-{language}-")
+        try:
+            source = os.path.join(workdir, toolchain.source_name)
+            with open(source, "w", encoding="utf-8") as f:
+                f.write(code)
+
+            if toolchain.compile:
+                process = self._spawn(
+                    toolchain, toolchain.compile, workdir, source, limited=False
+                )
+                output, exit_code, timed_out, truncated = self._collect(
+                    process, None, self.compile_seconds
+                )
+                if timed_out:
+                    return None
+                if exit_code != 0:
+                    output = _relative_paths(output, workdir, toolchain.source_name)
+                    if toolchain.clean is not None:
+                        output = toolchain.clean.sub("", output)
+                    if toolchain.source_name not in output:
+                        return None
+                    return self._result(
+                        output, exit_code, timed_out, truncated, started
+                    )
+
+            process = self._spawn(toolchain, toolchain.run, workdir, source)
+            output, exit_code, timed_out, truncated = self._collect(
+                process, None, self.wall_seconds
+            )
+            output = _relative_paths(output, workdir, toolchain.source_name)
+            return self._result(output, exit_code, timed_out, truncated, started)
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    def _result(self, output, exit_code, timed_out, truncated, started):
+        if truncated:
+            output += "\n... (output truncated)"
+        if timed_out:
+            output += f"\nError: Execution timed out after {self.wall_seconds}s."
+        elif exit_code == -signal.SIGXCPU:
+            output += f"\nError: CPU time limit of {self.cpu_seconds}s exceeded."
+        elif exit_code is not None and exit_code < 0:
+            output += f"\nError: Process killed by signal {-exit_code}."
+        return ExecutionResult(
+            output, exit_code, timed_out, truncated, time.perf_counter() - started
+        )
+
+    def shutdown(self):
+        self._closed = True
+        with self._warm_lock:
+            pools = list(self._warm.values())
+            self._warm.clear()
+        for pool in pools:
+            while True:
+                try:
+                    process, workdir = pool.get_nowait()
+                except queue.Empty:
+                    break
+                self._kill(process)
+                process.wait()
+                shutil.rmtree(workdir, ignore_errors=True)
+
+
+local_executor = LocalExecutor(
+    cpu_seconds=int(os.getenv("LOCAL_EXECUTOR_CPU_SECONDS", "2")),
+    memory_mb=int(os.getenv("LOCAL_EXECUTOR_MEMORY_MB", "256")),
+    wall_seconds=float(os.getenv("LOCAL_EXECUTOR_WALL_SECONDS", "5")),
+    compile_seconds=float(os.getenv("LOCAL_EXECUTOR_COMPILE_SECONDS", "15")),
+    max_output_bytes=int(os.getenv("LOCAL_EXECUTOR_MAX_OUTPUT_BYTES", "65536")),
+    warm_workers=int(os.getenv("LOCAL_EXECUTOR_WARM_WORKERS", "2")),
+    sandbox_prefix=shlex.split(os.getenv("LOCAL_EXECUTOR_SANDBOX", "")),
+    languages=(
+        set(os.getenv("LOCAL_EXECUTOR_LANGUAGES").split(","))
+        if os.getenv("LOCAL_EXECUTOR_LANGUAGES")
+        else None
+    ),
+)
+
+
+def _enabled(name, default):
+    return os.getenv(name, default).lower() in ("1", "true", "yes")
+
+
+local_execution_enabled = _enabled("LOCAL_EXECUTOR_ENABLED", "false")
+
+if (
+    local_execution_enabled
+    and not local_executor.sandbox_prefix
+    and not _enabled("LOCAL_EXECUTOR_ALLOW_UNSANDBOXED", "false")
+):
+    print(
+        "LOCAL_EXECUTOR_ENABLED is set without LOCAL_EXECUTOR_SANDBOX; local "
+        "execution stays off. Set LOCAL_EXECUTOR_ALLOW_UNSANDBOXED=true to run "
+        "user code with resource limits only."
+    )
+    local_execution_enabled = False
+
+
+def _relative_paths(output, workdir, source_name):
+    # Paths are reported relative to the temporary directory.
+    return output.replace(workdir + os.sep, "").replace("./" + source_name, source_name)
+
+
+def runs_locally(language):
+    return local_execution_enabled and local_executor.supports(language)
+
+
+def run_locally(language, code):
+    # The program's real output, or None when the model has to answer.
+    if not runs_locally(language):
+        return None
+    try:
+        result = local_executor.run(language, code)
+    except Exception as e:
+        print(f"Error running code locally, falling back to the model: {e}")
+        return None
+    return None if result is None else result.output
+
+
+atexit.register(local_executor.shutdown)
@@ -0,0 +1,170 @@
+import asyncio
+import time
+from contextlib import contextmanager
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+)
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+# Model calls take seconds, so the default buckets (which top out at 10s)
+# would put most of them in +Inf.
+LLM_BUCKETS = (0.25, 0.5, 1, 2, 4, 8, 15, 30, 60, 120)
+REDIS_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25)
+
+request_latency = Histogram(
+    "genai_request_duration_seconds",
+    "Time to serve a request, until the last byte for streamed responses.",
+    ["route", "method", "status"],
+    buckets=LLM_BUCKETS,
+)
+requests_in_flight = Gauge(
+    "genai_requests_in_flight", "Requests currently being served.", ["route"]
+)
+errors = Counter("genai_errors_total", "Failed requests by error type.", ["type"])
+llm_latency = Histogram(
+    "genai_llm_call_duration_seconds",
+    "Latency of calls to the model, by endpoint, model and outcome.",
+    ["endpoint", "model", "outcome"],
+    buckets=LLM_BUCKETS,
+)
+redis_latency = Histogram(
+    "genai_redis_command_duration_seconds",
+    "Latency of Redis commands issued by the cache and the rate limiter.",
+    ["command"],
+    buckets=REDIS_BUCKETS,
+)
+
+
+def error_type(error):
+    if isinstance(error, asyncio.CancelledError):
+        return "cancelled"
+    if isinstance(error, GeneratorExit):
+        return "abandoned"
+    code = getattr(error, "code", None)
+    return code if isinstance(code, str) else type(error).__name__
+
+
+def count_error(error):
+    errors.labels(error_type(error)).inc()
+
+
+@contextmanager
+def timed_llm_call(endpoint, model):
+    started = time.perf_counter()
+    outcome = "ok"
+    try:
+        yield
+    except BaseException as e:
+        outcome = error_type(e)
+        raise
+    finally:
+        llm_latency.labels(endpoint, str(model), outcome).observe(
+            time.perf_counter() - started
+        )
+
+
+class StatsCollector:
+    # Exposes counters the service already keeps (cache, token usage,
+    # admission, circuits) at scrape time, so they cost nothing per request.
+    def __init__(self, result_cache, token_usage, admission_queue, resilience, flight):
+        self.result_cache = result_cache
+        self.token_usage = token_usage
+        self.admission_queue = admission_queue
+        self.resilience = resilience
+        self.flight = flight
+
+    def collect(self):
+        cache = self.result_cache.stats()
+        lookups = CounterMetricFamily(
+            "genai_cache_lookups", "Result cache lookups by outcome.", labels=["result"]
+        )
+        for result in ("local_hits", "redis_hits", "misses", "bypassed"):
+            lookups.add_metric([result], cache[result])
+        yield lookups
+        yield GaugeMetricFamily(
+            "genai_cache_hit_ratio",
+            "Share of cache lookups served from either tier.",
+            value=cache["hit_ratio"],
+        )
+        yield CounterMetricFamily(
+            "genai_cache_redis_errors",
+            "Result cache Redis errors.",
+            value=cache["redis_errors"],
+        )
+
+        tokens = CounterMetricFamily(
+            "genai_llm_tokens",
+            "Tokens sent to and received from the model.",
+            labels=["endpoint", "model", "kind"],
+        )
+        calls = CounterMetricFamily(
+            "genai_llm_requests",
+            "Completed model calls.",
+            labels=["endpoint", "model"],
+        )
+        for key, usage in self.token_usage.stats().items():
+            endpoint, model = key.split(":", 1)
+            tokens.add_metric([endpoint, model, "prompt"], usage["prompt_tokens"])
+            tokens.add_metric([endpoint, model, "response"], usage["response_tokens"])
+            calls.add_metric([endpoint, model], usage["requests"])
+        yield tokens
+        yield calls
+
+        admission = self.admission_queue.stats()
+        yield GaugeMetricFamily(
+            "genai_admission_active",
+            "Requests holding an admission slot.",
+            value=admission["active"],
+        )
+        yield GaugeMetricFamily(
+            "genai_admission_waiting",
+            "Requests waiting for an admission slot.",
+            value=admission["waiting"],
+        )
+        turned_away = CounterMetricFamily(
+            "genai_admission_rejected",
+            "Requests turned away by the admission queue.",
+            labels=["reason"],
+        )
+        turned_away.add_metric(["queue_full"], admission["rejected"])
+        turned_away.add_metric(["queue_timeout"], admission["timed_out"])
+        yield turned_away
+
+        circuits = GaugeMetricFamily(
+            "genai_circuit_open",
+            "1 while the circuit breaker for a model is open or half open.",
+            labels=["model"],
+        )
+        for model, breaker in self.resilience.stats()["circuits"].items():
+            circuits.add_metric([model], 0 if breaker["state"] == "closed" else 1)
+        yield circuits
+
+        yield CounterMetricFamily(
+            "genai_singleflight_shared",
+            "Requests that shared an identical in-flight model call.",
+            value=self.flight.stats()["shared"],
+        )
+
+
+_stats_collector = None
+
+
+def register_stats(**sources):
+    # Importing app.py and asgi.py in one process registers twice; the last
+    # sources win.
+    global _stats_collector
+    if _stats_collector is None:
+        _stats_collector = StatsCollector(**sources)
+        REGISTRY.register(_stats_collector)
+    else:
+        vars(_stats_collector).update(sources)
+
+
+def metrics_payload():
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
@@ -0,0 +1,385 @@
+import hashlib
+import logging
+import os
+import random
+import re
+import threading
+import time
+from collections import OrderedDict, deque
+
+from dotenv import load_dotenv
+
+from compaction import compact
+
+load_dotenv()
+
+audit_logger = logging.getLogger("genai.near_duplicate")
+
+TOKEN_REGEX = re.compile(
+    r'"(?:\\.|[^"\\\n])*"|\'(?:\\.|[^\'\\\n])*\'|`[^`]*`'
+    r"|[A-Za-z_$@][\w$]*|\d[\w.]*|\S"
+)
+IDENTIFIER_REGEX = re.compile(r"[A-Za-z_$@][\w$]*")
+
+# Words after which a variable is being declared, across the languages
+# get-output runs. Only locals and parameters the snippet binds are renamed:
+# `sqrt` and `floor` must stay different even though both are identifiers.
+DECLARATIONS = {
+    "auto",
+    "bool",
+    "boolean",
+    "char",
+    "const",
+    "double",
+    "float",
+    "for",
+    "int",
+    "let",
+    "local",
+    "long",
+    "my",
+    "mut",
+    "our",
+    "short",
+    "string",
+    "String",
+    "val",
+    "var",
+}
+
+# Words that introduce a function whose parameter names count as bound.
+FUNCTIONS = {"def", "fn", "func", "function", "fun", "sub"}
+
+# Words that name a function or type. Those names are never renamed: they
+# show up in output, from `<__main__.Point object>` to stack traces.
+NAMED = FUNCTIONS | {
+    "class",
+    "enum",
+    "interface",
+    "module",
+    "object",
+    "record",
+    "struct",
+    "trait",
+    "type",
+}
+
+# 2**61 - 1, a Mersenne prime larger than any 60-bit shingle hash.
+PRIME = (1 << 61) - 1
+
+
+def tokens(code, language):
+    # Comments and blank lines never change what a program prints, so the
+    # compacted form is what gets compared.
+    return TOKEN_REGEX.findall(compact(code, language).code)
+
+
+def canonical_tokens(tokens):
+    # Renames every name the snippet binds to its order of first binding, so
+    # code that differs only by a consistent rename compares equal. Returns
+    # the tokens and the renames made, {name: canonical name}.
+    bound = set()
+    named = set()
+    for i, token in enumerate(tokens):
+        if not IDENTIFIER_REGEX.fullmatch(token) or token in DECLARATIONS:
+            continue
+        after = tokens[i + 1 : i + 3]
+        before = tokens[i - 1] if i else ""
+        assigned = (
+            after[:1] == ["="]
+            and after[1:2] != ["="]
+            # Not keyword arguments (`end=""`) or attributes (`self.x = 1`).
+            and before not in ("=", "!", "<", ">", ".", "(", ",")
+        )
+        # `int square(` declares a function in the C family, and
+        # `square = function (` or `= lambda` names one.
+        if (
+            before in NAMED
+            or (before in DECLARATIONS and after[:1] == ["("])
+            or (assigned and after[1:2] and after[1] in NAMED | {"lambda"})
+        ):
+            named.add(token)
+        elif assigned or before in DECLARATIONS:
+            bound.add(token)
+        if before in FUNCTIONS and after[:1] == ["("]:
+            bound.update(parameters(tokens, i + 1))
+    bound -= named
+
+    names = {}
+    canonical = []
+    for i, token in enumerate(tokens):
+        if token in bound and (not i or tokens[i - 1] != "."):
+            token = names.setdefault(token, f"v{len(names)}")
+        canonical.append(token)
+    return canonical, names
+
+
+def parameters(tokens, start):
+    # Names at the head of each parameter: `(a, b: int = 1)` binds a and b.
+    depth = 0
+    for i in range(start, len(tokens)):
+        token = tokens[i]
+        if token in "([{":
+            depth += 1
+        elif token in ")]}":
+            depth -= 1
+            if not depth:
+                return
+        elif (
+            depth == 1
+            and tokens[i - 1] in ("(", ",")
+            and IDENTIFIER_REGEX.fullmatch(token)
+        ):
+            yield token
+
+
+def shingles(tokens, size):
+    if len(tokens) <= size:
+        tokens = tokens or [""]
+        return {_hash(" ".join(tokens))}
+    return {
+        _hash(" ".join(tokens[i : i + size])) for i in range(len(tokens) - size + 1)
+    }
+
+
+def _hash(text):
+    digest = hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big") >> 4
+
+
+class MinHasher:
+    def __init__(self, num_perm=64, seed=1):
+        rng = random.Random(seed)
+        self.num_perm = num_perm
+        self.params = [
+            (rng.randrange(1, PRIME), rng.randrange(0, PRIME)) for _ in range(num_perm)
+        ]
+
+    def signature(self, hashes):
+        return tuple(min((a * x + b) % PRIME for x in hashes) for a, b in self.params)
+
+
+class Entry:
+    # `mentioned` holds the renamed names the output quotes, as a traceback
+    # quoting `print(total / 0)` does; see NearDuplicateIndex.find.
+    __slots__ = ("language", "signature", "digest", "output", "band_keys", "mentioned")
+
+    def __init__(self, language, signature, digest, output, band_keys, mentioned):
+        self.language = language
+        self.signature = signature
+        self.digest = digest
+        self.output = output
+        self.band_keys = band_keys
+        self.mentioned = mentioned
+
+
+class Lookup:
+    # The result of looking a snippet up: its signature (reused when the
+    # fresh answer is indexed) and the closest earlier snippet, if any.
+    def __init__(self, language, signature, digest, band_keys, names):
+        self.language = language
+        self.signature = signature
+        self.digest = digest
+        self.band_keys = band_keys
+        self.names = names
+        self.match = None
+        self.similarity = 0.0
+        self.reuse = False
+
+    @property
+    def output(self):
+        return self.match.output if self.match else None
+
+
+class NearDuplicateIndex:
+    # MinHash signatures of token shingles, bucketed by LSH band per
+    # language, for snippets whose output is already known. In "reuse" mode
+    # a snippet at least `threshold` similar to an indexed one gets its
+    # output without a model call; in "verify" mode the model is still
+    # called and the stored output is only compared against the fresh one,
+    # to tune the threshold before trusting it. Every decision is logged.
+    # Similarity is 1.0 only when the canonical token streams are equal.
+    # An output that quotes a renamed variable is never reused for a snippet
+    # that calls it something else: the answer would name the wrong one.
+    def __init__(
+        self,
+        mode="verify",
+        threshold=1.0,
+        max_entries=5000,
+        max_chars=20000,
+        shingle_size=4,
+        bands=16,
+        rows=4,
+        audit_size=100,
+    ):
+        self.mode = mode
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.max_chars = max_chars
+        self.shingle_size = shingle_size
+        self.bands = bands
+        self.rows = rows
+        self.hasher = MinHasher(bands * rows)
+        self._entries = OrderedDict()
+        self._buckets = {}
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self.recent = deque(maxlen=audit_size)
+        self.counters = {
+            "lookups": 0,
+            "candidates": 0,
+            "reused": 0,
+            "refused_renamed": 0,
+            "verified_same": 0,
+            "verified_different": 0,
+            "evicted": 0,
+        }
+
+    @property
+    def enabled(self):
+        return self.mode in ("reuse", "verify") and self.max_entries > 0
+
+    def _band_keys(self, language, signature):
+        rows = self.rows
+        return [
+            hash((language, band, signature[band * rows : (band + 1) * rows]))
+            for band in range(self.bands)
+        ]
+
+    def _similarity(self, lookup, entry):
+        if lookup.digest == entry.digest:
+            return 1.0
+        same = sum(a == b for a, b in zip(lookup.signature, entry.signature))
+        return min(same, self.hasher.num_perm - 1) / self.hasher.num_perm
+
+    def _audit(self, decision, lookup, **fields):
+        record = {
+            "at": time.time(),
+            "decision": decision,
+            "language": lookup.language,
+            "similarity": round(lookup.similarity, 3),
+            **fields,
+        }
+        self.recent.append(record)
+        audit_logger.info(
+            "decision=%s language=%s similarity=%.3f threshold=%s %s",
+            decision,
+            lookup.language,
+            lookup.similarity,
+            self.threshold,
+            " ".join(f"{key}={value}" for key, value in fields.items()),
+        )
+
+    def find(self, language, code):
+        if not self.enabled or len(code) > self.max_chars:
+            return None
+        canonical, names = canonical_tokens(tokens(code, language))
+        signature = self.hasher.signature(shingles(canonical, self.shingle_size))
+        digest = hashlib.sha256("\0".join(canonical).encode("utf-8")).hexdigest()
+        lookup = Lookup(
+            language, signature, digest, self._band_keys(language, signature), names
+        )
+
+        with self._lock:
+            self.counters["lookups"] += 1
+            candidates = set()
+            for key in lookup.band_keys:
+                candidates.update(self._buckets.get(key, ()))
+            best = None
+            for entry_id in candidates:
+                entry = self._entries[entry_id]
+                if entry.language != language:
+                    continue
+                similarity = self._similarity(lookup, entry)
+                if similarity > lookup.similarity:
+                    best, lookup.similarity, lookup.match = entry_id, similarity, entry
+            if best is None:
+                return lookup
+            self.counters["candidates"] += 1
+            refused = None
+            if self.mode == "reuse" and lookup.similarity >= self.threshold:
+                refused = sorted(
+                    name
+                    for name, canonical in lookup.match.mentioned.items()
+                    if names.get(name) != canonical
+                )
+                if refused:
+                    self.counters["refused_renamed"] += 1
+                else:
+                    lookup.reuse = True
+                    self.counters["reused"] += 1
+                    self._entries.move_to_end(best)
+        if lookup.reuse:
+            self._audit("reused", lookup)
+        elif refused:
+            self._audit("refused", lookup, renamed=",".join(refused))
+        return lookup
+
+    def add(self, lookup, output):
+        # Indexes a freshly computed output, first checking it against the
+        # near duplicate that was found but not reused.
+        if lookup.match is not None and not lookup.reuse:
+            same = lookup.match.output == output
+            with self._lock:
+                self.counters["verified_same" if same else "verified_different"] += 1
+            self._audit(
+                "verified",
+                lookup,
+                same_output=same,
+                would_reuse=lookup.similarity >= self.threshold,
+            )
+        if not output or output.startswith("Error:") or len(output) > self.max_chars:
+            return
+
+        words = set(IDENTIFIER_REGEX.findall(output))
+        entry = Entry(
+            lookup.language,
+            lookup.signature,
+            lookup.digest,
+            output,
+            lookup.band_keys,
+            {
+                name: canonical
+                for name, canonical in lookup.names.items()
+                if name in words
+            },
+        )
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = entry
+            for key in entry.band_keys:
+                self._buckets.setdefault(key, set()).add(entry_id)
+            while len(self._entries) > self.max_entries:
+                self._evict()
+
+    def _evict(self):
+        entry_id, entry = self._entries.popitem(last=False)
+        for key in entry.band_keys:
+            bucket = self._buckets.get(key)
+            if bucket is not None:
+                bucket.discard(entry_id)
+                if not bucket:
+                    del self._buckets[key]
+        self.counters["evicted"] += 1
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counters)
+            stats.update(
+                mode=self.mode,
+                threshold=self.threshold,
+                entries=len(self._entries),
+                max_entries=self.max_entries,
+                buckets=len(self._buckets),
+            )
+        stats["recent"] = list(self.recent)[-10:]
+        return stats
+
+
+near_duplicates = NearDuplicateIndex(
+    mode=os.getenv("GENAI_NEAR_DUP_MODE", "verify").lower(),
+    threshold=float(os.getenv("GENAI_NEAR_DUP_THRESHOLD", "1.0")),
+    max_entries=int(os.getenv("GENAI_NEAR_DUP_MAX_ENTRIES", "5000")),
+    max_chars=int(os.getenv("GENAI_NEAR_DUP_MAX_CHARS", "20000")),
+)
@@ -0,0 +1,265 @@
+import os
+import re
+import resource
+import shlex
+import shutil
+import signal
+import subprocess
+import tempfile
+import threading
+import traceback
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Header names a C program may include: system headers only, so that the
+# compiler never opens, and quotes back, an arbitrary file from this host.
+SAFE_INCLUDE = re.compile(r"#[ \t]*include[ \t]*<(?!/)(?!.*\.\.)[\w.+/-]+>")
+C_FILE_WORDS = re.compile(r"\b(?:include|include_next|embed|import|dependency)\b")
+RUST_FILE_MACROS = re.compile(r"\binclude(?:_str|_bytes)?\b|#\s*!?\s*\[\s*path\b")
+LINE_CONTINUATION = re.compile(r"\\[ \t]*\r?\n")
+# Stack frames and version banners node prints after a syntax error.
+NODE_NOISE = re.compile(r"^(?:    at .*|Node\.js v[\d.]+)\n?", re.M)
+
+
+def reads_only_system_headers(code):
+    # Every preprocessor word that can open a file must be a plain
+    # `#include <header>`; anything else (quoted or absolute paths, macros,
+    # #embed, comments inside the directive) is left to the model.
+    code = LINE_CONTINUATION.sub("", code)
+    allowed = {
+        match.start() + match.group().index("include")
+        for match in SAFE_INCLUDE.finditer(code)
+    }
+    return all(match.start() in allowed for match in C_FILE_WORDS.finditer(code))
+
+
+def reads_no_files(code):
+    return not RUST_FILE_MACROS.search(code)
+
+
+class Checker:
+    # A syntax-only run of a local toolchain over a source file. `safe`
+    # decides whether the code may be handed to it at all, and diagnostics
+    # matching `ignore` are not errors the real run would report.
+    def __init__(
+        self, command, source_name, safe=None, ignore=None, clean=None, env=None
+    ):
+        self.command = command
+        self.source_name = source_name
+        self.safe = safe
+        self.ignore = ignore
+        self.clean = clean
+        self.env = env or {}
+
+    def available(self):
+        return shutil.which(self.command[0]) is not None
+
+
+checkers = {
+    "javascript": Checker(
+        ["node", "--check", "{source}"],
+        "main.js",
+        # `node -` runs CommonJS, but ES module syntax is left to the model.
+        ignore=re.compile(r"outside a module|Cannot use import"),
+        clean=NODE_NOISE,
+    ),
+    "c": Checker(
+        ["gcc", "-fsyntax-only", "-x", "c", "{source}"],
+        "main.c",
+        safe=reads_only_system_headers,
+    ),
+    "cpp": Checker(
+        ["g++", "-fsyntax-only", "-x", "c++", "{source}"],
+        "main.cpp",
+        safe=reads_only_system_headers,
+    ),
+    # Parse only: type errors and unused imports are left to the real run,
+    # and gofmt needs no module cache or build environment.
+    "go": Checker(["gofmt", "-e", "-l", "{source}"], "main.go"),
+    "ruby": Checker(["ruby", "-c", "{source}"], "main.rb"),
+    "rust": Checker(
+        ["rustc", "--emit=metadata", "-o", "{workdir}/main.rmeta", "{source}"],
+        "main.rs",
+        safe=reads_no_files,
+    ),
+    "java": Checker(
+        ["javac", "-proc:none", "-d", "{workdir}", "{source}"],
+        "Main.java",
+        # `java Main.java` accepts any public class name; javac does not.
+        ignore=re.compile(r"should be declared in a file named"),
+    ),
+    # No perl: `perl -c` still runs BEGIN blocks and `use` statements.
+}
+
+
+class PreCheck:
+    # Answers get-output for code that does not compile with the real
+    # diagnostic, without a model call. Python is parsed in process with
+    # compile(); languages in `checkers` use their toolchain's syntax-only
+    # mode when it is installed. check() returns None whenever the code is
+    # valid, the language has no checker, or the checker could not give a
+    # clear answer, and the request carries on as before.
+    def __init__(
+        self,
+        enabled=True,
+        timeout=10.0,
+        max_chars=100000,
+        max_output_bytes=16 * 1024,
+        sandbox_prefix=None,
+        languages=None,
+    ):
+        self.enabled = enabled
+        self.timeout = timeout
+        self.max_chars = max_chars
+        self.max_output_bytes = max_output_bytes
+        self.sandbox_prefix = sandbox_prefix or []
+        self.languages = languages
+        self._available = {}
+        self._lock = threading.Lock()
+        self.counters = {
+            "checked": 0,
+            "rejected": 0,
+            "passed": 0,
+            "skipped": 0,
+            "timed_out": 0,
+        }
+
+    def _count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    def supports(self, language):
+        if not self.enabled:
+            return False
+        if self.languages is not None and language not in self.languages:
+            return False
+        if language == "python":
+            return True
+        if language not in checkers:
+            return False
+        if language not in self._available:
+            self._available[language] = checkers[language].available()
+        return self._available[language]
+
+    def check(self, language, code):
+        if not self.supports(language) or len(code) > self.max_chars:
+            return None
+        if language == "python":
+            diagnostic = self._compile_python(code)
+        else:
+            diagnostic = self._run_checker(checkers[language], code)
+        if diagnostic is False:
+            self._count("skipped")
+            return None
+        self._count("checked")
+        self._count("rejected" if diagnostic else "passed")
+        return diagnostic
+
+    def _compile_python(self, code):
+        # Formatted the way `python3 -` reports it, as the local executor does.
+        try:
+            compile(code, "<stdin>", "exec", dont_inherit=True)
+        except SyntaxError as e:
+            return "".join(traceback.format_exception_only(type(e), e)).rstrip()
+        except (ValueError, RecursionError, MemoryError):
+            return False
+        return None
+
+    def _run_checker(self, checker, code):
+        # None for valid code, the diagnostic for invalid code, and False when
+        # the checker was not run or gave no usable answer.
+        if checker.safe is not None and not checker.safe(code):
+            return False
+        workdir = tempfile.mkdtemp(prefix="genai-precheck-")
+        try:
+            source = os.path.join(workdir, checker.source_name)
+            with open(source, "w", encoding="utf-8") as f:
+                f.write(code)
+            command = self.sandbox_prefix + [
+                part.format(workdir=workdir, source=source) for part in checker.command
+            ]
+            env = {
+                "PATH": os.environ.get("PATH", "/usr/bin:/bin"),
+                "HOME": workdir,
+                "TMPDIR": workdir,
+                "LANG": "C.UTF-8",
+                **checker.env,
+            }
+            process = subprocess.Popen(
+                command,
+                cwd=workdir,
+                env=env,
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                preexec_fn=self._limits,
+            )
+            try:
+                output, _ = process.communicate(timeout=self.timeout)
+            except subprocess.TimeoutExpired:
+                self._kill(process)
+                process.communicate()
+                self._count("timed_out")
+                return False
+        except OSError:
+            return False
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+        if process.returncode == 0:
+            return None
+        if process.returncode < 0:
+            return False
+        output = output[: self.max_output_bytes].decode("utf-8", errors="replace")
+        # Paths are reported relative to the temporary directory.
+        output = output.replace(workdir + os.sep, "").replace(
+            "./" + checker.source_name, checker.source_name
+        )
+        if checker.clean is not None:
+            output = checker.clean.sub("", output)
+        output = output.strip()
+        # A toolchain that fails without pointing at the source (a broken
+        # install, a missing runtime) says nothing about the code.
+        if checker.source_name not in output:
+            return False
+        if checker.ignore and checker.ignore.search(output):
+            return False
+        return output
+
+    def _limits(self):
+        os.setsid()
+        cpu = max(1, int(self.timeout))
+        resource.setrlimit(resource.RLIMIT_CPU, (cpu, cpu + 1))
+        resource.setrlimit(resource.RLIMIT_CORE, (0, 0))
+
+    def _kill(self, process):
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except (ProcessLookupError, PermissionError):
+            pass
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counters)
+        stats["enabled"] = self.enabled
+        stats["languages"] = ["python"] + sorted(
+            language for language, available in self._available.items() if available
+        )
+        return stats
+
+
+precheck = PreCheck(
+    enabled=os.getenv("GENAI_PRECHECK_ENABLED", "true").lower() in ("1", "true", "yes"),
+    timeout=float(os.getenv("GENAI_PRECHECK_TIMEOUT", "10")),
+    max_chars=int(os.getenv("GENAI_PRECHECK_MAX_CHARS", "100000")),
+    sandbox_prefix=shlex.split(
+        os.getenv("GENAI_PRECHECK_SANDBOX", os.getenv("LOCAL_EXECUTOR_SANDBOX", ""))
+    ),
+    languages=(
+        set(os.getenv("GENAI_PRECHECK_LANGUAGES").split(","))
+        if os.getenv("GENAI_PRECHECK_LANGUAGES")
+        else None
+    ),
+)
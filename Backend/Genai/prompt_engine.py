@@ -0,0 +1,152 @@
+import logging
+import math
+import os
+import re
+import threading
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+usage_logger = logging.getLogger("genai.usage")
+
+FIELD_REGEX = re.compile(r"\{(\w+)\}")
+
+# Gemini averages roughly four characters per token for English and code;
+# good enough to budget before sending without a count_tokens round trip.
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text):
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+class PromptBudgetExceeded(ValueError):
+    pass
+
+
+class PromptTemplate:
+    # Splits the template once into literal parts and field names, so
+    # rendering is a single join instead of re-parsing with str.format.
+    def __init__(self, template, **constants):
+        if constants:
+            template = FIELD_REGEX.sub(
+                lambda m: str(constants.get(m.group(1), m.group(0))), template
+            )
+        self.template = template
+        self.parts = FIELD_REGEX.split(template)
+        self.fields = set(self.parts[1::2])
+        self.static_tokens = estimate_tokens("".join(self.parts[0::2]))
+
+    def format(self, **values):
+        parts = list(self.parts)
+        for i in range(1, len(parts), 2):
+            parts[i] = str(values[parts[i]])
+        return "".join(parts)
+
+    def estimate(self, **values):
+        return self.static_tokens + sum(
+            estimate_tokens(str(values[field])) for field in self.fields
+        )
+
+
+def truncate_to_tokens(text, tokens):
+    limit = max(0, tokens * CHARS_PER_TOKEN)
+    if len(text) <= limit:
+        return text
+    cut = text.rfind("\n", 0, limit)
+    kept = text[: cut if cut > 0 else limit]
+    dropped = text[len(kept) :].count("\n") + 1
+    return f"{kept}\n... [{dropped} lines truncated to fit the input budget] ..."
+
+
+class PromptBudget:
+    def __init__(self, budgets, default_budget, policy="truncate", policies=None):
+        self.budgets = budgets
+        self.default_budget = default_budget
+        self.policy = policy
+        self.policies = policies or {}
+
+    def limit(self, endpoint):
+        return self.budgets.get(endpoint, self.default_budget)
+
+    def render(self, endpoint, template, **values):
+        limit = self.limit(endpoint)
+        estimate = template.estimate(**values)
+        if estimate <= limit:
+            return template.format(**values)
+
+        if self.policies.get(endpoint, self.policy) != "truncate":
+            raise PromptBudgetExceeded(
+                f"Input is too large: about {estimate} tokens, the limit for "
+                f"{endpoint} is {limit}."
+            )
+
+        # Shrink the largest input; it is almost always the user's code.
+        field = max(template.fields, key=lambda name: len(str(values[name])))
+        others = estimate - estimate_tokens(str(values[field]))
+        if others >= limit:
+            raise PromptBudgetExceeded(
+                f"Input is too large: about {estimate} tokens, the limit for "
+                f"{endpoint} is {limit}."
+            )
+        values = dict(values)
+        values[field] = truncate_to_tokens(str(values[field]), limit - others)
+        return template.format(**values)
+
+
+class TokenUsage:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.totals = {}
+
+    def record(self, endpoint, model, prompt, usage_metadata):
+        prompt_tokens = getattr(usage_metadata, "prompt_token_count", None)
+        response_tokens = getattr(usage_metadata, "candidates_token_count", None)
+        estimated = estimate_tokens(prompt) if isinstance(prompt, str) else None
+        with self._lock:
+            totals = self.totals.setdefault(
+                f"{endpoint}:{model}",
+                {"requests": 0, "prompt_tokens": 0, "response_tokens": 0},
+            )
+            totals["requests"] += 1
+            totals["prompt_tokens"] += prompt_tokens or estimated or 0
+            totals["response_tokens"] += response_tokens or 0
+        usage_logger.info(
+            "endpoint=%s model=%s prompt_tokens=%s response_tokens=%s "
+            "estimated_prompt_tokens=%s",
+            endpoint,
+            model,
+            prompt_tokens,
+            response_tokens,
+            estimated,
+        )
+        return prompt_tokens, response_tokens
+
+    def stats(self):
+        with self._lock:
+            return {key: dict(value) for key, value in self.totals.items()}
+
+
+prompt_budget = PromptBudget(
+    budgets={
+        "get-output": int(os.getenv("GENAI_BUDGET_GET_OUTPUT", "8000")),
+        "generate_code": int(os.getenv("GENAI_BUDGET_GENERATE_CODE", "2000")),
+        "refactor_code": int(os.getenv("GENAI_BUDGET_REFACTOR_CODE", "16000")),
+        "htmlcssjs-generate": int(os.getenv("GENAI_BUDGET_HTMLCSSJS", "32000")),
+        "htmlcssjs-refactor": int(os.getenv("GENAI_BUDGET_HTMLCSSJS", "32000")),
+    },
+    default_budget=int(os.getenv("GENAI_BUDGET_DEFAULT", "16000")),
+    policy=os.getenv("GENAI_BUDGET_POLICY", "truncate"),
+    # Truncated code is a different program: its output would be wrong, and
+    # a refactor of it replaces the whole file with half of one. Only
+    # generate_code descriptions are cut to fit.
+    policies={
+        "get-output": "reject",
+        "refactor_code": "reject",
+        "htmlcssjs-generate": "reject",
+        "htmlcssjs-refactor": "reject",
+    },
+)
+
+token_usage = TokenUsage()
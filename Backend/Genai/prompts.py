@@ -1,500 +1,184 @@
+from prompt_engine import PromptTemplate
+
+# Bump whenever a template below changes so cached results are invalidated.
+PROMPT_VERSION = "2"
+
+RUN_PROMPT_SKELETON = """
+Analyze the following {name} {subject}:
+
+```
+{code}
+```
+
+{focus}
+**If the snippet is a comment, then do not execute the commented snippet.**
+
+If errors are found:
+- Syntax errors: Provide the most probable error message a {name} {tool} would report{syntax_example}.
+- {failure} errors: Provide a clear description (e.g., {runtime_examples}).
+- Only provide the error message, not the code or explanations.{extra_checks}
+- Review the code repeatedly to ensure it is error-free before proceeding with the output.
+
+If the {subject} is {confidence} error-free:
+{success_rules}
+
+If the {subject} is not valid {name}:
+- Output: "Language not supported."
+"""
+
+CODE_FOCUS = "Carefully examine the provided code line-by-line and character-by-character. Focus on errors such as syntax or runtime issues."
+
+PROGRAM_RULES = """- If there's an infinite loop, show the first 20 iterations followed by "..."
+- If the code uses randomness, show the output with different values for each run.
+- Otherwise, show the full output."""
+
+QUERY_RULES = """- If the query would return results, show a sample output (if possible).
+- Otherwise, indicate if the query would run successfully without returning results."""
+
+language_specs = {
+    "python": {
+        "name": "Python",
+        "tool": "interpreter",
+        "runtime_examples": '"Division by zero", "Index out of bounds"',
+        "extra_checks": '\n- Check if there is any spelling mistake in the words (e.g., "sel f", "sprint")',
+        "confidence": "completely",
+    },
+    "javascript": {
+        "name": "JavaScript",
+        "tool": "interpreter",
+        "runtime_examples": '"TypeError", "ReferenceError"',
+    },
+    "c": {
+        "name": "C",
+        "syntax_example": "expected ‘;’ before",
+        "runtime_examples": '"Segmentation fault"',
+    },
+    "cpp": {
+        "name": "C++",
+        "syntax_example": "expected ‘;’ before",
+        "runtime_examples": '"Segmentation fault", "NullPointerException"',
+    },
+    "java": {
+        "name": "Java",
+        "runtime_examples": '"NullPointerException", "ArrayIndexOutOfBoundsException"',
+        "extra_checks": "\n- Report every error the compiler would find, not just the first.",
+    },
+    "csharp": {
+        "name": "C#",
+        "syntax_example": "CS1002: ; expected",
+        "runtime_examples": '"NullReferenceException", "IndexOutOfRangeException"',
+    },
+    "rust": {
+        "name": "Rust",
+        "syntax_example": "unexpected closing delimiter",
+        "runtime_examples": '"panic occurred", "borrow checker error"',
+    },
+    "go": {
+        "name": "Go",
+        "syntax_example": "syntax error: unexpected ...",
+        "runtime_examples": '"panic: runtime error"',
+    },
+    "verilog": {
+        "name": "Verilog",
+        "tool": "simulator",
+        "syntax_example": "Syntax error in module declaration",
+        "failure": "Simulation",
+        "runtime_examples": '"Unknown variable", "Undefined state"',
+        "focus": "Carefully examine the provided code line-by-line and character-by-character. Focus on errors such as syntax or simulation issues.",
+        "success_rules": """- If there's an infinite loop in the simulation, show the first 20 iterations followed by "..."
+- If the code involves randomization or non-deterministic behavior, show the output with different values for each run.
+- Otherwise, show the full output of the simulation.""",
+    },
+    "sql": {
+        "name": "SQL",
+        "subject": "query",
+        "tool": "engine",
+        "syntax_example": "Syntax error near...",
+        "runtime_examples": '"Table not found", "Column does not exist"',
+        "focus": "Carefully examine the provided SQL query for potential issues.",
+        "success_rules": QUERY_RULES,
+    },
+    "mongodb": {
+        "name": "MongoDB",
+        "subject": "query",
+        "tool": "engine",
+        "syntax_example": '"Unexpected token", "Unknown operator"',
+        "runtime_examples": '"No such collection", "Invalid field name"',
+        "focus": "Carefully examine the provided MongoDB query for potential issues.",
+        "success_rules": QUERY_RULES,
+    },
+    "swift": {
+        "name": "Swift",
+        "syntax_example": "Expected ‘;’",
+        "runtime_examples": '"Nil pointer exception", "Index out of range"',
+    },
+    "ruby": {
+        "name": "Ruby",
+        "tool": "interpreter",
+        "syntax_example": "syntax error, unexpected ...",
+        "runtime_examples": '"NoMethodError", "IndexError"',
+    },
+    "typescript": {
+        "name": "TypeScript",
+        "syntax_example": "Property 'x' does not exist on type 'y'",
+        "runtime_examples": '"TypeError", "undefined is not a function"',
+    },
+    "dart": {
+        "name": "Dart",
+        "syntax_example": "The method 'x' isn't defined for the class 'y'",
+        "runtime_examples": '"Null check operator used on a null value"',
+    },
+    "kotlin": {
+        "name": "Kotlin",
+        "syntax_example": "Unresolved reference: x",
+        "runtime_examples": '"NullPointerException", "IndexOutOfBoundsException"',
+    },
+    "perl": {
+        "name": "Perl",
+        "tool": "interpreter",
+        "syntax_example": "syntax error at ...",
+        "runtime_examples": '"Undefined subroutine", "Array index out of range"',
+    },
+    "scala": {
+        "name": "Scala",
+        "syntax_example": "not found: value x",
+        "runtime_examples": '"NullPointerException", "ArrayIndexOutOfBoundsException"',
+    },
+    "julia": {
+        "name": "Julia",
+        "tool": "interpreter",
+        "syntax_example": "syntax: unexpected ...",
+        "runtime_examples": '"MethodError", "BoundsError"',
+    },
+}
+
+
+def compile_run_prompt(spec):
+    fields = {
+        "subject": "code",
+        "tool": "compiler",
+        "failure": "Runtime",
+        "focus": CODE_FOCUS,
+        "extra_checks": "",
+        "confidence": "likely",
+        "success_rules": PROGRAM_RULES,
+    }
+    fields.update(spec)
+    example = fields.pop("syntax_example", None)
+    if not example:
+        fields["syntax_example"] = ""
+    elif example.startswith('"'):
+        fields["syntax_example"] = f" (e.g., {example})"
+    else:
+        fields["syntax_example"] = f' (e.g., "{example}")'
+    return PromptTemplate(RUN_PROMPT_SKELETON, **fields)
+
+
 languages_prompts = {
-    "python": """
-    Analyze the following Python code:
-
-    ```
-    {code}
-    ```
-
-    Carefully examine the provided code line-by-line and character-by-character. Focus on errors, such as syntax or runtime issues.
-    **If the snippet is a comment, then do not execute the commented snippet.**
-
-    If errors are found:
-    - Syntax errors: Provide the most probable error message a Python interpreter would report.
-    - Runtime errors: Provide a clear description (e.g., "Division by zero", "Index out of bounds").
-    - Only provide the error message, not the code or explanations.
-    - Check if there is any spelling mistake in the words (e.g., "sel f", "sprint")
-    - Review the code repeatedly to ensure it is error-free before proceeding with the output.
-
-    If the code is completely error-free:
-    - If there's an infinite loop, show the first 20 iterations followed by "..."
-    - If the code uses randomness, show the output with different values for each run.
-    - Otherwise, show the full output.
-
-    If the code is not valid Python:
-    - Output: "Language not supported."
-    """,
-    "javascript": """
-    Analyze the following JavaScript code:
-    
-    ```
-    {code}
-    ```
-
-    Output:
-
-    Carefully examine the provided code line-by-line and character-by-character. Focus on errors such as syntax or runtime issues.
-    **If the snippet is a comment, then do not execute the commented snippet.**
-
-    If errors are found:
-    - Syntax errors: Provide the most probable error message a JavaScript interpreter would report.
-    - Runtime errors: Provide a clear description (e.g., "TypeError", "ReferenceError").
-    - Only provide the error message, not the code or explanations.
-    - Review the code repeatedly to ensure it is error-free before proceeding with the output.
-
-    If the code is likely error-free:
-    - If there's an infinite loop, show the first 20 iterations followed by "..."
-    - If the code uses randomness, show the output with different values for each run.
-    - Otherwise, show the full output.
-
-    If the code is not valid JavaScript:
-    - Output: "Language not supported."
-    """,
-    "c": """
-    Analyze the following C code:
-
-    ```
-    {code}
-    ```
-
-    Output:
-
-    Carefully examine the provided code line-by-line and character-by-character. Focus on errors such as syntax or runtime issues.
-    **If the snippet is a comment, then do not execute the commented snippet.**
-
-    If errors are found:
-    - Syntax errors: Provide the most probable error message a C compiler would report (e.g., "expected ‘;’ before").
-    - Runtime errors: Provide a clear description (e.g., "Segmentation fault").
-    - Only provide the error message, not the code or explanations.
-    - Review the code repeatedly to ensure it is error-free before proceeding with the output.
-
-    If the code is likely error-free:
-    - If there's an infinite loop, show the first 20 iterations followed by "..."
-    - If the code uses randomness, show the output with different values for each run.
-    - Otherwise, show the full output.
-
-    If the code is not valid C:
-    - Output: "Language not supported."
-    """,
-    "cpp": """
-    Analyze the following C++ code:
-
-    ```
-    {code}
-    ```
-
-    Output:
-
-    Carefully examine the provided code line-by-line and character-by-character. Focus on errors such as syntax or runtime issues.
-    **If the snippet is a comment, then do not execute the commented snippet.**
-
-    If errors are found:
-    - Syntax errors: Provide the most probable error message a C++ compiler would report (e.g., "expected ‘;’ before").
-    - Runtime errors: Provide a clear description (e.g., "Segmentation fault", "NullPointerException").
-    - Only provide the error message, not the code or explanations.
-    - Review the code repeatedly to ensure it is error-free before proceeding with the output.
-
-    If the code is likely error-free:
-    - If there's an infinite loop, show the first 20 iterations followed by "..."
-    - If the code uses randomness, show the output with different values for each run.
-    - Otherwise, show the full output.
-
-    If the code is not valid C++:
-    - Output: "Language not supported."
-    """,
-    "java": """
-    Analyze the following Java code:
-
-    ```
-    {code}
-    ```
-
-    Output:
-
-    Carefully examine the provided code line-by-line and character-by-character. Focus on errors such as syntax or runtime issues.
-    **If the snippet is a comment, then do not execute the commented snippet.**
-
-    If errors are found:
-    - Syntax errors: Provide all the most probable error message a Java compiler would report.
-    - Runtime errors: Provide a clear description (e.g., "NullPointerException", "ArrayIndexOutOfBoundsException").
-    - Only provide the error message, not the code or explanations.
-    - Review the code repeatedly to ensure it is error-free before proceeding with the output.
-
-    If the code is likely error-free:
-    - If there's an infinite loop, show the first 20 iterations followed by "..."
-    - If the code uses randomness, show the output with different values for each run.
-    - Otherwise, show the full output.
-
-    If the code is not valid Java:
-    - Output: "Language not supported."
-    """,
-    "csharp": """
-    Analyze the following C# code:
-
-    ```
-    {code}
-    ```
-
-    Output:
-
-    Carefully examine the provided code line-by-line and character-by-character. Focus on errors such as syntax or runtime issues.
-    **If the snippet is a comment, then do not execute the commented snippet.**
-
-    If errors are found:
-    - Syntax errors: Provide the most probable error message a C# compiler would report (e.g., "CS1002: ; expected").
-    - Runtime errors: Provide a clear description (e.g., "NullReferenceException", "IndexOutOfRangeException").
-    - Only provide the error message, not the code or explanations.
-    - Review the code repeatedly to ensure it is error-free before proceeding with the output.
-
-    If the code is likely error-free:
-    - If there's an infinite loop, show the first 20 iterations followed by "..."
-    - If the code uses randomness, show the output with different values for each run.
-    - Otherwise, show the full output.
-
-    If the code is not valid C#:
-    - Output: "Language not supported."
-    """,
-    "rust": """
-    Analyze the following Rust code:
-
-    ```
-    {code}
-    ```
-
-    Output:
-
-    Carefully examine the provided code line-by-line and character-by-character. Focus on errors such as syntax or runtime issues.
-    **If the snippet is a comment, then do not execute the commented snippet.**
-
-    If errors are found:
-    - Syntax errors: Provide the most probable error message a Rust compiler would report (e.g., "unexpected closing delimiter").
-    - Runtime errors: Provide a clear description (e.g., "panic occurred", "borrow checker error").
-    - Only provide the error message, not the code or explanations.
-    - Review the code repeatedly to ensure it is error-free before proceeding with the output.
-
-    If the code is likely error-free:
-    - If there's an infinite loop, show the first 20 iterations followed by "..."
-    - If the code uses randomness, show the output with different values for each run.
-    - Otherwise, show the full output.
-
-    If the code is not valid Rust:
-    - Output: "Language not supported."
-    """,
-    "go": """
-    Analyze the following Go code:
-
-    ```
-    {code}
-    ```
-
-    Output:
-
-    Carefully examine the provided code line-by-line and character-by-character. Focus on errors such as syntax or runtime issues.
-    **If the snippet is a comment, then do not execute the commented snippet.**
-
-    If errors are found:
-    - Syntax errors: Provide the most probable error message a Go compiler would report (e.g., "syntax error: unexpected ...").
-    - Runtime errors: Provide a clear description (e.g., "panic: runtime error").
-    - Only provide the error message, not the code or explanations.
-    - Review the code repeatedly to ensure it is error-free before proceeding with the output.
-
-    If the code is likely error-free:
-    - If there's an infinite loop, show the first 20 iterations followed by "..."
-    - If the code uses randomness, show the output with different values for each run.
-    - Otherwise, show the full output.
-
-    If the code is not valid Go:
-    - Output: "Language not supported."
-    """,
-    "verilog": """
-    Analyze the following verilog code:
-
-    ```
-    {code}
-    ```
-
-    Output:
-
-    Carefully examine the provided code line-by-line and character-by-character. Focus on errors such as syntax or simulation issues.
-    **If the snippet is a comment, then do not execute the commented snippet.**
-
-    If errors are found:
-    - Syntax errors: Provide the most probable error message a Verilog simulator would report (e.g., "Syntax error in module declaration").
-    - Simulation errors: Provide a clear description (e.g., "Unknown variable", "Undefined state").
-    - Only provide the error message, not the code or explanations.
-    - Review the code repeatedly to ensure it is error-free before proceeding with the output.
-
-    If the code is likely error-free:
-    - If there's an infinite loop in the simulation, show the first 20 iterations followed by "..."
-    - If the code involves randomization or non-deterministic behavior, show the output with different values for each run.
-    - Otherwise, show the full output of the simulation.
-
-    If the code is not valid Verilog:
-    - Output: "Language not supported."
-    """,
-    "sql": """
-    Analyze the following SQL query:
-
-    ```
-    {code}
-    ```
-
-    Output:
-
-    Carefully examine the provided SQL query for potential issues.
-    **If the snippet is a comment, then do not execute the commented snippet.**
-
-    If errors are found:
-    - Syntax errors: Provide the most probable error message a SQL engine would report (e.g., "Syntax error near...").
-    - Runtime errors: Provide a clear description (e.g., "Table not found", "Column does not exist").
-    - Only provide the error message, not the code or explanations.
-    - Review the code repeatedly to ensure it is error-free before proceeding with the output.
-
-    If the query is likely error-free:
-    - If the query would return results, show a sample output (if possible).
-    - Otherwise, indicate if the query would run successfully without returning results.
-
-    *Use this format and exact border style:*
-
-    If the query is not valid SQL:
-    - Output: "Language not supported."
-    """,
-    "mongodb": """
-    Analyze the following MongoDB query:
-
-    ```
-    {code}
-    ```
-
-    Output:
-
-    Carefully examine the provided MongoDB query for potential issues.
-    **If the snippet is a comment, then do not execute the commented snippet.**
-
-    If errors are found:
-    - Syntax errors: Provide the most probable error message a MongoDB engine would report (e.g., "Unexpected token", "Unknown operator").
-    - Runtime errors: Provide a clear description (e.g., "No such collection", "Invalid field name").
-    - Only provide the error message, not the code or explanations.
-    - Review the code repeatedly to ensure it is error-free before proceeding with the output.
-
-    If the query is likely error-free:
-    - If the query would return results, show a sample output (if possible).
-    - Otherwise, indicate if the query would run successfully without returning results.
-
-    If the query is not valid MongoDB:
-    - Output: "Language not supported."
-    """,
-    "swift": """
-    Analyze the following Swift code:
-
-    ```
-    {code}
-    ```
-
-    Output:
-
-    Carefully examine the provided code line-by-line and character-by-character. Focus on errors such as syntax or runtime issues.
-    **If the snippet is a comment, then do not execute the commented snippet.**
-
-    If errors are found:
-    - Syntax errors: Provide the most probable error message a Swift compiler would report (e.g., "Expected ‘;’").
-    - Runtime errors: Provide a clear description (e.g., "Nil pointer exception", "Index out of range").
-    - Only provide the error message, not the code or explanations.
-    - Review the code repeatedly to ensure it is error-free before proceeding with the output.
-
-    If the code is likely error-free:
-    - If there's an infinite loop, show the first 20 iterations followed by "..."
-    - If the code uses randomness, show the output with different values for each run.
-    - Otherwise, show the full output.
-
-    If the code is not valid Swift:
-    - Output: "Language not supported."
-    """,
-    "ruby": """
-    Analyze the following Ruby code:
-
-    ```
-    {code}
-    ```
-
-    Output:
-
-    Carefully examine the provided code line-by-line and character-by-character. Focus on errors such as syntax or runtime issues.
-    **If the snippet is a comment, then do not execute the commented snippet.**
-
-    If errors are found:
-    - Syntax errors: Provide the most probable error message a Ruby interpreter would report (e.g., "syntax error, unexpected ...").
-    - Runtime errors: Provide a clear description (e.g., "NoMethodError", "IndexError").
-    - Only provide the error message, not the code or explanations.
-    - Review the code repeatedly to ensure it is error-free before proceeding with the output.
-
-    If the code is likely error-free:
-    - If there's an infinite loop, show the first 20 iterations followed by "..."
-    - If the code uses randomness, show the output with different values for each run.
-    - Otherwise, show the full output.
-
-    If the code is not valid Ruby:
-    - Output: "Language not supported."
-    """,
-    "typescript": """
-    Analyze the following TypeScript code:
-
-    ```
-    {code}
-    ```
-
-    Output:
-
-    Carefully examine the provided code line-by-line and character-by-character. Focus on errors such as syntax or runtime issues.
-    **If the snippet is a comment, then do not execute the commented snippet.**
-
-    If errors are found:
-    - Syntax errors: Provide the most probable error message a TypeScript compiler would report (e.g., "Property 'x' does not exist on type 'y'").
-    - Runtime errors: Provide a clear description (e.g., "TypeError", "undefined is not a function").
-    - Only provide the error message, not the code or explanations.
-    - Review the code repeatedly to ensure it is error-free before proceeding with the output.
-
-    If the code is likely error-free:
-    - If there's an infinite loop, show the first 20 iterations followed by "..."
-    - If the code uses randomness, show the output with different values for each run.
-    - Otherwise, show the full output.
-
-    If the code is not valid TypeScript:
-    - Output: "Language not supported."
-    """,
-    "dart": """
-    Analyze the following Dart code:
-
-    ```
-    {code}
-    ```
-
-    Output:
-
-    Carefully examine the provided code line-by-line and character-by-character. Focus on errors such as syntax or runtime issues.
-    **If the snippet is a comment, then do not execute the commented snippet.**
-
-    If errors are found:
-    - Syntax errors: Provide the most probable error message a Dart compiler would report (e.g., "The method 'x' isn't defined for the class 'y'").
-    - Runtime errors: Provide a clear description (e.g., "Null check operator used on a null value").
-    - Only provide the error message, not the code or explanations.
-    - Review the code repeatedly to ensure it is error-free before proceeding with the output.
-
-    If the code is likely error-free:
-    - If there's an infinite loop, show the first 20 iterations followed by "..."
-    - If the code uses randomness, show the output with different values for each run.
-    - Otherwise, show the full output.
-
-    If the code is not valid Dart:
-    - Output: "Language not supported."
-    """,
-    "kotlin": """
-    Analyze the following Kotlin code:
-
-    ```
-    {code}
-    ```
-
-    Output:
-
-    Carefully examine the provided code line-by-line and character-by-character. Focus on errors such as syntax or runtime issues.
-    **If the snippet is a comment, then do not execute the commented snippet.**
-
-    If errors are found:
-    - Syntax errors: Provide the most probable error message a Kotlin compiler would report (e.g., "Unresolved reference: x").
-    - Runtime errors: Provide a clear description (e.g., "NullPointerException", "IndexOutOfBoundsException").
-    - Only provide the error message, not the code or explanations.
-    - Review the code repeatedly to ensure it is error-free before proceeding with the output.
-
-    If the code is likely error-free:
-    - If there's an infinite loop, show the first 20 iterations followed by "..."
-    - If the code uses randomness, show the output with different values for each run.
-    - Otherwise, show the full output.
-
-    If the code is not valid Kotlin:
-    - Output: "Language not supported."
-    """,
-    "perl": """
-    Analyze the following Perl code:
-
-    ```
-    {code}
-    ```
-
-    Output:
-
-    Carefully examine the provided code line-by-line and character-by-character. Focus on errors such as syntax or runtime issues.
-    **If the snippet is a comment, then do not execute the commented snippet.**
-
-    If errors are found:
-    - Syntax errors: Provide the most probable error message a Perl interpreter would report (e.g., "syntax error at ...").
-    - Runtime errors: Provide a clear description (e.g., "Undefined subroutine", "Array index out of range").
-    - Only provide the error message, not the code or explanations.
-    - Review the code repeatedly to ensure it is error-free before proceeding with the output.
-
-    If the code is likely error-free:
-    - If there's an infinite loop, show the first 20 iterations followed by "..."
-    - If the code uses randomness, show the output with different values for each run.
-    - Otherwise, show the full output.
-
-    If the code is not valid Perl:
-    - Output: "Language not supported."
-    """,
-    "scala": """
-    Analyze the following Scala code:
-
-    ```
-    {code}
-    ```
-
-    Output:
-
-    Carefully examine the provided code line-by-line and character-by-character. Focus on errors such as syntax or runtime issues.
-    **If the snippet is a comment, then do not execute the commented snippet.**
-
-    If errors are found:
-    - Syntax errors: Provide the most probable error message a Scala compiler would report (e.g., "not found: value x").
-    - Runtime errors: Provide a clear description (e.g., "NullPointerException", "ArrayIndexOutOfBoundsException").
-    - Only provide the error message, not the code or explanations.
-    - Review the code repeatedly to ensure it is error-free before proceeding with the output.
-
-    If the code is likely error-free:
-    - If there's an infinite loop, show the first 20 iterations followed by "..."
-    - If the code uses randomness, show the output with different values for each run.
-    - Otherwise, show the full output.
-
-    If the code is not valid Scala:
-    - Output: "Language not supported."
-    """,
-    "julia": """
-    Analyze the following Julia code:
-
-    ```
-    {code}
-    ```
-
-    Output:
-
-    Carefully examine the provided code line-by-line and character-by-character. Focus on errors such as syntax or runtime issues.
-    **If the snippet is a comment, then do not execute the commented snippet.**
-
-    If errors are found:
-    - Syntax errors: Provide the most probable error message a Julia interpreter would report (e.g., "syntax: unexpected ...").
-    - Runtime errors: Provide a clear description (e.g., "MethodError", "BoundsError").
-    - Only provide the error message, not the code or explanations.
-    - Review the code repeatedly to ensure it is error-free before proceeding with the output.
-
-    If the code is likely error-free:
-    - If there's an infinite loop, show the first 20 iterations followed by "..."
-    - If the code uses randomness, show the output with different values for each run.
-    - Otherwise, show the full output.
-
-    If the code is not valid Julia:
-    - Output: "Language not supported."
-    """,
+    language: compile_run_prompt(spec) for language, spec in language_specs.items()
 }
 
-html_prompt = """
+html_prompt = PromptTemplate("""
 Generate HTML code for the following project, suitable for placement directly within the `<body>` tag.
 
 *   Exclude all `<html>`, `<head>`, and `<body>` tags.
@@ -515,9 +199,9 @@ Generate HTML code for the following project, suitable for placement directly wi
 *   **Do not use jQuery unless specifically asked for in the project description**.
 
 Project description: {prompt}
-"""
+""")
 
-css_prompt = """
+css_prompt = PromptTemplate("""
 Generate CSS to style the following HTML.
 **If a CSS `CDN version` or styling framework (like Tailwind, etc) is used, simply reference the specific library in the CSS comments without including any HTML code or extra details.**
 
@@ -534,9 +218,9 @@ HTML:
 ```html
 {html_content}
 ```
-"""
+""")
 
-js_prompt = """
+js_prompt = PromptTemplate("""
 Generate JavaScript to add interactivity to the following HTML.
 **Return only the JavaScript code, without including HTML or CSS.**
 
@@ -558,9 +242,9 @@ CSS:
 ```css
 {css_content}
 ```
-"""
+""")
 
-refactor_html_prompt = """
+refactor_html_prompt = PromptTemplate("""
 Refactor HTML code for the following project, suitable for placement directly within the `<body>` tag.
 **If styling frameworks like Tailwind or Bootstrap, don't remove them—just improve them.**
 
@@ -585,9 +269,9 @@ HTML:
 ```html
 {html_content}
 ```
-"""
+""")
 
-refactor_css_prompt = """
+refactor_css_prompt = PromptTemplate("""
 Refactor CSS to style the following HTML.
 **If a CSS `CDN version` or styling framework (like Tailwind, etc) is used, simply reference the specific library in the CSS comments without including any HTML code or extra details.**
 
@@ -607,9 +291,9 @@ CSS:
 ```css
 {css_content}
 ```
-"""
+""")
 
-refactor_js_prompt = """
+refactor_js_prompt = PromptTemplate("""
 Refactor JavaScript to add interactivity to the following HTML.
 **Return only the JavaScript code, without including HTML or CSS.**
 
@@ -634,9 +318,9 @@ JAVASCRIPT:
 ```js
 {js_content}
 ```
-"""
+""")
 
-generate_code_prompt = """
+generate_code_prompt = PromptTemplate("""
 Generate code in {language} that solves the following problem:
 
 {problem_description}
@@ -644,9 +328,9 @@ Generate code in {language} that solves the following problem:
 Output:
 
 Provide *only* one complete, runnable code solution. Do *not* include any explanations, markdown formatting, headers, or any other extraneous text. Include concise inline comments within the code to explain the logic and important steps. The code must produce some visible output (e.g., by printing to the console). If the problem cannot be solved in {language}, return "Cannot generate code for this problem in {language}."
-"""
+""")
 
-refactor_code_prompt = """
+refactor_code_prompt = PromptTemplate("""
 Refactor the following code written in {language}. Focus on fixing errors, improving readability, and following common coding conventions for the language.
 
 ```
@@ -658,4 +342,18 @@ Output:
 Provide *only* the corrected and refactored code. Do *not* include any explanations, markdown formatting, headers, or any other extraneous text. If there are errors in the original code, indicate them with inline comments in the corrected code, following this format: `// Error: [Specific error message]`.
 
 If the code is already correct and well-formatted, simply return the original code. If the code cannot be parsed as valid {language}, return "Language not supported."
-"""
+""")
+
+refactor_chunk_prompt = PromptTemplate("""
+Refactor the following part of a larger file written in {language}. The other parts are refactored separately and will be joined back with this one. Focus on fixing errors, improving readability, and following common coding conventions for the language.
+
+```
+{code}
+```
+
+Output:
+
+Provide *only* the corrected and refactored code for this part. Do *not* include any explanations, markdown formatting, headers, or any other extraneous text. Keep the names and signatures of top-level functions, classes, types and variables unchanged, since other parts of the file use them. Do not add code from other parts of the file. If you need an import, add it at the top of this part. If there are errors in the original code, indicate them with inline comments in the corrected code, following this format: `// Error: [Specific error message]`.
+
+If the code is already correct and well-formatted, simply return the original code.
+""")
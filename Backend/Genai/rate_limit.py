@@ -0,0 +1,320 @@
+import asyncio
+import os
+import threading
+import time
+
+from dotenv import load_dotenv
+
+from metrics import redis_latency
+
+load_dotenv()
+
+
+class RateLimited(Exception):
+    status = 429
+    retryable = True
+
+    def __init__(self, message, code, retry_after):
+        super().__init__(message)
+        self.code = code
+        self.retry_after = retry_after
+
+    def to_dict(self):
+        return {
+            "error": str(self),
+            "error_code": self.code,
+            "retryable": self.retryable,
+            "retry_after": round(self.retry_after, 1),
+        }
+
+
+class Limit:
+    def __init__(self, per_minute, burst):
+        self.rate = per_minute / 60.0
+        self.burst = burst
+
+
+class LocalTokenBucket:
+    # One bucket per key, refilled lazily on access. A request costing more
+    # than the burst needs a full bucket and leaves it in debt, so a batch is
+    # charged in full yet can still be admitted. Full buckets are the same as
+    # missing ones, so refilled idle keys are dropped once there are too many.
+    def __init__(self, max_keys=10000):
+        self.max_keys = max_keys
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def take(self, key, limit, cost=1):
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (limit.burst, now))
+            tokens = min(limit.burst, tokens + (now - updated) * limit.rate)
+            needed = min(cost, limit.burst)
+            if tokens >= needed:
+                self._buckets[key] = (tokens - cost, now)
+                allowed, retry_after = True, 0.0
+            else:
+                self._buckets[key] = (tokens, now)
+                allowed, retry_after = False, (needed - tokens) / limit.rate
+            if len(self._buckets) > self.max_keys:
+                self._prune(now, limit)
+        return allowed, retry_after
+
+    def _prune(self, now, limit):
+        for key, (tokens, updated) in list(self._buckets.items()):
+            if now - updated >= (limit.burst - tokens) / limit.rate:
+                del self._buckets[key]
+
+
+# Refill and take in one round trip, on Redis time so that every node agrees.
+TOKEN_BUCKET_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(state[1]) or burst
+local updated = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - updated) * rate)
+local needed = math.min(cost, burst)
+local allowed = 0
+local retry_after = 0
+if tokens >= needed then
+    tokens = tokens - cost
+    allowed = 1
+else
+    retry_after = (needed - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil((burst - tokens) / rate * 1000) + 1000)
+return {allowed, tostring(retry_after)}
+"""
+
+
+class RedisTokenBucket:
+    def __init__(self, redis_url, prefix="genai:ratelimit:", fallback=None):
+        import redis
+
+        self.redis = redis.Redis.from_url(
+            redis_url, socket_timeout=0.25, socket_connect_timeout=0.25
+        )
+        self.script = self.redis.register_script(TOKEN_BUCKET_SCRIPT)
+        self.prefix = prefix
+        self.fallback = fallback or LocalTokenBucket()
+        self.errors = 0
+
+    def take(self, key, limit, cost=1):
+        try:
+            with redis_latency.labels("evalsha").time():
+                allowed, retry_after = self.script(
+                    keys=[self.prefix + key], args=[limit.rate, limit.burst, cost]
+                )
+        except Exception as e:
+            # Limit per node rather than not at all while Redis is away.
+            self.errors += 1
+            print(f"Error checking rate limit in Redis: {e}")
+            return self.fallback.take(key, limit, cost)
+        return bool(allowed), float(retry_after)
+
+
+class RateLimiter:
+    def __init__(self, limits, routes, bucket, enabled=True, user_header=None):
+        self.limits = limits
+        self.routes = routes
+        self.bucket = bucket
+        self.enabled = enabled
+        self.user_header = user_header
+        self.remote = isinstance(bucket, RedisTokenBucket)
+        self._lock = threading.Lock()
+        self.counters = {"allowed": 0, "limited": 0}
+
+    def group(self, path):
+        return self.routes.get(path.rstrip("/") or "/")
+
+    def client_id(self, headers, remote_addr):
+        # A user id is only trusted when a proxy in front of us sets the
+        # configured header; everyone else is limited by address.
+        if self.user_header and headers.get(self.user_header):
+            return "user:" + headers[self.user_header]
+        return "ip:" + (remote_addr or "unknown")
+
+    def check(self, path, headers, remote_addr, cost=1):
+        group = self.group(path)
+        if not self.enabled or group is None:
+            return
+        limit = self.limits[group]
+        key = f"{group}:{self.client_id(headers, remote_addr)}"
+        allowed, retry_after = self.bucket.take(key, limit, cost)
+        with self._lock:
+            self.counters["allowed" if allowed else "limited"] += 1
+        if not allowed:
+            raise RateLimited(
+                "Too many requests, please slow down.", "rate_limited", retry_after
+            )
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counters)
+        stats["enabled"] = self.enabled
+        stats["redis_enabled"] = self.remote
+        return stats
+
+
+class AdmissionQueue:
+    # Caps the requests working on model calls at once. Up to max_queue more
+    # wait for a slot for at most queue_timeout; beyond that a request is
+    # turned away immediately with an estimate of when to come back, instead
+    # of tying up a worker until it times out.
+    def __init__(self, max_concurrent=32, max_queue=64, queue_timeout=10.0):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self.waiting = 0
+        self.average_seconds = 1.0
+        self._lock = threading.Lock()
+        self._slots = threading.Semaphore(max_concurrent)
+        self.counters = {"admitted": 0, "queued": 0, "rejected": 0, "timed_out": 0}
+
+    def retry_after(self):
+        backlog = self.waiting + 1
+        return max(1.0, self.average_seconds * backlog / self.max_concurrent)
+
+    def _reject(self, counter):
+        self.counters[counter] += 1
+        return RateLimited(
+            "The service is busy, please retry shortly.",
+            "overloaded",
+            self.retry_after(),
+        )
+
+    def _admitted(self):
+        with self._lock:
+            self.active += 1
+            self.counters["admitted"] += 1
+        return time.monotonic()
+
+    def release(self, started):
+        self._slots.release()
+        with self._lock:
+            self.active -= 1
+            elapsed = time.monotonic() - started
+            self.average_seconds = 0.9 * self.average_seconds + 0.1 * elapsed
+
+    def acquire(self):
+        if self._slots.acquire(blocking=False):
+            return self._admitted()
+        with self._lock:
+            if self.waiting >= self.max_queue:
+                raise self._reject("rejected")
+            self.waiting += 1
+            self.counters["queued"] += 1
+        try:
+            acquired = self._slots.acquire(timeout=self.queue_timeout)
+        finally:
+            with self._lock:
+                self.waiting -= 1
+        if not acquired:
+            with self._lock:
+                raise self._reject("timed_out")
+        return self._admitted()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counters)
+            stats.update(
+                active=self.active,
+                waiting=self.waiting,
+                max_concurrent=self.max_concurrent,
+                max_queue=self.max_queue,
+            )
+        return stats
+
+
+class AsyncAdmissionQueue(AdmissionQueue):
+    def __init__(self, max_concurrent=32, max_queue=64, queue_timeout=10.0):
+        super().__init__(max_concurrent, max_queue, queue_timeout)
+        self._slots = asyncio.Semaphore(max_concurrent)
+
+    async def acquire(self):
+        if not self._slots.locked():
+            await self._slots.acquire()
+            return self._admitted()
+        with self._lock:
+            if self.waiting >= self.max_queue:
+                raise self._reject("rejected")
+            self.waiting += 1
+            self.counters["queued"] += 1
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            with self._lock:
+                raise self._reject("timed_out")
+        finally:
+            with self._lock:
+                self.waiting -= 1
+        return self._admitted()
+
+
+def _routes(group, *paths):
+    routes = {}
+    for path in paths:
+        routes[path] = group
+        routes[path + "/stream"] = group
+        routes[path + "/batch"] = group
+    return routes
+
+
+rate_limit_routes = {
+    **_routes("get-output", "/get-output"),
+    **_routes("generate", "/generate_code", "/refactor_code"),
+    "/htmlcssjsgenerate-code": "generate",
+    "/htmlcssjsrefactor-code": "generate",
+}
+
+rate_limits = {
+    "get-output": Limit(
+        per_minute=float(os.getenv("GENAI_RATE_LIMIT_GET_OUTPUT", "60")),
+        burst=float(os.getenv("GENAI_RATE_BURST_GET_OUTPUT", "20")),
+    ),
+    "generate": Limit(
+        per_minute=float(os.getenv("GENAI_RATE_LIMIT_GENERATE", "20")),
+        burst=float(os.getenv("GENAI_RATE_BURST_GENERATE", "5")),
+    ),
+}
+
+
+def _bucket():
+    redis_url = os.getenv("GENAI_RATE_LIMIT_REDIS_URL")
+    if redis_url:
+        try:
+            return RedisTokenBucket(redis_url)
+        except ImportError:
+            print(
+                "Error: GENAI_RATE_LIMIT_REDIS_URL is set but redis is not installed."
+            )
+    return LocalTokenBucket()
+
+
+rate_limiter = RateLimiter(
+    rate_limits,
+    rate_limit_routes,
+    _bucket(),
+    enabled=os.getenv("GENAI_RATE_LIMIT_ENABLED", "true").lower()
+    in ("1", "true", "yes"),
+    user_header=os.getenv("GENAI_RATE_LIMIT_USER_HEADER"),
+)
+
+admission_settings = {
+    "max_concurrent": int(os.getenv("GENAI_ADMISSION_MAX_CONCURRENT", "32")),
+    "max_queue": int(os.getenv("GENAI_ADMISSION_MAX_QUEUE", "64")),
+    "queue_timeout": float(os.getenv("GENAI_ADMISSION_QUEUE_TIMEOUT", "10")),
+}
+
+
+def request_cost(data):
+    # A batch costs one token per item so it cannot sidestep the limit; one
+    # larger than the burst waits for a full bucket, see LocalTokenBucket.
+    items = data.get("items") if isinstance(data, dict) else None
+    return len(items) if isinstance(items, list) and items else 1
@@ -0,0 +1,177 @@
+import os
+import re
+import threading
+import uuid
+
+from dotenv import load_dotenv
+
+from cache import LRUCache, normalize_code
+from code_units import group_units, split_units
+from prompt_engine import estimate_tokens
+
+load_dotenv()
+
+SESSION_ID_REGEX = re.compile(r"[\w-]{1,64}")
+
+
+class Block:
+    # Consecutive top-level units refactored together. `keys` are the
+    # normalized unit texts it was made from; output is None until the model
+    # has refactored it.
+    __slots__ = ("keys", "code", "output")
+
+    def __init__(self, keys, code, output=None):
+        self.keys = keys
+        self.code = code
+        self.output = output
+
+
+class SessionPlan:
+    def __init__(self, session_id, language, blocks, units):
+        self.session_id = session_id
+        self.language = language
+        self.blocks = blocks
+        self.units = units
+        # The blocks to send to the model, fixed when the plan is made.
+        self.pending = [block for block in blocks if block.output is None]
+
+
+class RefactorSessions:
+    # Remembers, per session, the units of the last submission and what each
+    # block of them was refactored into. A new submission is split the same
+    # way; blocks whose units are unchanged are spliced back from the
+    # session, and only the changed units go to the model. Sessions live in
+    # this process, so a deployment with several workers needs sticky
+    # routing for them to be found again.
+    def __init__(self, max_sessions=1000, ttl=3600, block_tokens=1500, workers=4):
+        self.store = LRUCache(max_entries=max_sessions, ttl=ttl)
+        self.block_tokens = block_tokens
+        self.workers = workers
+        self._lock = threading.Lock()
+        self.counters = {
+            "requests": 0,
+            "units": 0,
+            "units_reused": 0,
+            "blocks_refactored": 0,
+            "input_tokens": 0,
+            "sent_tokens": 0,
+        }
+
+    def session_id(self, value):
+        # `"session": true` starts a new session; a string continues one.
+        if value is True:
+            return uuid.uuid4().hex
+        if isinstance(value, str) and SESSION_ID_REGEX.fullmatch(value):
+            return value
+        raise ValueError("'session' must be true or a session id.")
+
+    def _blocks(self, units):
+        # Groups changed (key, text) units into blocks of up to block_tokens.
+        return [
+            Block(
+                tuple(key for key, _ in units[start:end]),
+                "".join(text for _, text in units[start:end]),
+            )
+            for start, end in group_units(
+                [text for _, text in units], self.block_tokens
+            )
+        ]
+
+    def plan(self, session_id, language, code):
+        units = [(normalize_code(text), text) for text in split_units(code, language)]
+        units = [(key, text) for key, text in units if key]
+        stored = self.store.get(session_id)
+        previous = stored[1] if stored and stored[0] == language else {}
+        lengths = sorted({len(keys) for keys in previous}, reverse=True)
+
+        blocks = []
+        changed = []
+        i = 0
+        while i < len(units):
+            for length in lengths:
+                keys = tuple(key for key, _ in units[i : i + length])
+                if len(keys) == length and keys in previous:
+                    blocks.extend(self._blocks(changed))
+                    changed = []
+                    text = "".join(text for _, text in units[i : i + length])
+                    blocks.append(Block(keys, text, previous[keys]))
+                    i += length
+                    break
+            else:
+                changed.append(units[i])
+                i += 1
+        blocks.extend(self._blocks(changed))
+        return SessionPlan(session_id, language, blocks, len(units))
+
+    def commit(self, plan):
+        # Stores the refactored blocks and returns the spliced output with a
+        # summary of what was resent.
+        pending = plan.pending
+        if any(block.output is None for block in pending):
+            raise ValueError("Every block must be refactored before commit.")
+        self.store.set(plan.session_id, (plan.language, self._entries(plan)))
+        reused = sum(len(block.keys) for block in plan.blocks) - sum(
+            len(block.keys) for block in pending
+        )
+        input_tokens = sum(estimate_tokens(block.code) for block in plan.blocks)
+        sent_tokens = sum(estimate_tokens(block.code) for block in pending)
+        with self._lock:
+            self.counters["requests"] += 1
+            self.counters["units"] += plan.units
+            self.counters["units_reused"] += reused
+            self.counters["blocks_refactored"] += len(pending)
+            self.counters["input_tokens"] += input_tokens
+            self.counters["sent_tokens"] += sent_tokens
+
+        separator = "\n\n\n" if plan.language == "python" else "\n\n"
+        code = separator.join(
+            block.output.strip("\n") for block in plan.blocks if block.output.strip()
+        )
+        summary = {
+            "total": plan.units,
+            "reused": reused,
+            "refactored": plan.units - reused,
+            "blocks_sent": len(pending),
+        }
+        return code + "\n", summary
+
+    def _entries(self, plan):
+        # The editor replaces its buffer with the refactored code, so the
+        # next submission is mostly output: every refactored unit is kept
+        # under its own text too, as already refactored. When a refactored
+        # block splits back into as many units as went in, each input unit is
+        # also remembered on its own so that the next edit only resends the
+        # unit that changed rather than its whole block.
+        entries = {}
+        inputs = {}
+        for block in plan.blocks:
+            parts = [
+                part
+                for part in split_units(block.output, plan.language)
+                if normalize_code(part)
+            ]
+            for part in parts:
+                entries[(normalize_code(part),)] = part
+            if len(block.keys) > 1 and block in plan.pending:
+                if len(parts) == len(block.keys):
+                    for key, part in zip(block.keys, parts):
+                        inputs[(key,)] = part
+                    continue
+            inputs[block.keys] = block.output
+        entries.update(inputs)
+        return entries
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counters)
+        stats["saved_tokens"] = stats["input_tokens"] - stats["sent_tokens"]
+        stats["sessions"] = len(self.store)
+        return stats
+
+
+refactor_sessions = RefactorSessions(
+    max_sessions=int(os.getenv("GENAI_SESSION_MAX", "1000")),
+    ttl=float(os.getenv("GENAI_SESSION_TTL", "3600")),
+    block_tokens=int(os.getenv("GENAI_SESSION_BLOCK_TOKENS", "1500")),
+    workers=int(os.getenv("GENAI_SESSION_WORKERS", "4")),
+)
@@ -0,0 +1,352 @@
+import asyncio
+import os
+import random
+import threading
+import time
+
+import httpx
+from dotenv import load_dotenv
+from google.genai import errors, types
+
+from metrics import timed_llm_call
+
+load_dotenv()
+
+
+class UpstreamError(Exception):
+    status = 502
+    code = "upstream_error"
+    retryable = False
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+    def to_dict(self):
+        body = {
+            "error": str(self),
+            "error_code": self.code,
+            "retryable": self.retryable,
+        }
+        if self.retry_after is not None:
+            body["retry_after"] = round(self.retry_after, 1)
+        return body
+
+
+class UpstreamTimeout(UpstreamError):
+    status = 504
+    code = "upstream_timeout"
+    retryable = True
+
+
+class UpstreamUnavailable(UpstreamError):
+    status = 503
+    code = "upstream_unavailable"
+    retryable = True
+
+
+class UpstreamRateLimited(UpstreamError):
+    status = 429
+    code = "upstream_rate_limited"
+    retryable = True
+
+
+class UpstreamRejected(UpstreamError):
+    status = 502
+    code = "upstream_rejected"
+
+
+class CircuitOpen(UpstreamError):
+    status = 503
+    code = "circuit_open"
+    retryable = True
+
+
+def classify(error):
+    # Maps a client exception to the UpstreamError it should surface as, and
+    # whether it says anything about upstream health. Exceptions that are not
+    # about the upstream call at all map to None and propagate unchanged.
+    if isinstance(error, UpstreamError):
+        return error, isinstance(error, (UpstreamTimeout, UpstreamUnavailable))
+    if isinstance(error, (httpx.TimeoutException, asyncio.TimeoutError)):
+        return UpstreamTimeout("The model did not answer in time."), True
+    if isinstance(error, httpx.TransportError):
+        return UpstreamUnavailable(f"Could not reach the model: {error}"), True
+    if isinstance(error, errors.ServerError):
+        return UpstreamUnavailable(f"The model is unavailable: {error}"), True
+    if isinstance(error, errors.APIError):
+        if error.code == 429:
+            return UpstreamRateLimited("The model is rate limited.", 1.0), False
+        if error.code == 408:
+            return UpstreamTimeout("The model did not answer in time."), True
+        return UpstreamRejected(f"The model rejected the request: {error}"), False
+    return None, False
+
+
+def error_body(e):
+    return e.to_dict() if isinstance(e, UpstreamError) else {"error": str(e)}
+
+
+class CircuitBreaker:
+    # Opens after failure_threshold consecutive upstream failures and rejects
+    # calls for recovery_time seconds, then lets a single probe through: its
+    # success closes the circuit again, its failure re-opens it.
+    def __init__(self, failure_threshold=5, recovery_time=30.0):
+        self.failure_threshold = failure_threshold
+        self.recovery_time = recovery_time
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probing = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == "closed":
+                return
+            remaining = self.opened_at + self.recovery_time - time.monotonic()
+            if self.state == "open" and remaining <= 0:
+                self.state = "half_open"
+            if self.state == "half_open" and not self.probing:
+                self.probing = True
+                return
+        raise CircuitOpen(
+            "The model is failing; requests are paused while it recovers.",
+            retry_after=max(remaining, 1.0),
+        )
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+            self.probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self.probing = False
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                self.state = "open"
+                self.opened_at = time.monotonic()
+
+    def release(self):
+        with self._lock:
+            self.probing = False
+
+    def stats(self):
+        with self._lock:
+            return {"state": self.state, "failures": self.failures}
+
+
+class Resilience:
+    # Wraps every model call with a per-endpoint deadline, retries of
+    # transient failures (timeouts, connection errors, 429 and 5xx) with
+    # full-jitter exponential backoff inside that deadline, and a circuit
+    # breaker per model.
+    def __init__(
+        self,
+        deadlines,
+        default_deadline,
+        max_attempts=3,
+        backoff_base=0.25,
+        backoff_cap=4.0,
+        failure_threshold=5,
+        recovery_time=30.0,
+    ):
+        self.deadlines = deadlines
+        self.default_deadline = default_deadline
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.failure_threshold = failure_threshold
+        self.recovery_time = recovery_time
+        self.breakers = {}
+        self._lock = threading.Lock()
+        self.counters = {"retries": 0, "timeouts": 0, "rejected_by_circuit": 0}
+
+    def deadline(self, endpoint):
+        return self.deadlines.get(endpoint, self.default_deadline)
+
+    def breaker(self, model):
+        with self._lock:
+            breaker = self.breakers.get(model)
+            if breaker is None:
+                breaker = self.breakers[model] = CircuitBreaker(
+                    self.failure_threshold, self.recovery_time
+                )
+            return breaker
+
+    def config(self, seconds):
+        return types.GenerateContentConfig(
+            http_options=types.HttpOptions(timeout=max(1, int(seconds * 1000)))
+        )
+
+    def backoff(self, attempt):
+        return random.uniform(0, min(self.backoff_cap, self.backoff_base * 2**attempt))
+
+    def _count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    def _admit(self, breaker):
+        try:
+            breaker.allow()
+        except CircuitOpen:
+            self._count("rejected_by_circuit")
+            raise
+
+    def _failed(self, breaker, error):
+        upstream, degraded = classify(error)
+        if upstream is None:
+            breaker.release()
+            return None
+        if degraded:
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+        if isinstance(upstream, UpstreamTimeout):
+            self._count("timeouts")
+        return upstream
+
+    def _retry_delay(self, error, attempt, deadline):
+        # None when the failure should not or can no longer be retried.
+        if not error.retryable or isinstance(error, CircuitOpen):
+            return None
+        if attempt >= self.max_attempts:
+            return None
+        delay = max(self.backoff(attempt), error.retry_after or 0)
+        if time.monotonic() + delay >= deadline:
+            return None
+        self._count("retries")
+        return delay
+
+    def call(self, endpoint, model, fn):
+        # fn(config) makes one blocking attempt with the given request config.
+        with timed_llm_call(endpoint, model):
+            return self._call(endpoint, model, fn)
+
+    async def call_async(self, endpoint, model, fn):
+        with timed_llm_call(endpoint, model):
+            return await self._call_async(endpoint, model, fn)
+
+    def _call(self, endpoint, model, fn):
+        deadline = time.monotonic() + self.deadline(endpoint)
+        breaker = self.breaker(model)
+        attempt = 0
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                self._count("timeouts")
+                raise UpstreamTimeout("The model did not answer in time.")
+            self._admit(breaker)
+            try:
+                result = fn(self.config(remaining))
+            except Exception as e:
+                error = self._failed(breaker, e)
+                if error is None:
+                    raise
+                attempt += 1
+                delay = self._retry_delay(error, attempt, deadline)
+                if delay is None:
+                    raise error from e
+                time.sleep(delay)
+                continue
+            breaker.record_success()
+            return result
+
+    async def _call_async(self, endpoint, model, fn):
+        deadline = time.monotonic() + self.deadline(endpoint)
+        breaker = self.breaker(model)
+        attempt = 0
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                self._count("timeouts")
+                raise UpstreamTimeout("The model did not answer in time.")
+            self._admit(breaker)
+            try:
+                result = await asyncio.wait_for(fn(self.config(remaining)), remaining)
+            except asyncio.CancelledError:
+                breaker.release()
+                raise
+            except Exception as e:
+                error = self._failed(breaker, e)
+                if error is None:
+                    raise
+                attempt += 1
+                delay = self._retry_delay(error, attempt, deadline)
+                if delay is None:
+                    raise error from e
+                await asyncio.sleep(delay)
+                continue
+            breaker.record_success()
+            return result
+
+    def stream(self, endpoint, model, open_stream):
+        # Streams get the deadline and the breaker but are never retried:
+        # part of the answer may already have reached the client.
+        with timed_llm_call(endpoint, model):
+            breaker = self.breaker(model)
+            self._admit(breaker)
+            finished = False
+            try:
+                for chunk in open_stream(self.config(self.deadline(endpoint))):
+                    yield chunk
+                finished = True
+            except Exception as e:
+                error = self._failed(breaker, e)
+                finished = True
+                if error is None:
+                    raise
+                raise error from e
+            finally:
+                if not finished:
+                    breaker.release()
+            breaker.record_success()
+
+    async def stream_async(self, endpoint, model, open_stream):
+        with timed_llm_call(endpoint, model):
+            breaker = self.breaker(model)
+            self._admit(breaker)
+            finished = False
+            try:
+                stream = await open_stream(self.config(self.deadline(endpoint)))
+                async for chunk in stream:
+                    yield chunk
+                finished = True
+            except Exception as e:
+                error = self._failed(breaker, e)
+                finished = True
+                if error is None:
+                    raise
+                raise error from e
+            finally:
+                if not finished:
+                    breaker.release()
+            breaker.record_success()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counters)
+            breakers = dict(self.breakers)
+        stats["circuits"] = {
+            str(model): breaker.stats() for model, breaker in breakers.items()
+        }
+        return stats
+
+
+resilience = Resilience(
+    deadlines={
+        "get-output": float(os.getenv("GENAI_DEADLINE_GET_OUTPUT", "30")),
+        "generate_code": float(os.getenv("GENAI_DEADLINE_GENERATE_CODE", "45")),
+        "refactor_code": float(os.getenv("GENAI_DEADLINE_REFACTOR_CODE", "60")),
+        "htmlcssjs-generate": float(os.getenv("GENAI_DEADLINE_HTMLCSSJS", "90")),
+        "htmlcssjs-refactor": float(os.getenv("GENAI_DEADLINE_HTMLCSSJS", "90")),
+    },
+    default_deadline=float(os.getenv("GENAI_DEADLINE_DEFAULT", "60")),
+    max_attempts=int(os.getenv("GENAI_RETRY_MAX_ATTEMPTS", "3")),
+    backoff_base=float(os.getenv("GENAI_RETRY_BACKOFF_BASE", "0.25")),
+    backoff_cap=float(os.getenv("GENAI_RETRY_BACKOFF_CAP", "4")),
+    failure_threshold=int(os.getenv("GENAI_CIRCUIT_FAILURE_THRESHOLD", "5")),
+    recovery_time=float(os.getenv("GENAI_CIRCUIT_RECOVERY_TIME", "30")),
+)
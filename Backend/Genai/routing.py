@@ -0,0 +1,360 @@
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from dotenv import load_dotenv
+
+from prompt_engine import estimate_tokens
+
+load_dotenv()
+
+# Input sizes, in estimated tokens, that latency is tracked separately for:
+# a 200 token prompt and a 20k token prompt do not share a p95.
+SIZE_BUCKETS = (1000, 4000, 16000)
+
+
+def size_bucket(tokens):
+    for limit in SIZE_BUCKETS:
+        if tokens <= limit:
+            return limit
+    return "large"
+
+
+def percentile(values, quantile):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(quantile * len(ordered)))]
+
+
+class LatencyTracker:
+    # Recent successful call latencies per (model, size bucket). Samples
+    # older than max_age are ignored so routing follows current conditions.
+    def __init__(self, window=200, max_age=300.0):
+        self.window = window
+        self.max_age = max_age
+        self._samples = {}
+        self._lock = threading.Lock()
+
+    def record(self, model, bucket, seconds):
+        with self._lock:
+            samples = self._samples.setdefault(
+                (model, bucket), deque(maxlen=self.window)
+            )
+            samples.append((time.monotonic(), seconds))
+
+    def recent(self, model, bucket):
+        cutoff = time.monotonic() - self.max_age
+        with self._lock:
+            samples = self._samples.get((model, bucket), ())
+            return [seconds for at, seconds in samples if at >= cutoff]
+
+    def stats(self):
+        with self._lock:
+            keys = list(self._samples)
+        stats = {}
+        for model, bucket in keys:
+            recent = self.recent(model, bucket)
+            if recent:
+                stats[f"{model}:{bucket}"] = {
+                    "samples": len(recent),
+                    "p50_ms": round(percentile(recent, 0.5) * 1000, 1),
+                    "p95_ms": round(percentile(recent, 0.95) * 1000, 1),
+                }
+        return stats
+
+
+class Route:
+    # The models picked for one call. call() and call_async() set answered_by
+    # to the model whose answer they returned, so results can be cached under
+    # the model that produced them.
+    def __init__(self, endpoint, primary, secondary, bucket, switched=False):
+        self.endpoint = endpoint
+        self.primary = primary
+        self.secondary = secondary
+        self.bucket = bucket
+        self.switched = switched
+        self.answered_by = None
+
+    @property
+    def model(self):
+        return self.answered_by or self.primary
+
+
+class ModelRouter:
+    # Picks a primary and a secondary model per call. The primary is the
+    # endpoint's usual model, or large_input_model for big inputs, unless the
+    # other model has recently been much faster for inputs of this size. If
+    # the primary fails, the secondary answers instead. With hedging, the
+    # same request also goes to the secondary once the primary has not
+    # answered by its recent p95, and the first answer wins; at most
+    # max_hedges hedges are in flight.
+    #
+    # A blocking call cannot be abandoned, so the sync path runs the primary
+    # on a pool of max_calls threads and the caller waits for either future;
+    # the loser finishes in the background and its answer is dropped. With
+    # every pool thread busy the call runs on the caller's thread, unhedged.
+    # On the async path the loser is cancelled.
+    def __init__(
+        self,
+        default_models,
+        endpoint_models=None,
+        large_input_tokens=0,
+        large_input_model=None,
+        hedging=True,
+        max_calls=32,
+        max_hedges=8,
+        hedge_quantile=0.95,
+        hedge_min_delay=1.0,
+        hedge_max_delay=30.0,
+        hedge_default_delay=10.0,
+        min_samples=20,
+        switch_ratio=0.7,
+        tracker=None,
+    ):
+        self.default_models = default_models
+        self.endpoint_models = endpoint_models or {}
+        self.large_input_tokens = large_input_tokens
+        self.large_input_model = large_input_model
+        self.hedging = hedging
+        self.max_calls = max_calls
+        self.max_hedges = max_hedges
+        self.hedge_quantile = hedge_quantile
+        self.hedge_min_delay = hedge_min_delay
+        self.hedge_max_delay = hedge_max_delay
+        self.hedge_default_delay = hedge_default_delay
+        self.min_samples = min_samples
+        self.switch_ratio = switch_ratio
+        self.latency = tracker or LatencyTracker()
+        self._call_slots = threading.BoundedSemaphore(max(1, max_calls))
+        self._calls = ThreadPoolExecutor(
+            max_workers=max(1, max_calls), thread_name_prefix="genai-call"
+        )
+        self._hedge_slots = threading.BoundedSemaphore(max(1, max_hedges))
+        self._executor = ThreadPoolExecutor(
+            max_workers=max(1, max_hedges), thread_name_prefix="genai-hedge"
+        )
+        self._lock = threading.Lock()
+        self.counters = {
+            "calls": 0,
+            "hedged": 0,
+            "hedges_shed": 0,
+            "unhedged": 0,
+            "hedge_wins": 0,
+            "fallbacks": 0,
+            "switched": 0,
+        }
+
+    def _count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    def route(self, endpoint, contents):
+        primary, secondary = self.endpoint_models.get(endpoint, self.default_models)
+        tokens = estimate_tokens(contents) if isinstance(contents, str) else 0
+        bucket = size_bucket(tokens)
+        switched = False
+
+        if (
+            self.large_input_tokens
+            and self.large_input_model
+            and tokens > self.large_input_tokens
+            and self.large_input_model != primary
+        ):
+            primary, secondary = self.large_input_model, primary
+
+        if secondary and secondary != primary:
+            ours = self.latency.recent(primary, bucket)
+            theirs = self.latency.recent(secondary, bucket)
+            if (
+                len(ours) >= self.min_samples
+                and len(theirs) >= self.min_samples
+                and percentile(theirs, 0.5) < percentile(ours, 0.5) * self.switch_ratio
+            ):
+                switched = True
+                primary, secondary = secondary, primary
+        else:
+            secondary = None
+        return Route(endpoint, primary, secondary, bucket, switched)
+
+    def hedge_delay(self, model, bucket):
+        recent = self.latency.recent(model, bucket)
+        if len(recent) < self.min_samples:
+            return self.hedge_default_delay
+        delay = percentile(recent, self.hedge_quantile)
+        return min(self.hedge_max_delay, max(self.hedge_min_delay, delay))
+
+    def _start(self, route):
+        self._count("calls")
+        if route.switched:
+            self._count("switched")
+
+    def _take_hedge_slot(self):
+        if self._hedge_slots.acquire(blocking=False):
+            self._count("hedged")
+            return True
+        self._count("hedges_shed")
+        return False
+
+    def _submit_hedge(self, fn, route):
+        if not self._take_hedge_slot():
+            return None
+        future = self._executor.submit(self._timed, fn, route.secondary, route.bucket)
+        future.add_done_callback(lambda _: self._hedge_slots.release())
+        return future
+
+    def _timed(self, fn, model, bucket):
+        started = time.perf_counter()
+        result = fn(model)
+        self.latency.record(model, bucket, time.perf_counter() - started)
+        return result
+
+    async def _timed_async(self, fn, model, bucket):
+        started = time.perf_counter()
+        result = await fn(model)
+        self.latency.record(model, bucket, time.perf_counter() - started)
+        return result
+
+    def call(self, route, fn):
+        # fn(model) makes the blocking model call and returns its result.
+        self._start(route)
+        if not self.hedging or route.secondary is None:
+            route.answered_by = route.primary
+            return self._timed(fn, route.primary, route.bucket)
+
+        if not self._call_slots.acquire(blocking=False):
+            self._count("unhedged")
+            return self._call_inline(route, fn)
+        first = self._calls.submit(self._timed, fn, route.primary, route.bucket)
+        first.add_done_callback(lambda _: self._call_slots.release())
+        models = {first: route.primary}
+        done, _ = wait({first}, timeout=self.hedge_delay(route.primary, route.bucket))
+        if not done:
+            second = self._submit_hedge(fn, route)
+            if second is not None:
+                models[second] = route.secondary
+
+        pending = set(models)
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is not first:
+                        self._count("hedge_wins")
+                    # Drops a hedge still queued; one already running
+                    # finishes in the background and its answer is ignored.
+                    for other in pending:
+                        other.cancel()
+                    route.answered_by = models[future]
+                    return future.result()
+
+        if len(models) > 1:
+            raise first.exception()
+        # No hedge went out before the primary failed: fall back.
+        return self._fall_back(route, fn, first.exception())
+
+    def _call_inline(self, route, fn):
+        try:
+            result = self._timed(fn, route.primary, route.bucket)
+        except Exception as error:
+            return self._fall_back(route, fn, error)
+        route.answered_by = route.primary
+        return result
+
+    def _fall_back(self, route, fn, error):
+        self._count("fallbacks")
+        try:
+            result = self._timed(fn, route.secondary, route.bucket)
+        except Exception:
+            raise error
+        route.answered_by = route.secondary
+        return result
+
+    async def call_async(self, route, fn):
+        # fn(model) is a coroutine function making the model call.
+        self._start(route)
+        if not self.hedging or route.secondary is None:
+            route.answered_by = route.primary
+            return await self._timed_async(fn, route.primary, route.bucket)
+
+        first = asyncio.ensure_future(
+            self._timed_async(fn, route.primary, route.bucket)
+        )
+        models = {first: route.primary}
+        try:
+            done, _ = await asyncio.wait(
+                {first}, timeout=self.hedge_delay(route.primary, route.bucket)
+            )
+            if not done and self._take_hedge_slot():
+                second = asyncio.ensure_future(
+                    self._timed_async(fn, route.secondary, route.bucket)
+                )
+                second.add_done_callback(lambda _: self._hedge_slots.release())
+                models[second] = route.secondary
+
+            error = None
+            pending = set(models)
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    if task.exception() is None:
+                        if task is not first:
+                            self._count("hedge_wins")
+                        route.answered_by = models[task]
+                        return task.result()
+                    error = error or task.exception()
+
+            if len(models) > 1:
+                raise error
+            # No hedge went out before the primary failed: fall back.
+            self._count("fallbacks")
+            try:
+                result = await self._timed_async(fn, route.secondary, route.bucket)
+            except Exception:
+                raise error
+            route.answered_by = route.secondary
+            return result
+        finally:
+            # Cancelling the losing task aborts its HTTP request.
+            for task in models:
+                task.cancel()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counters)
+        stats["latency"] = self.latency.stats()
+        return stats
+
+
+def _enabled(name, default):
+    return os.getenv(name, default).lower() in ("1", "true", "yes")
+
+
+gemini_model = os.getenv("GEMINI_MODEL")
+gemini_model_1 = os.getenv("GEMINI_MODEL_1")
+
+model_router = ModelRouter(
+    default_models=(gemini_model, gemini_model_1),
+    endpoint_models={
+        "htmlcssjs-generate": (gemini_model_1, gemini_model),
+        "htmlcssjs-refactor": (gemini_model_1, gemini_model),
+    },
+    large_input_tokens=int(os.getenv("GENAI_ROUTER_LARGE_INPUT_TOKENS", "0")),
+    large_input_model=os.getenv("GENAI_ROUTER_LARGE_INPUT_MODEL", gemini_model_1),
+    hedging=_enabled("GENAI_HEDGING_ENABLED", "true"),
+    max_calls=int(os.getenv("GENAI_ROUTER_MAX_CALLS", "32")),
+    max_hedges=int(os.getenv("GENAI_HEDGE_MAX_IN_FLIGHT", "8")),
+    hedge_quantile=float(os.getenv("GENAI_HEDGE_QUANTILE", "0.95")),
+    hedge_min_delay=float(os.getenv("GENAI_HEDGE_MIN_DELAY", "1")),
+    hedge_max_delay=float(os.getenv("GENAI_HEDGE_MAX_DELAY", "30")),
+    hedge_default_delay=float(os.getenv("GENAI_HEDGE_DEFAULT_DELAY", "10")),
+    min_samples=int(os.getenv("GENAI_ROUTER_MIN_SAMPLES", "20")),
+    switch_ratio=float(os.getenv("GENAI_ROUTER_SWITCH_RATIO", "0.7")),
+    tracker=LatencyTracker(
+        window=int(os.getenv("GENAI_ROUTER_WINDOW", "200")),
+        max_age=float(os.getenv("GENAI_ROUTER_MAX_AGE", "300")),
+    ),
+)
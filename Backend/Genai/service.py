@@ -0,0 +1,206 @@
+import math
+import os
+
+import absl.logging
+from dotenv import load_dotenv
+
+from cache import result_cache
+from chunked_refactor import chunked_refactor
+from client_pool import pool as client_pool
+from compaction import compact_for_run, compaction_stats
+from executor import local_executor, local_execution_enabled
+from near_duplicate import near_duplicates
+from precheck import precheck
+from prompt_engine import prompt_budget, token_usage
+from prompts import (
+    css_prompt,
+    generate_code_prompt,
+    html_prompt,
+    js_prompt,
+    languages_prompts,
+    refactor_code_prompt,
+    refactor_css_prompt,
+    refactor_html_prompt,
+    refactor_js_prompt,
+)
+from rate_limit import rate_limiter
+from refactor_session import refactor_sessions
+from resilience import resilience
+from routing import model_router
+from singleflight import flight
+
+# What app.py (Flask) and asgi.py (Quart) share: supported languages, request
+# validation, prompt building and cache keys; models are configured in
+# routing.py. Nothing here blocks on I/O, so both serving modes call it
+# directly.
+
+os.environ["GRPC_VERBOSITY"] = "NONE"
+
+absl.logging.set_verbosity(absl.logging.ERROR)
+
+try:
+    load_dotenv()
+except Exception as e:
+    print(f"Error loading environment variables: {e}")
+
+valid_languages = {
+    "python",
+    "javascript",
+    "rust",
+    "mongodb",
+    "swift",
+    "ruby",
+    "dart",
+    "perl",
+    "scala",
+    "julia",
+    "go",
+    "java",
+    "cpp",
+    "csharp",
+    "c",
+    "sql",
+    "typescript",
+    "kotlin",
+    "verilog",
+}
+
+UNSUPPORTED_LANGUAGE = "Unsupported language."
+UNSUPPORTED_RUN_LANGUAGE = "Language not supported."
+
+PAGE_TYPES = ("html", "css", "js", "all")
+
+# Language of the code block each page stage answers with.
+page_languages = {"html": "html", "css": "css", "js": "javascript"}
+
+# type: (prompt, request fields sent, fields required); the field named by
+# the type is the one refactored.
+page_refactors = {
+    "html": (refactor_html_prompt, ("html",), ("html",)),
+    "css": (refactor_css_prompt, ("html", "css"), ("html",)),
+    "js": (refactor_js_prompt, ("html", "css", "js"), ("html", "css")),
+}
+
+
+def start():
+    # Background work each serving process needs once.
+    client_pool.start_health_checks()
+    if local_execution_enabled:
+        local_executor.prewarm()
+
+
+def cache_key(endpoint, language, code, model):
+    # Results are cached per model: looked up under the model a request is
+    # routed to and stored under the one that answered, route.model.
+    return result_cache.key(endpoint, language, model, code)
+
+
+def cacheable(result):
+    return bool(result) and not result.startswith("Error:")
+
+
+def generate_prompt(problem_description, language):
+    return prompt_budget.render(
+        "generate_code",
+        generate_code_prompt,
+        problem_description=problem_description,
+        language=language,
+    )
+
+
+def run_prompt(code, language):
+    return prompt_budget.render(
+        "get-output",
+        languages_prompts[language],
+        code=compact_for_run(code, language),
+    )
+
+
+def refactor_prompt(code, language, template=refactor_code_prompt):
+    return prompt_budget.render("refactor_code", template, code=code, language=language)
+
+
+def page_prompt(stage, project_description, html_content="", css_content=""):
+    if stage == "html":
+        return prompt_budget.render(
+            "htmlcssjs-generate", html_prompt, prompt=project_description
+        )
+    if stage == "css":
+        return prompt_budget.render(
+            "htmlcssjs-generate",
+            css_prompt,
+            html_content=html_content,
+            project_description=project_description,
+        )
+    return prompt_budget.render(
+        "htmlcssjs-generate",
+        js_prompt,
+        html_content=html_content,
+        css_content=css_content,
+        project_description=project_description,
+    )
+
+
+def page_refactor_prompt(prompt, params):
+    return prompt_budget.render("htmlcssjs-refactor", prompt, **params)
+
+
+def page_request(data):
+    # (project description, type, HTML, CSS) of a /htmlcssjsgenerate-code
+    # request; raises ValueError when it is invalid.
+    project_description = data.get("prompt")
+    code_type = data.get("type")
+    if not project_description:
+        raise ValueError("Project description is required")
+    if not code_type or code_type not in PAGE_TYPES:
+        raise ValueError("Invalid or missing 'type' parameter")
+    return (
+        project_description,
+        code_type,
+        data.get("htmlContent", "") or "",
+        data.get("cssContent", "") or "",
+    )
+
+
+def page_refactor_request(data):
+    # (type, prompt, prompt params, language) of a /htmlcssjsrefactor-code
+    # request; raises ValueError when it is invalid.
+    code_type = data.get("type")
+    if not code_type:
+        raise ValueError("Type is required.")
+    contents = {name: data.get(name, "") or "" for name in page_languages}
+    if code_type not in page_refactors or not all(
+        contents[name] for name in page_refactors[code_type][2]
+    ):
+        raise ValueError(
+            "Please provide the appropriate content for the requested type."
+        )
+    prompt, fields, _ = page_refactors[code_type]
+    params = {f"{name}_content": contents[name] for name in fields}
+    return code_type, prompt, params, page_languages[code_type]
+
+
+def retry_headers(e):
+    if e.retry_after is None:
+        return {}
+    return {"Retry-After": str(max(1, math.ceil(e.retry_after)))}
+
+
+def health_status(admission_queue):
+    pool_stats = client_pool.stats()
+    status = 503 if pool_stats["last_health_error"] else 200
+    return {
+        "client_pool": pool_stats,
+        "cache": result_cache.stats(),
+        "singleflight": flight.stats(),
+        "token_usage": token_usage.stats(),
+        "compaction": compaction_stats.stats(),
+        "near_duplicates": near_duplicates.stats(),
+        "refactor_sessions": refactor_sessions.stats(),
+        "chunked_refactor": chunked_refactor.stats(),
+        "precheck": precheck.stats(),
+        "routing": model_router.stats(),
+        "resilience": resilience.stats(),
+        "rate_limit": rate_limiter.stats(),
+        "admission": admission_queue.stats(),
+    }, status
@@ -0,0 +1,110 @@
+import asyncio
+import os
+import threading
+
+from dotenv import load_dotenv
+
+from resilience import UpstreamTimeout, resilience
+
+load_dotenv()
+
+
+class SingleFlightTimeout(UpstreamTimeout):
+    # Surfaces like the model timing out, since that is what kept the
+    # identical request from answering in time.
+    pass
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    # Concurrent callers asking for the same key share one execution of the
+    # work: the first caller runs it and the rest wait for its result or error.
+    def __init__(self, timeout=60.0):
+        self.timeout = timeout
+        self._calls = {}
+        self._async_calls = {}
+        self._lock = threading.Lock()
+        self.counters = {"executed": 0, "shared": 0, "timeouts": 0}
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.counters["executed"] += 1
+            else:
+                self.counters["shared"] += 1
+
+        if leader:
+            try:
+                call.result = fn()
+            except BaseException as e:
+                call.error = e
+                raise
+            finally:
+                with self._lock:
+                    del self._calls[key]
+                call.done.set()
+            return call.result
+
+        if not call.done.wait(self.timeout):
+            with self._lock:
+                self.counters["timeouts"] += 1
+            raise SingleFlightTimeout(
+                f"Timed out after {self.timeout}s waiting for an identical request."
+            )
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    async def do_async(self, key, fn):
+        future = self._async_calls.get(key)
+        if future is None:
+            future = asyncio.ensure_future(fn())
+            self._async_calls[key] = future
+            future.add_done_callback(lambda f: self._finish_async(key, f))
+            self.counters["executed"] += 1
+        else:
+            self.counters["shared"] += 1
+
+        try:
+            # Shielded so that one waiter giving up does not cancel the call
+            # for everybody else.
+            return await asyncio.wait_for(asyncio.shield(future), self.timeout)
+        except asyncio.TimeoutError:
+            self.counters["timeouts"] += 1
+            raise SingleFlightTimeout(
+                f"Timed out after {self.timeout}s waiting for an identical request."
+            )
+
+    def _finish_async(self, key, future):
+        if self._async_calls.get(key) is future:
+            del self._async_calls[key]
+        if not future.cancelled():
+            # Mark the error as retrieved even when every waiter timed out.
+            future.exception()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counters)
+            stats["in_flight"] = len(self._calls) + len(self._async_calls)
+        return stats
+
+
+def _default_timeout():
+    # Waiters outlast the leader: its call may time out on one model and
+    # then fall back to the other, each attempt with its own deadline.
+    longest = max([resilience.default_deadline, *resilience.deadlines.values()])
+    return 2 * longest + 10
+
+
+flight = SingleFlight(
+    timeout=float(os.getenv("GENAI_SINGLEFLIGHT_TIMEOUT", _default_timeout()))
+)
@@ -0,0 +1,242 @@
+import json
+import re
+
+FENCE = "```"
+
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "X-Accel-Buffering": "no",
+}
+
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+FENCE_LINE = re.compile(r"[ \t]*(`{3,})[ \t]*(\n?)$")
+NESTED_OPEN = re.compile(r"[ \t]*`{3,}[\w+#.-]+[ \t]*\n?$")
+FENCE_PREFIX = re.compile(r"[ \t]*(?:`{1,2}|`{3,}[\w+#.-]*)?$")
+OPENING = re.compile(r"`{3,}")
+TAG = re.compile(r"[ \t]*([\w+#.-]*)[ \t]*\n?$")
+TRAILING_TICKS = re.compile(r"`+$")
+
+# Tags models use interchangeably for the same language.
+language_aliases = {
+    "js": "javascript",
+    "jsx": "javascript",
+    "ts": "typescript",
+    "py": "python",
+    "python3": "python",
+    "c++": "cpp",
+    "cs": "csharp",
+    "c#": "csharp",
+    "rs": "rust",
+    "kt": "kotlin",
+    "rb": "ruby",
+    "jl": "julia",
+    "htm": "html",
+}
+
+
+def normalize_language(tag):
+    tag = (tag or "").lower()
+    return language_aliases.get(tag, tag)
+
+
+class CodeBlock:
+    def __init__(self, language, fence):
+        self.language = language
+        self.fence = fence
+        self.parts = []
+        self.closed = False
+
+    @property
+    def code(self):
+        return "".join(self.parts)
+
+
+class CodeFenceExtractor:
+    # Incremental ``` fence parser. Text is consumed line by line exactly
+    # once; code of the first block is emitted as soon as it arrives, holding
+    # back only what could still turn out to be a fence. Every block is kept
+    # in self.blocks with its language tag. Inside a ``` block, a tagged
+    # fence line opens a nested block that the next bare fence closes, and a
+    # longer opening fence (````) is only closed by a fence at least as long.
+    # A response cut off inside a block keeps the code that did arrive.
+    def __init__(self):
+        self.blocks = []
+        self.pending = []
+        self.depth = 0
+        self.mid_line = False
+
+    @property
+    def current(self):
+        if self.blocks and not self.blocks[-1].closed:
+            return self.blocks[-1]
+        return None
+
+    def feed(self, text):
+        emitted = []
+        start = 0
+        while True:
+            if not self.pending and not self.mid_line:
+                # Only lines containing a backtick can open or close a
+                # fence; everything before the next one moves in one slice.
+                tick = text.find("`", start)
+                skip_to = text.rfind("\n", start, len(text) if tick == -1 else tick)
+                if skip_to != -1:
+                    block = self.current
+                    if block is not None:
+                        self._emit(block, text[start : skip_to + 1], emitted)
+                    start = skip_to + 1
+            newline = text.find("\n", start)
+            if newline == -1:
+                break
+            self.pending.append(text[start : newline + 1])
+            line = "".join(self.pending)
+            self.pending = []
+            self._line(line, emitted)
+            start = newline + 1
+        if start < len(text):
+            self.pending.append(text[start:])
+            self._partial(emitted)
+        return "".join(emitted)
+
+    def close(self):
+        emitted = []
+        if self.pending:
+            line = "".join(self.pending)
+            self.pending = []
+            self._line(line, emitted)
+        return "".join(emitted)
+
+    def _emit(self, block, text, emitted):
+        if text:
+            block.parts.append(text)
+            if block is self.blocks[0]:
+                emitted.append(text)
+
+    def _partial(self, emitted):
+        # Flush as much of an unfinished line as cannot be part of a fence.
+        block = self.current
+        if block is None:
+            return
+        line = "".join(self.pending)
+        if not self.mid_line and FENCE_PREFIX.match(line):
+            self.pending = [line]
+            return
+        ticks = TRAILING_TICKS.search(line)
+        cut = ticks.start() if ticks else len(line)
+        self._emit(block, line[:cut], emitted)
+        self.pending = [line[cut:]] if cut < len(line) else []
+        self.mid_line = True
+
+    def _line(self, line, emitted):
+        block = self.current
+        at_line_start = not self.mid_line
+        self.mid_line = False
+        if block is None:
+            self._outside(line, emitted)
+            return
+
+        fence = FENCE_LINE.match(line) if at_line_start else None
+        if fence and len(fence.group(1)) >= len(block.fence):
+            if self.depth == 0:
+                block.closed = True
+                return
+            self.depth -= 1
+        elif at_line_start and len(block.fence) == 3 and NESTED_OPEN.match(line):
+            self.depth += 1
+        elif self.depth == 0:
+            # Models often close the fence at the end of the last code line.
+            body = line.rstrip("\n").rstrip(" \t")
+            ticks = TRAILING_TICKS.search(body)
+            if ticks and len(ticks.group(0)) >= len(block.fence):
+                self._emit(block, body[: ticks.start()], emitted)
+                block.closed = True
+                return
+        self._emit(block, line, emitted)
+
+    def _outside(self, line, emitted):
+        opening = OPENING.search(line)
+        if opening is None:
+            return
+        fence = opening.group(0)
+        rest = line[opening.end() :]
+        tag = TAG.match(rest)
+        if tag:
+            self.blocks.append(CodeBlock(normalize_language(tag.group(1)), fence))
+            self.depth = 0
+            return
+
+        # No tag: the rest of the line is already code, possibly a whole
+        # one-line block.
+        block = CodeBlock("", fence)
+        self.blocks.append(block)
+        self.depth = 0
+        closing = rest.find(fence)
+        if closing == -1:
+            self._emit(block, rest, emitted)
+            return
+        self._emit(block, rest[:closing], emitted)
+        block.closed = True
+        self._outside(rest[closing + len(fence) :], emitted)
+
+    def code(self, language=None):
+        # The first block in the requested language, else the first block.
+        if not self.blocks:
+            return None
+        if language:
+            wanted = normalize_language(language)
+            for block in self.blocks:
+                if block.language == wanted:
+                    return block.code
+        return self.blocks[0].code
+
+    @property
+    def result(self):
+        return self.code()
+
+
+def extract_code(text, language=None):
+    extractor = CodeFenceExtractor()
+    extractor.feed(text)
+    extractor.close()
+    return extractor.code(language)
+
+
+class ResultStream:
+    # SSE framing of one streamed result: a chunk event per piece of text,
+    # with the code fence stripped when extract is set, then a done event
+    # carrying the whole result under `field`. self.text is what gets cached.
+    def __init__(self, field, extract):
+        self.field = field
+        self.extract = extract
+        self.extractor = CodeFenceExtractor() if extract else None
+        self.parts = []
+        self.text = ""
+
+    def replay(self, text):
+        # A finished result, from the cache or not from a model at all.
+        result = extract_code(text) if self.extract else text
+        return sse_event("chunk", {"text": result or ""}) + sse_event(
+            "done", {self.field: result}
+        )
+
+    def feed(self, text):
+        self.parts.append(text)
+        if self.extractor:
+            text = self.extractor.feed(text)
+        return sse_event("chunk", {"text": text}) if text else ""
+
+    def close(self):
+        events = ""
+        if self.extractor:
+            tail = self.extractor.close()
+            if tail:
+                events = sse_event("chunk", {"text": tail})
+        self.text = "".join(self.parts)
+        if self.extract:
+            self.text = self.text.strip()
+        result = self.extractor.result if self.extractor else self.text
+        return events + sse_event("done", {self.field: result})
@@ -1,10 +1,21 @@
-from flask import Flask, request, jsonify, render_template
+from flask import Flask, Response, g, request, jsonify, render_template
 from flask_cors import CORS
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+)
 import redis
+import hashlib
 import os
+import queue
+import time
 import uuid
-import json
-from datetime import datetime, timedelta
+import records
+from link_cache import link_cache
+from datetime import datetime, timedelta, timezone
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -12,20 +23,252 @@ load_dotenv()
 app = Flask(__name__)
 CORS(app)
 
+request_latency = Histogram(
+    "tempfile_request_duration_seconds",
+    "Time to serve a request.",
+    ["route", "method", "status"],
+)
+requests_in_flight = Gauge(
+    "tempfile_requests_in_flight", "Requests currently being served.", ["route"]
+)
+errors = Counter("tempfile_errors_total", "Failed requests by error type.", ["type"])
+redis_latency = Histogram(
+    "tempfile_redis_command_duration_seconds",
+    "Latency of Redis commands.",
+    ["command"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1),
+)
+redis_pool_wait = Histogram(
+    "tempfile_redis_pool_wait_seconds",
+    "Time spent waiting for a free Redis connection.",
+    buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1),
+)
+redis_pool_exhausted = Counter(
+    "tempfile_redis_pool_exhausted_total",
+    "Requests that found no free Redis connection within the pool timeout.",
+)
+redis_pool_available = Gauge(
+    "tempfile_redis_pool_available",
+    "Redis connections that could be handed out right now.",
+)
+link_cache_lookups = Counter(
+    "tempfile_link_cache_lookups_total",
+    "get_file lookups in the in-process link cache.",
+    ["result"],
+)
+link_cache_entries = Gauge(
+    "tempfile_link_cache_entries", "Links held in the in-process link cache."
+)
+
+
+def timed_redis(command):
+    return redis_latency.labels(command).time()
+
+
+class MeteredQueue(queue.LifoQueue):
+    # The queue BlockingConnectionPool hands connections out of; a get that
+    # times out is the pool running dry.
+    def get(self, block=True, timeout=None):
+        with redis_pool_wait.time():
+            try:
+                return super().get(block, timeout)
+            except queue.Empty:
+                redis_pool_exhausted.inc()
+                raise
+
+
+# One pool per process, shared by every request thread. A request waits at
+# most REDIS_POOL_TIMEOUT for a free connection, and connecting or reading
+# gives up after the socket timeouts, so an unreachable Redis fails requests
+# quickly instead of hanging them. Idle connections are pinged before reuse
+# once they have been idle for REDIS_HEALTH_CHECK_INTERVAL seconds.
+redis_pool = redis.BlockingConnectionPool(
+    max_connections=int(os.getenv("REDIS_MAX_CONNECTIONS", "20")),
+    timeout=float(os.getenv("REDIS_POOL_TIMEOUT", "1")),
+    queue_class=MeteredQueue,
+    connection_class=(
+        redis.SSLConnection
+        if os.getenv("REDIS_SSL", "true").lower() in ("1", "true", "yes")
+        else redis.Connection
+    ),
+    host=os.getenv("REDIS_HOST"),
+    port=int(os.getenv("REDIS_PORT", "6379")),
+    password=os.getenv("REDIS_PASSWORD"),
+    socket_timeout=float(os.getenv("REDIS_SOCKET_TIMEOUT", "2")),
+    socket_connect_timeout=float(os.getenv("REDIS_CONNECT_TIMEOUT", "1")),
+    health_check_interval=int(os.getenv("REDIS_HEALTH_CHECK_INTERVAL", "30")),
+)
+redis_pool_available.set_function(lambda: redis_pool.pool.qsize())
+redis_client = redis.StrictRedis(connection_pool=redis_pool)
+link_cache_entries.set_function(lambda: len(link_cache))
+
+
+@app.before_request
+def start_request_metrics():
+    g.route = request.url_rule.rule if request.url_rule else "unmatched"
+    g.request_started = time.perf_counter()
+    requests_in_flight.labels(g.route).inc()
+
+
+@app.after_request
+def finish_request_metrics(response):
+    started = g.pop("request_started", None)
+    if started is not None:
+        status = response.status_code
+        if status >= 400:
+            errors.labels(g.pop("error_type", f"http_{status}")).inc()
+        request_latency.labels(g.route, request.method, status).observe(
+            time.perf_counter() - started
+        )
+        requests_in_flight.labels(g.route).dec()
+    return response
 
-def get_redis_connection():
-    try:
-        redis_client = redis.StrictRedis(
-            host=os.getenv("REDIS_HOST"),
-            port=int(os.getenv("REDIS_PORT")),
-            password=os.getenv("REDIS_PASSWORD"),
-            ssl=True,
+
+@app.teardown_request
+def abort_request_metrics(error=None):
+    started = g.pop("request_started", None)
+    if started is not None:
+        errors.labels(type(error).__name__ if error else "unhandled").inc()
+        request_latency.labels(g.route, request.method, 500).observe(
+            time.perf_counter() - started
+        )
+        requests_in_flight.labels(g.route).dec()
+
+
+EXPIRY_FORMAT = "%Y-%m-%d %H:%M:%S UTC"
+
+# Shared code is stored once per content. A share link
+# (file:{language}-{uuid}:data) holds the title, the expiry shown to users
+# and the hash of a blob (blob:{sha256}) with the code itself, both as
+# records.py records. Each blob
+# keeps a sorted set of the links pointing at it, scored by when they
+# expire, and always expires with the last of them. The scripts below keep
+# that true under concurrent uploads and deletes, and each is one round
+# trip. Links written before blobs existed hold the whole payload, and
+# links and blobs from before the binary records are JSON; both are still
+# read and deleted as they are. The scripts touch blob keys they
+# compute themselves, so they need a single Redis instance, not a cluster.
+STORE_SCRIPT = """
+local now = redis.call("TIME")
+local now_ms = now[1] * 1000 + math.floor(now[2] / 1000)
+redis.call("SET", KEYS[1], ARGV[1], "PX", ARGV[3])
+redis.call("SET", KEYS[2], ARGV[2], "NX")
+redis.call("ZADD", KEYS[3], now_ms + tonumber(ARGV[3]), KEYS[1])
+redis.call("ZREMRANGEBYSCORE", KEYS[3], "-inf", now_ms)
+local latest = redis.call("ZRANGE", KEYS[3], -1, -1, "WITHSCORES")[2]
+redis.call("PEXPIREAT", KEYS[2], latest)
+redis.call("PEXPIREAT", KEYS[3], latest)
+return 1
+"""
+
+# The blob hash of a link: hex from bytes 2-33 of a binary record, or the
+# "blob" field of a JSON one.
+BLOB_OF = """
+local function blob_of(link)
+    if link:byte(1) == 1 then
+        return (link:sub(2, 33):gsub(".", function(c)
+            return string.format("%02x", c:byte())
+        end))
+    end
+    local ok, meta = pcall(cjson.decode, link)
+    if ok and type(meta) == "table" and type(meta.blob) == "string" then
+        return meta.blob
+    end
+end
+"""
+
+READ_SCRIPT = BLOB_OF + """
+local link = redis.call("GET", KEYS[1])
+local ttl = redis.call("PTTL", KEYS[1])
+if not link then
+    return {ttl}
+end
+local digest = blob_of(link)
+if digest then
+    return {ttl, link, redis.call("GET", "blob:" .. digest)}
+end
+return {ttl, link}
+"""
+
+DELETE_SCRIPT = BLOB_OF + """
+local link = redis.call("GET", KEYS[1])
+if not link then
+    return 0
+end
+redis.call("DEL", KEYS[1])
+local digest = blob_of(link)
+if not digest then
+    return 1
+end
+local blob = "blob:" .. digest
+local links = blob .. ":links"
+local now = redis.call("TIME")
+redis.call("ZREM", links, KEYS[1])
+redis.call("ZREMRANGEBYSCORE", links, "-inf", now[1] * 1000 + math.floor(now[2] / 1000))
+local latest = redis.call("ZRANGE", links, -1, -1, "WITHSCORES")[2]
+if latest then
+    redis.call("PEXPIREAT", blob, latest)
+    redis.call("PEXPIREAT", links, latest)
+else
+    redis.call("DEL", blob, links)
+end
+return 1
+"""
+
+store_script = redis_client.register_script(STORE_SCRIPT)
+read_script = redis_client.register_script(READ_SCRIPT)
+delete_script = redis_client.register_script(DELETE_SCRIPT)
+
+
+def blob_keys(language, code):
+    # Same code in another language is another blob, since only the link
+    # key records the language.
+    digest = hashlib.sha256(f"{language}\0{code}".encode("utf-8")).hexdigest()
+    return digest, records.encode_blob(code)
+
+
+def store_file(file_key, title, code, language, expiry_time, ttl_seconds):
+    digest, blob = blob_keys(language, code)
+    expires_at = int(expiry_time.replace(tzinfo=timezone.utc).timestamp())
+    link = records.encode_link(digest, expires_at, title)
+    with timed_redis("store"):
+        store_script(
+            keys=[file_key, f"blob:{digest}", f"blob:{digest}:links"],
+            args=[link, blob, ttl_seconds * 1000],
+            client=redis_client,
         )
-        redis_client.ping()
-        return redis_client
-    except redis.ConnectionError as e:
-        app.logger.error(f"Redis connection error: {e}")
-        return None
+
+
+def read_file(file_key):
+    # The link, its PTTL and its blob in one round trip. Returns (payload or
+    # None, ttl in milliseconds).
+    with timed_redis("read"):
+        result = read_script(keys=[file_key], client=redis_client)
+    ttl = result[0]
+    if len(result) < 2:
+        return None, ttl
+    digest, expiry_time, title, legacy = records.decode_link(result[1])
+    if legacy is not None:
+        return legacy, ttl
+    # A link whose blob is gone (evicted, say) is as good as missing.
+    if len(result) < 3 or result[2] is None:
+        return None, ttl
+    if isinstance(expiry_time, int):
+        expiry_time = datetime.fromtimestamp(expiry_time, timezone.utc).strftime(
+            EXPIRY_FORMAT
+        )
+    return {
+        "title": title,
+        "code": records.decode_blob(result[2]),
+        "language": file_key[len("file:") :].split("-", 1)[0],
+        "expiry_time": expiry_time,
+    }, ttl
+
+
+def remove_file(file_key):
+    # Deletes the link and shortens or drops its blob. True if it existed.
+    with timed_redis("delete"):
+        return bool(delete_script(keys=[file_key], client=redis_client))
 
 
 TEMP_FILE_URL = os.getenv("TEMP_FILE_URL")
@@ -38,10 +281,6 @@ def index():
 
 @app.route("/temp-file-upload", methods=["POST"])
 def upload_file():
-    redis_client = get_redis_connection()
-    if not redis_client:
-        return jsonify({"error": "Failed to connect to Redis"}), 503
-
     try:
         data = request.get_json()
 
@@ -74,21 +313,17 @@ def upload_file():
 
         current_time = datetime.utcnow()
         expiry_time = current_time + timedelta(minutes=expiry_time_minutes)
-        formatted_expiry_time = expiry_time.strftime("%Y-%m-%d %H:%M:%S UTC")
+        formatted_expiry_time = expiry_time.strftime(EXPIRY_FORMAT)
 
         file_id = str(uuid.uuid4())
 
-        file_data = {
-            "title": title,
-            "code": code,
-            "language": language,
-            "expiry_time": formatted_expiry_time,
-        }
-
-        redis_client.set(
+        store_file(
             f"file:{language}-{file_id}:data",
-            json.dumps(file_data),
-            ex=expiry_time_minutes * 60,
+            title,
+            code,
+            language,
+            expiry_time,
+            expiry_time_minutes * 60,
         )
 
         file_url = f"{TEMP_FILE_URL}/file/{language}-{file_id}"
@@ -101,83 +336,99 @@ def upload_file():
             }
         )
 
+    except (redis.ConnectionError, redis.TimeoutError) as e:
+        app.logger.error(f"Redis unavailable during file upload: {e}")
+        g.error_type = "redis_unavailable"
+        return jsonify({"error": "Failed to connect to Redis"}), 503
+
     except redis.RedisError as e:
         app.logger.error(f"Redis error during file upload: {e}")
+        g.error_type = "redis_error"
         return jsonify({"error": "Failed to store code in Redis"}), 500
 
     except Exception as e:
         app.logger.error(f"Unexpected error during file upload: {e}")
+        g.error_type = type(e).__name__
         return jsonify({"error": "An unexpected error occurred"}), 500
 
-    finally:
-        redis_client.close()
-
 
 @app.route("/file/<file_id>", methods=["GET"])
 def get_file(file_id):
-    redis_client = get_redis_connection()
-    if not redis_client:
-        return jsonify({"error": "Failed to connect to Redis"}), 503
-
     try:
         language, file_id = file_id.split("-", 1)
 
         file_key = f"file:{language}-{file_id}:data"
-        file_data = redis_client.get(file_key)
-
-        ttl = redis_client.ttl(file_key)
-
-        if ttl == -2:
-            return jsonify({"error": "File not found"}), 404
-        elif ttl == -1 or ttl == 0:
-            return jsonify({"error": "File has expired"}), 410
-
-        if file_data:
-            file_data = json.loads(file_data)
-            return jsonify(file_data), 200
-
-        return jsonify({"error": "File not found"}), 404
+        entry = link_cache.get(file_key)
+        link_cache_lookups.labels("hit" if entry else "miss").inc()
+        if entry is None:
+            file_data, ttl = read_file(file_key)
+
+            if ttl == -2:
+                return jsonify({"error": "File not found"}), 404
+            elif ttl == -1 or ttl == 0:
+                return jsonify({"error": "File has expired"}), 410
+
+            if not file_data:
+                return jsonify({"error": "File not found"}), 404
+
+            entry = link_cache.set(file_key, jsonify(file_data).get_data(), ttl)
+
+        # Browsers and CDNs may keep the response until the link expires, and
+        # revalidate it with If-None-Match for a 304.
+        response = Response(entry.body, mimetype="application/json")
+        response.set_etag(entry.etag)
+        response.cache_control.public = True
+        response.cache_control.max_age = entry.max_age()
+        return response.make_conditional(request)
+
+    except (redis.ConnectionError, redis.TimeoutError) as e:
+        app.logger.error(f"Redis unavailable during file retrieval: {e}")
+        g.error_type = "redis_unavailable"
+        return jsonify({"error": "Failed to connect to Redis"}), 503
 
     except redis.RedisError as e:
         app.logger.error(f"Redis error during file retrieval: {e}")
+        g.error_type = "redis_error"
         return jsonify({"error": "Failed to retrieve code from Redis"}), 500
 
     except Exception as e:
         app.logger.error(f"Unexpected error during file retrieval: {e}")
+        g.error_type = type(e).__name__
         return jsonify({"error": "An unexpected error occurred"}), 500
 
-    finally:
-        redis_client.close()
-
 
 @app.route("/file/<file_id>/delete", methods=["DELETE"])
 def delete_file(file_id):
-    redis_client = get_redis_connection()
-    if not redis_client:
-        return jsonify({"error": "Failed to connect to Redis"}), 503
-
     try:
         language, file_id = file_id.split("-", 1)
 
         file_key = f"file:{language}-{file_id}:data"
-        file_data = redis_client.get(file_key)
-
-        if file_data:
-            redis_client.delete(file_key)
+        removed = remove_file(file_key)
+        link_cache.discard(file_key)
+        if removed:
             return jsonify({"message": "File deleted successfully"}), 200
         else:
             return jsonify({"error": "File not found"}), 404
 
+    except (redis.ConnectionError, redis.TimeoutError) as e:
+        app.logger.error(f"Redis unavailable during file deletion: {e}")
+        g.error_type = "redis_unavailable"
+        return jsonify({"error": "Failed to connect to Redis"}), 503
+
     except redis.RedisError as e:
         app.logger.error(f"Redis error during file deletion: {e}")
+        g.error_type = "redis_error"
         return jsonify({"error": "Failed to delete file from Redis"}), 500
 
     except Exception as e:
         app.logger.error(f"Unexpected error during file deletion: {e}")
+        g.error_type = type(e).__name__
         return jsonify({"error": "An unexpected error occurred"}), 500
 
-    finally:
-        redis_client.close()
+
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    return Response(generate_latest(), content_type=CONTENT_TYPE_LATEST)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,149 @@
+import argparse
+import json
+import os
+import random
+import sys
+import uuid
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+os.environ.setdefault("REDIS_HOST", "localhost")
+os.environ.setdefault("REDIS_PORT", "6379")
+os.environ.setdefault("REDIS_SSL", "false")
+
+import app
+
+SAMPLES_DIR = os.path.join(
+    os.path.dirname(__file__), "..", "..", "..", "Frontend", "src", "samples"
+)
+
+# Sample file extensions mapped to the language names the editor uses.
+sample_languages = {
+    ".c": "c",
+    ".cpp": "cpp",
+    ".cs": "csharp",
+    ".go": "go",
+    ".java": "java",
+    ".js": "javascript",
+    ".kt": "kotlin",
+    ".py": "python",
+    ".rb": "ruby",
+    ".rs": "rust",
+    ".ts": "typescript",
+}
+
+EXPIRY_MINUTES = (10, 30, 60, 1440, 10080)
+# The expiry shown on every link; the keys themselves expire per upload.
+EXPIRES = datetime(2030, 1, 1)
+
+
+def load_samples():
+    samples = []
+    for name in sorted(os.listdir(SAMPLES_DIR)):
+        language = sample_languages.get(os.path.splitext(name)[1])
+        if language:
+            with open(os.path.join(SAMPLES_DIR, name), encoding="utf-8") as f:
+                samples.append((language, f.read()))
+    return samples
+
+
+def trace(samples, classes, students, edit_rate, solo, seed):
+    # Uploads from classes where everyone shares the sample they were given,
+    # a fraction after editing it, plus people sharing their own code.
+    rng = random.Random(seed)
+    uploads = []
+    for class_number in range(classes):
+        language, code = rng.choice(samples)
+        expiry = rng.choice(EXPIRY_MINUTES)
+        for student in range(students):
+            shared = code
+            if rng.random() < edit_rate:
+                shared = f"{code}\n// edited by student {student}\n"
+            uploads.append(
+                (language, shared, f"Class {class_number} - {student}", expiry)
+            )
+    for i in range(solo):
+        language, code = rng.choice(samples)
+        code = f"{code}\n// scratch {i}: {rng.getrandbits(64):x}\n"
+        uploads.append((language, code, f"Scratch {i}", rng.choice(EXPIRY_MINUTES)))
+    rng.shuffle(uploads)
+    return uploads
+
+
+def store_legacy(uploads):
+    # The layout before blobs: the whole payload under every link.
+    keys = []
+    pipeline = app.redis_client.pipeline(transaction=False)
+    for language, code, title, minutes in uploads:
+        key = f"file:{language}-bench-{uuid.uuid4()}:data"
+        payload = {
+            "title": title,
+            "code": code,
+            "language": language,
+            "expiry_time": EXPIRES.strftime(app.EXPIRY_FORMAT),
+        }
+        pipeline.set(key, json.dumps(payload), ex=minutes * 60)
+        keys.append(key)
+    pipeline.execute()
+    return keys
+
+
+def store_blobs(uploads):
+    keys = set()
+    for language, code, title, minutes in uploads:
+        key = f"file:{language}-bench-{uuid.uuid4()}:data"
+        app.store_file(key, title, code, language, EXPIRES, minutes * 60)
+        digest, _ = app.blob_keys(language, code)
+        keys.update((key, f"blob:{digest}", f"blob:{digest}:links"))
+    return sorted(keys)
+
+
+def memory(keys):
+    pipeline = app.redis_client.pipeline(transaction=False)
+    for key in keys:
+        pipeline.memory_usage(key, samples=0)
+    return sum(size or 0 for size in pipeline.execute())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Compare Redis memory for a share trace with and without blobs."
+    )
+    parser.add_argument("--classes", type=int, default=40)
+    parser.add_argument("--students", type=int, default=30)
+    parser.add_argument("--edit-rate", type=float, default=0.15)
+    parser.add_argument("--solo", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args(argv)
+
+    uploads = trace(
+        load_samples(),
+        args.classes,
+        args.students,
+        args.edit_rate,
+        args.solo,
+        args.seed,
+    )
+    distinct = len({(language, code) for language, code, _, _ in uploads})
+    print(f"uploads: {len(uploads)}, distinct contents: {distinct}")
+
+    results = {}
+    for name, store in (("legacy", store_legacy), ("blobs", store_blobs)):
+        keys = store(uploads)
+        try:
+            results[name] = (len(keys), memory(keys))
+        finally:
+            for start in range(0, len(keys), 1000):
+                app.redis_client.delete(*keys[start : start + 1000])
+
+    for name, (count, size) in results.items():
+        print(f"{name:<8}{count:>8} keys{size / 1024:>12.1f} KiB")
+    legacy, blobs = results["legacy"][1], results["blobs"][1]
+    print(
+        f"saved {(legacy - blobs) / 1024:.1f} KiB ({(1 - blobs / legacy) * 100:.1f}%)"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import records
+from bench_dedup import load_samples
+
+DIGEST = "ab" * 32
+EXPIRY = "2030-01-01 00:00:00 UTC"
+TITLE = "Class 3 - sorting lab"
+
+
+def json_records(language, code):
+    # Link and blob as they were stored before the binary records.
+    link = json.dumps({"title": TITLE, "expiry_time": EXPIRY, "blob": DIGEST})
+    blob = json.dumps({"code": code, "language": language})
+    return link.encode("utf-8"), blob.encode("utf-8")
+
+
+def binary_records(code):
+    return records.encode_link(DIGEST, 1893456000, TITLE), records.encode_blob(code)
+
+
+def microseconds(statement, number=2000):
+    return min(timeit.repeat(statement, number=number, repeat=5)) / number * 1e6
+
+
+def main():
+    samples = load_samples()
+    # Small snippets fall under the compression threshold; the whole samples
+    # and a long file show what zlib does above it.
+    cases = [
+        (f"{language} snippet", language, code[:200]) for language, code in samples[:3]
+    ]
+    cases += [(language, language, code) for language, code in samples]
+    cases.append(("long file", "python", "\n".join(code for _, code in samples)))
+
+    print(
+        f"{'payload':<20}{'code B':>8}{'json B':>8}{'binary B':>10}{'saved':>7}"
+        f"{'enc us':>8}{'dec us':>8}{'json enc':>10}{'json dec':>10}"
+    )
+    for name, language, code in cases:
+        old_link, old_blob = json_records(language, code)
+        link, blob = binary_records(code)
+        old_size = len(old_link) + len(old_blob)
+        size = len(link) + len(blob)
+        encode = microseconds(lambda: binary_records(code))
+        decode = microseconds(
+            lambda: (records.decode_link(link), records.decode_blob(blob))
+        )
+        json_encode = microseconds(lambda: json_records(language, code))
+        json_decode = microseconds(
+            lambda: (records.decode_link(old_link), records.decode_blob(old_blob))
+        )
+        print(
+            f"{name:<20}{len(code.encode('utf-8')):>8}{old_size:>8}{size:>10}"
+            f"{(1 - size / old_size) * 100:>6.0f}%{encode:>8.1f}{decode:>8.1f}"
+            f"{json_encode:>10.1f}{json_decode:>10.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+# The app builds its connection pool at import time. Point it at a local,
+# plain-text Redis unless told otherwise.
+os.environ.setdefault("REDIS_HOST", "localhost")
+os.environ.setdefault("REDIS_PORT", "6379")
+os.environ.setdefault("REDIS_SSL", "false")
+
+import app
+
+PAYLOAD = json.dumps(
+    {
+        "title": "Benchmark",
+        "code": "print('hello')\n" * 40,
+        "language": "python",
+        "expiry_time": "2030-01-01 00:00:00 UTC",
+    }
+)
+
+
+def get_before(key):
+    # The old get_file: two round trips, not atomic.
+    return app.redis_client.get(key), app.redis_client.ttl(key)
+
+
+def get_after(key):
+    return app.read_file(key)
+
+
+def delete_before(key):
+    # The old delete_file: read the value only to learn whether it exists.
+    if app.redis_client.get(key):
+        app.redis_client.delete(key)
+
+
+def delete_after(key):
+    return app.remove_file(key)
+
+
+# name: (operation, whether each call consumes a key)
+scenarios = {
+    "get (GET, TTL)": (get_before, False),
+    "get (read script)": (get_after, False),
+    "delete (GET, DEL)": (delete_before, True),
+    "delete (script)": (delete_after, True),
+}
+
+
+def seed(count):
+    keys = [f"file:bench-{uuid.uuid4()}:data" for _ in range(count)]
+    pipeline = app.redis_client.pipeline(transaction=False)
+    for key in keys:
+        pipeline.set(key, PAYLOAD, ex=600)
+    pipeline.execute()
+    return keys
+
+
+def run(operation, keys, consumes, threads, duration):
+    latencies = []
+    lock = threading.Lock()
+    position = [0]
+    deadline = time.monotonic() + duration
+
+    def worker():
+        local = []
+        while time.monotonic() < deadline:
+            with lock:
+                if consumes and position[0] >= len(keys):
+                    break
+                key = keys[position[0] % len(keys)]
+                position[0] += 1
+            started = time.perf_counter()
+            operation(key)
+            local.append(time.perf_counter() - started)
+        with lock:
+            latencies.extend(local)
+
+    started = time.monotonic()
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return latencies, time.monotonic() - started
+
+
+def percentile(values, quantile):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(quantile * len(ordered)))]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Compare the TempFile Redis paths against a local Redis."
+    )
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=5.0, help="seconds")
+    parser.add_argument(
+        "--keys", type=int, default=50000, help="keys seeded per scenario"
+    )
+    args = parser.parse_args(argv)
+
+    app.redis_client.ping()
+    print(f"{'scenario':<24}{'ops':>9}{'ops/s':>11}{'p50 ms':>9}{'p99 ms':>9}")
+    for name, (operation, consumes) in scenarios.items():
+        keys = seed(args.keys if consumes else 1000)
+        try:
+            latencies, wall_time = run(
+                operation, keys, consumes, args.threads, args.duration
+            )
+        finally:
+            app.redis_client.delete(*keys)
+        print(
+            f"{name:<24}{len(latencies):>9}{len(latencies) / wall_time:>11.0f}"
+            f"{percentile(latencies, 0.5) * 1000:>9.3f}"
+            f"{percentile(latencies, 0.99) * 1000:>9.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+class CachedLink:
+    __slots__ = ("body", "etag", "expires_at", "cached_until")
+
+    def __init__(self, body, etag, expires_at, cached_until):
+        self.body = body
+        self.etag = etag
+        # Wall-clock time the Redis key expires, for Cache-Control.
+        self.expires_at = expires_at
+        # Monotonic time this process stops serving the entry.
+        self.cached_until = cached_until
+
+    def max_age(self):
+        return max(0, int(self.expires_at - time.time()))
+
+
+class LinkCache:
+    # Serialized get_file responses for recently viewed links, so a link
+    # posted in a chat is read from Redis once rather than once per view.
+    # Entries never outlive the Redis key and are dropped on delete. A delete
+    # only reaches the process that served it, so entries are also kept for
+    # at most `ttl` seconds, which bounds how long other workers can still
+    # serve a deleted link.
+    def __init__(self, max_entries=1000, ttl=30.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0 and self.ttl > 0
+
+    def get(self, key):
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry.cached_until <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key, body, ttl_ms):
+        # Returns the entry for the response even when caching is disabled.
+        seconds = ttl_ms / 1000
+        entry = CachedLink(
+            body,
+            hashlib.sha256(body).hexdigest()[:32],
+            time.time() + seconds,
+            time.monotonic() + min(seconds, self.ttl),
+        )
+        if self.enabled:
+            with self._lock:
+                self._entries[key] = entry
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return entry
+
+    def discard(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+link_cache = LinkCache(
+    max_entries=int(os.getenv("TEMPFILE_LINK_CACHE_MAX_ENTRIES", "1000")),
+    ttl=float(os.getenv("TEMPFILE_LINK_CACHE_TTL", "30")),
+)
@@ -0,0 +1,75 @@
+import json
+import os
+import struct
+import zlib
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Binary records for share links and blobs. Every record starts with a
+# format version byte; JSON values written before these records start with
+# "{" and are still decoded. The language lives in the link key and the
+# expiry time is a 4-byte timestamp, so neither is stored as text.
+#
+# link v1: version | sha256 of the blob (32 bytes) | expiry, unix seconds
+#          (uint32, big endian) | title (UTF-8)
+# blob v1: version | codec | code (UTF-8, zlib-compressed when codec is 1)
+VERSION = 1
+RAW = 0
+ZLIB = 1
+
+LINK_HEADER = struct.Struct(">B32sI")
+BLOB_HEADER = struct.Struct(">BB")
+JSON_START = b"{"
+
+COMPRESS_MIN_BYTES = int(os.getenv("TEMPFILE_COMPRESS_MIN_BYTES", "256"))
+COMPRESS_LEVEL = int(os.getenv("TEMPFILE_COMPRESS_LEVEL", "6"))
+
+
+class RecordError(ValueError):
+    pass
+
+
+def encode_link(digest, expires_at, title):
+    return LINK_HEADER.pack(VERSION, bytes.fromhex(digest), expires_at) + title.encode(
+        "utf-8"
+    )
+
+
+def decode_link(value):
+    # Returns (blob digest or None, expiry timestamp or formatted string,
+    # title, JSON payload of a link that predates blobs or None).
+    if value.startswith(JSON_START):
+        link = json.loads(value)
+        legacy = None if "blob" in link else link
+        return link.get("blob"), link["expiry_time"], link["title"], legacy
+    if value[0] != VERSION:
+        raise RecordError(f"Unsupported link record version {value[0]}.")
+    _, digest, expires_at = LINK_HEADER.unpack_from(value)
+    title = value[LINK_HEADER.size :].decode("utf-8")
+    return digest.hex(), expires_at, title, None
+
+
+def encode_blob(code):
+    data = code.encode("utf-8")
+    codec = RAW
+    if len(data) >= COMPRESS_MIN_BYTES:
+        compressed = zlib.compress(data, COMPRESS_LEVEL)
+        if len(compressed) < len(data):
+            data, codec = compressed, ZLIB
+    return BLOB_HEADER.pack(VERSION, codec) + data
+
+
+def decode_blob(value):
+    if value.startswith(JSON_START):
+        return json.loads(value)["code"]
+    version, codec = BLOB_HEADER.unpack_from(value)
+    if version != VERSION:
+        raise RecordError(f"Unsupported blob record version {version}.")
+    data = value[BLOB_HEADER.size :]
+    if codec == ZLIB:
+        data = zlib.decompress(data)
+    elif codec != RAW:
+        raise RecordError(f"Unknown blob codec {codec}.")
+    return data.decode("utf-8")
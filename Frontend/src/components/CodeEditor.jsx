@@ -1,6 +1,7 @@
 import React, { useState, useEffect, useRef } from "react";
 import MonacoEditor from "@monaco-editor/react";
 import ShareLinkModal from "../utils/ShareLinkModal.js";
+import streamEvents from "../utils/streamEvents.js";
 import {
   SESSION_STORAGE_SHARELINKS_KEY,
   LOCAL_STORAGE_TOKEN_KEY,
@@ -242,22 +243,20 @@ const CodeEditor = ({
         setIsEditorReadOnly(true);
         setisGenerateBtnPressed(true);
 
-        const response = await fetch(`${GENAI_API_URL}/generate_code`, {
-          method: "POST",
-          headers: {
-            "Content-Type": "application/json",
-          },
-          body: JSON.stringify({
+        let streamedCode = "";
+        setCode("");
+
+        const result = await streamEvents(
+          `${GENAI_API_URL}/generate_code/stream`,
+          {
             problem_description: prompt,
             language: language,
-          }),
-        });
-
-        if (!response.ok) {
-          throw new Error("Failed to generate code.");
-        }
-
-        const result = await response.json();
+          },
+          (event, data) => {
+            streamedCode += data.text;
+            setCode(streamedCode);
+          }
+        );
         setCode(result.code || "No code generated.");
 
         await getGenerateCodeCount();
@@ -286,22 +285,19 @@ const CodeEditor = ({
       setIsEditorReadOnly(true);
       setisRefactorBtnPressed(true);
 
-      const response = await fetch(`${GENAI_API_URL}/refactor_code`, {
-        method: "POST",
-        headers: {
-          "Content-Type": "application/json",
-        },
-        body: JSON.stringify({
+      let streamedCode = "";
+
+      const result = await streamEvents(
+        `${GENAI_API_URL}/refactor_code/stream`,
+        {
           language,
           code,
-        }),
-      });
-
-      if (!response.ok) {
-        throw new Error("Failed to refactor code.");
-      }
-
-      const result = await response.json();
+        },
+        (event, data) => {
+          streamedCode += data.text;
+          setCode(streamedCode);
+        }
+      );
       setCode(result.code || "No refactored code returned.");
 
       await getRefactorCodeCount();
@@ -2,6 +2,7 @@ import React, { useState, useEffect, useCallback, useRef } from "react";
 import { debounce } from "lodash";
 import MonacoEditor from "@monaco-editor/react";
 import ShareLinkModal from "../utils/ShareLinkModal.js";
+import streamEvents from "../utils/streamEvents.js";
 import {
   SESSION_STORAGE_SHARELINKS_KEY,
   LOCAL_STORAGE_TOKEN_KEY,
@@ -361,11 +362,12 @@ const Editor = ({ isDarkMode, value, title, shareIdData }) => {
       return;
     }
 
-    const { value: prompt } = await Swal.fire({
+    const { value: request } = await Swal.fire({
       title: "Generate Code",
       input: "textarea",
       inputLabel: "What code do you want?",
       inputPlaceholder: "e.g., simple calculator",
+      html: `<label class="text-sm"><input type="checkbox" id="parallelInput" class="mr-2" />Generate CSS and JS at the same time (faster, may match less closely)</label>`,
       showCancelButton: true,
       allowOutsideClick: false,
       footer: `<p class="text-center text-sm text-red-500 dark:text-red-300">Refactor the code if the <span class="font-bold">generated code</span> is not functioning properly.</p>`,
@@ -374,91 +376,59 @@ const Editor = ({ isDarkMode, value, title, shareIdData }) => {
           return "This field is mandatory! Please enter a prompt.";
         }
       },
+      preConfirm: (value) => ({
+        prompt: value,
+        parallel: Swal.getPopup().querySelector("#parallelInput").checked,
+      }),
     });
 
-    if (prompt) {
+    if (request) {
       setLoadingAction("generate");
       try {
         generatesetBtnTxt("Generating HTML...");
         setisGenerateBtnPressed(true);
         setIsEditorReadOnly(true);
 
-        const responseHtml = await fetch(
-          `${GENAI_API_URL}/htmlcssjsgenerate-code`,
-          {
-            method: "POST",
-            headers: { "Content-Type": "application/json" },
-            body: JSON.stringify({
-              prompt,
-              type: "html",
-            }),
-          }
-        );
-
-        if (!responseHtml.ok) {
-          throw new Error("Failed to generate HTML.");
-        }
-
-        const resultHtml = await responseHtml.json();
-        setCode({
-          html: resultHtml.html || "",
-          css: "",
-          javascript: "",
-        });
+        // Stages still to come; in parallel mode CSS and JS are both under
+        // way once the HTML is done, otherwise they follow one another.
+        const pendingStages = ["html", "css", "js"];
 
-        generatesetBtnTxt("Generating CSS...");
-
-        const responseCss = await fetch(
+        await streamEvents(
           `${GENAI_API_URL}/htmlcssjsgenerate-code`,
           {
-            method: "POST",
-            headers: { "Content-Type": "application/json" },
-            body: JSON.stringify({
-              prompt,
-              htmlContent: resultHtml.html,
-              type: "css",
-            }),
-          }
-        );
-
-        if (!responseCss.ok) {
-          throw new Error("Failed to generate CSS.");
-        }
-
-        const resultCss = await responseCss.json();
-        setCode((prevCode) => ({
-          html: prevCode.html,
-          css: resultCss.css || "",
-          javascript: prevCode.javascript,
-        }));
-
-        generatesetBtnTxt("Generating JS...");
-
-        const responseJs = await fetch(
-          `${GENAI_API_URL}/htmlcssjsgenerate-code`,
-          {
-            method: "POST",
-            headers: { "Content-Type": "application/json" },
-            body: JSON.stringify({
-              prompt,
-              htmlContent: resultHtml.html,
-              cssContent: resultCss.css,
-              type: "js",
-            }),
+            prompt: request.prompt,
+            type: "all",
+            // Sequential unless asked for: CSS and JS are then generated
+            // from the finished HTML and CSS.
+            ...(request.parallel && { parallel: true }),
+          },
+          (stage, data) => {
+            setCode((prevCode) =>
+              stage === "html"
+                ? { html: data.html || "", css: "", javascript: "" }
+                : {
+                    html: prevCode.html,
+                    css: stage === "css" ? data.css || "" : prevCode.css,
+                    javascript:
+                      stage === "js" ? data.js || "" : prevCode.javascript,
+                  }
+            );
+            if (pendingStages.includes(stage)) {
+              pendingStages.splice(pendingStages.indexOf(stage), 1);
+            }
+            const nextStages = request.parallel
+              ? pendingStages
+              : pendingStages.slice(0, 1);
+            if (nextStages.length) {
+              generatesetBtnTxt(
+                `Generating ${nextStages
+                  .map((name) => name.toUpperCase())
+                  .join(" & ")}...`
+              );
+            }
           }
         );
 
-        if (!responseJs.ok) {
-          throw new Error("Failed to generate JS.");
-        }
-
-        const resultJs = await responseJs.json();
-        setCode((prevCode) => ({
-          html: prevCode.html,
-          css: prevCode.css,
-          javascript: resultJs.js || "",
-        }));
-
         await getGenerateCodeCount();
       } catch (error) {
         Swal.fire(
@@ -0,0 +1,58 @@
+const parseEvent = (block) => {
+  let event = "message";
+  const data = [];
+
+  for (const line of block.split("\n")) {
+    if (line.startsWith("event:")) {
+      event = line.slice(6).trim();
+    } else if (line.startsWith("data:")) {
+      data.push(line.slice(5).trim());
+    }
+  }
+
+  return { event, data: data.length ? JSON.parse(data.join("\n")) : null };
+};
+
+const streamEvents = async (url, body, onEvent) => {
+  const response = await fetch(url, {
+    method: "POST",
+    headers: {
+      "Content-Type": "application/json",
+    },
+    body: JSON.stringify(body),
+  });
+
+  if (!response.ok || !response.body) {
+    throw new Error("Request failed.");
+  }
+
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = "";
+
+  while (true) {
+    const { value, done } = await reader.read();
+    if (done) break;
+
+    buffer += decoder.decode(value, { stream: true });
+
+    let boundary = buffer.indexOf("\n\n");
+    while (boundary !== -1) {
+      const { event, data } = parseEvent(buffer.slice(0, boundary));
+      buffer = buffer.slice(boundary + 2);
+
+      if (event === "done") {
+        return data;
+      } else if (event === "error") {
+        throw new Error(data.error);
+      }
+      onEvent(event, data);
+
+      boundary = buffer.indexOf("\n\n");
+    }
+  }
+
+  throw new Error("Stream ended unexpectedly.");
+};
+
+export default streamEvents;